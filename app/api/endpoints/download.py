@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from pathlib import Path
 from app.core.config import settings
 from app.utils.logger import logger
+from app.utils.temp_store import temp_store
 
 router = APIRouter()
 
@@ -42,6 +43,8 @@ async def download_by_path(request: FilePathRequest):
     # 4. 返回文件响应
     # FileResponse 可以直接接受 Path 对象
     logger.info(f"正在提供文件下载: {abs_path}")
+    # 记录访问，最近下载过的任务最后被配额淘汰
+    temp_store.touch(abs_path)
     return FileResponse(
         path=abs_path,
         filename=abs_path.name,  # 使用 .name 属性获取文件名
@@ -1,16 +1,33 @@
+import asyncio
+import aiohttp
+import hashlib
+import os
+import numpy as np
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.ipc
 import time
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime, date
+from typing import Dict, List, Optional
+from datetime import datetime
 from pathlib import Path  # 导入 Path
 from app.utils.logger import logger
 from app.core.config import settings
+from app.utils.http_cache import http_cache
+from app.utils.trigram_index import TrigramIndex
+from app.utils.aho_corasick import AhoCorasick
 
 router = APIRouter()
 
+# Arrow 快照中保留的列（CSV 中不存在的列忽略），以及用于不区分大小写匹配的规范化名称列
+SNAPSHOT_COLUMNS = ["GIIN", "FINm", "CountryNm"]
+NORMALIZED_NAME_COLUMN = "FINm_lower"
+# 除 "." 以外的正则元字符：名称中包含这些字符时无法从中提取必然出现的字面量，回退到全表扫描
+REGEX_METACHARACTERS = set("^$*+?{}[]\\|()")
+# 多模式匹配扫描整列时每次转换的行数
+BATCH_SCAN_CHUNK_ROWS = 65536
+
 
 class EntityInput(BaseModel):
     """输入实体模型"""
@@ -47,133 +64,248 @@ class GIINService:
         self.csv_url = "https://apps.irs.gov/app/fatcaFfiList/data/FFIListFull.csv"
         # 【优化 1】使用 pathlib 构建路径，并添加类型提示
         self.csv_path: Path = settings.TEMP_DIR / "giin" / "FFIListFull.csv"
-        self.giin_data: Optional[pd.DataFrame] = None
-
-    def check_file_exists_and_current(self) -> bool:
-        """
-        检查CSV文件是否存在且是当天创建的
-        返回: True表示文件存在且是当天的，False表示需要重新下载
-        """
-        try:
-            # 【优化 2】使用 Path.exists() 方法
-            if not self.csv_path.exists():
-                logger.info(f"CSV文件不存在: {self.csv_path}")
-                return False
-
-            # 【优化 3】使用 Path.stat().st_mtime 获取修改时间
-            file_mtime = self.csv_path.stat().st_mtime
-            file_date = datetime.fromtimestamp(file_mtime).date()
-            today = date.today()
-
-            logger.info(f"CSV文件存在，文件日期: {file_date}, 今天: {today}")
-
-            if file_date == today:
-                logger.info(f"CSV文件是今天的，无需重新下载")
-                return True
-            else:
-                logger.info(f"CSV文件不是今天的（文件日期: {file_date}），需要重新下载")
-                return False
-
-        except Exception as e:
-            logger.error(f"检查文件状态失败: {e}")
-            return False
-
-    async def download_csv_file(self) -> tuple[bool, float]:
+        # CSV 解析后的列式快照（Arrow IPC，不压缩），之后通过内存映射加载，多个工作进程共享同一份页缓存
+        self.snapshot_path: Path = self.csv_path.with_suffix(".arrow")
+        # 规范化名称的三元组倒排索引，同样保存为 Arrow IPC 文件并内存映射加载
+        self.index_path: Path = self.csv_path.with_suffix(".trigram.arrow")
+        # 当前加载的数据快照：{"data", "index", "mtime_ns", "size", "digest", "loaded_at"}。
+        # 快照加载完成后不再修改，文件变化时在线程中构建新快照，再整体替换引用，
+        # 并发请求只会看到旧快照或新快照，不会读到加载到一半的数据
+        self._snapshot: Optional[dict] = None
+        self._load_lock = asyncio.Lock()
+        self._stats = {"loads": 0, "csv_parses": 0, "skipped_same_digest": 0, "load_errors": 0,
+                       "last_load_seconds": 0.0}
+
+    @property
+    def giin_data(self) -> Optional[pd.DataFrame]:
+        return self._snapshot["data"] if self._snapshot else None
+
+    async def download_csv_file(self) -> tuple[bool, float, str]:
         """
-        从指定URL下载CSV文件并保存到本地
-        返回: (是否成功, 下载耗时)
+        通过条件请求获取CSV文件：本地副本未变化时服务端返回304，无需重新下载
+        返回: (是否成功, 耗时, 文件状态 downloaded/cached)
         """
         start_time = time.time()
 
         try:
-            # 【优化 4】使用 Path.parent.mkdir() 创建父目录
-            self.csv_path.parent.mkdir(parents=True, exist_ok=True)
-
-            logger.info(f"开始下载CSV文件从: {self.csv_url}")
-            logger.info(f"注意：CSV文件较大，预计需要等待1-3分钟...")
-
-            response = requests.get(self.csv_url, timeout=300, stream=True)
-            response.raise_for_status()
-
-            total_size = response.headers.get('content-length')
-            if total_size:
-                total_size = int(total_size)
-                logger.info(f"文件大小: {total_size / (1024 * 1024):.2f} MB")
-
-            downloaded_size = 0
-            chunk_size = 8192
-
-            # 【优化 5】使用 Path.open() 方法打开文件
-            with self.csv_path.open('wb') as f:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-                        if downloaded_size % (10 * 1024 * 1024) == 0:
-                            progress_info = f"已下载: {downloaded_size / (1024 * 1024):.2f} MB"
-                            if total_size:
-                                progress = (downloaded_size / total_size) * 100
-                                progress_info = f"下载进度: {progress:.1f}% ({progress_info})"
-                            logger.info(progress_info)
-
+            logger.info(f"检查GIIN数据文件是否有更新: {self.csv_url}")
+            result = await http_cache.fetch(self.csv_url, self.csv_path, timeout=300,
+                                            revalidate_after=settings.GIIN_REVALIDATE_SECONDS)
             download_time = time.time() - start_time
-            logger.info(f"CSV文件下载完成，耗时: {download_time:.2f}秒")
-            logger.info(f"文件已保存到: {self.csv_path}")
+            file_status = "downloaded" if result["status"] == "downloaded" else "cached"
+            logger.info(f"GIIN数据文件状态: {result['status']}，耗时: {download_time:.2f}秒")
+            return True, download_time, file_status
 
-            return True, download_time
-
-        except requests.Timeout as e:
+        except asyncio.TimeoutError as e:
             download_time = time.time() - start_time
             logger.error(f"下载CSV文件超时: {e}，耗时: {download_time:.2f}秒")
-            return False, download_time
-        except requests.RequestException as e:
+            return False, download_time, "downloaded"
+        except aiohttp.ClientError as e:
             download_time = time.time() - start_time
             logger.error(f"下载CSV文件失败: {e}，耗时: {download_time:.2f}秒")
-            return False, download_time
+            return False, download_time, "downloaded"
         except Exception as e:
             download_time = time.time() - start_time
             logger.error(f"保存CSV文件失败: {e}，耗时: {download_time:.2f}秒")
-            return False, download_time
+            return False, download_time, "downloaded"
+
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _read_csv(self, path: Path) -> Optional[pd.DataFrame]:
+        """解析CSV文件，只保留需要查询的列，缺少必要的列时返回 None（在线程中调用）"""
+        logger.info(f"开始读取CSV文件...")
+
+        # pandas可以直接接受Path对象，无需修改
+        giin_data = pd.read_csv(path, encoding='utf-8', usecols=lambda column: column in SNAPSHOT_COLUMNS,
+                                dtype=str)
+        logger.info(f"成功读取CSV文件，共{len(giin_data)}条记录")
+
+        if 'FINm' not in giin_data.columns or 'GIIN' not in giin_data.columns:
+            logger.error(f"CSV文件中缺少必要的列: FINm 或 GIIN")
+            logger.info(f"可用列: {list(giin_data.columns)}")
+            return None
+
+        original_count = len(giin_data)
+        giin_data = giin_data.dropna(subset=['FINm', 'GIIN']).reset_index(drop=True)
+        cleaned_count = len(giin_data)
+
+        if original_count != cleaned_count:
+            logger.info(f"清理空值后，有效记录数: {cleaned_count} (原始: {original_count})")
+
+        giin_data[NORMALIZED_NAME_COLUMN] = giin_data['FINm'].str.lower()
+        return giin_data
+
+    def _write_arrow_snapshot(self, giin_data: pd.DataFrame, stat: os.stat_result, digest: str):
+        """把解析后的数据写成 Arrow IPC 文件，元数据中记录来源CSV的修改时间、大小和摘要"""
+        table = pa.Table.from_pandas(giin_data, preserve_index=False).replace_schema_metadata({
+            "source_mtime_ns": str(stat.st_mtime_ns),
+            "source_size": str(stat.st_size),
+            "source_digest": digest,
+        })
+        # 先写入临时文件再替换，其它进程不会映射到写了一半的文件
+        temp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".part")
+        with pa.OSFile(str(temp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, self.snapshot_path)
+        logger.info(f"GIIN数据快照已写入: {self.snapshot_path}")
+
+    def _open_arrow_snapshot(self) -> Optional[dict]:
+        """内存映射加载 Arrow 快照，返回与内存快照相同结构的字典；快照不存在或已损坏时返回 None"""
+        if not self.snapshot_path.exists():
+            return None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(str(self.snapshot_path))).read_all()
+            metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+            return {
+                # ArrowDtype 直接引用映射的内存，不会把字符串复制成 Python 对象
+                "data": table.to_pandas(types_mapper=pd.ArrowDtype),
+                "index": self._load_index(table.column(NORMALIZED_NAME_COLUMN), metadata["source_digest"]),
+                "mtime_ns": int(metadata["source_mtime_ns"]),
+                "size": int(metadata["source_size"]),
+                "digest": metadata["source_digest"],
+                "loaded_at": datetime.now(),
+            }
+        except (OSError, KeyError, ValueError, pa.ArrowException) as e:
+            logger.warning(f"GIIN数据快照无法读取，将重新解析CSV: {e}")
+            return None
+
+    def _load_index(self, names: pa.ChunkedArray, digest: str) -> Optional[TrigramIndex]:
+        """加载与数据快照对应的三元组索引，索引文件不存在或来自旧数据时重新构建；失败时返回 None（回退到全表扫描）"""
+        try:
+            if self.index_path.exists():
+                index, metadata = TrigramIndex.open(self.index_path)
+                if metadata.get("source_digest") == digest:
+                    return index
+            start_time = time.time()
+            index = TrigramIndex.build(names)
+            index.save(self.index_path, {"source_digest": digest})
+            logger.info(f"GIIN名称索引已构建: {len(index)}条记录，耗时: {time.time() - start_time:.2f}秒")
+            return index
+        except (OSError, ValueError, pa.ArrowException) as e:
+            logger.warning(f"GIIN名称索引不可用，将使用全表扫描: {e}")
+            return None
+
+    def _build_snapshot(self, stat: os.stat_result, digest: str) -> Optional[dict]:
+        """解析CSV、写入 Arrow 快照并通过内存映射重新加载（在线程中调用）"""
+        giin_data = self._read_csv(self.csv_path)
+        if giin_data is None:
+            return None
+        self._write_arrow_snapshot(giin_data, stat, digest)
+        return self._open_arrow_snapshot()
+
+    def _swap_snapshot(self, snapshot: dict, start_time: float, source: str):
+        self._snapshot = snapshot
+        self._stats["loads"] += 1
+        self._stats["last_load_seconds"] = round(time.time() - start_time, 3)
+        logger.info(f"GIIN数据已从{source}加载到内存，共{len(snapshot['data'])}条记录，"
+                    f"耗时: {self._stats['last_load_seconds']:.3f}秒")
+
+    async def load_csv_data(self) -> bool:
+        """
+        确保内存中的GIIN数据与CSV文件一致
 
-    def load_csv_data(self) -> bool:
-        """读取CSV文件数据"""
+        文件的修改时间和大小未变化时直接使用内存中的快照；变化时先比较内容摘要，
+        摘要相同（例如重新下载了相同内容）只更新记录的修改时间，不同才重新解析并替换快照。
+        进程启动后首次加载时，磁盘上的 Arrow 快照与CSV一致则直接内存映射加载，不解析CSV。
+        重新加载失败时继续使用旧快照。
+        """
         try:
             # 【优化 6】Path.exists() 再次使用
             if not self.csv_path.exists():
                 logger.error(f"CSV文件不存在: {self.csv_path}")
-                return False
+                return self._snapshot is not None
 
-            logger.info(f"开始读取CSV文件...")
-
-            # pandas可以直接接受Path对象，无需修改
-            self.giin_data = pd.read_csv(self.csv_path, encoding='utf-8', low_memory=False)
-            logger.info(f"成功读取CSV文件，共{len(self.giin_data)}条记录")
-
-            if 'FINm' not in self.giin_data.columns or 'GIIN' not in self.giin_data.columns:
-                logger.error(f"CSV文件中缺少必要的列: FINm 或 GIIN")
-                logger.info(f"可用列: {list(self.giin_data.columns)}")
-                return False
-
-            original_count = len(self.giin_data)
-            self.giin_data = self.giin_data.dropna(subset=['FINm', 'GIIN'])
-            cleaned_count = len(self.giin_data)
-
-            if original_count != cleaned_count:
-                logger.info(f"清理空值后，有效记录数: {cleaned_count} (原始: {original_count})")
+            stat = self.csv_path.stat()
+            snapshot = self._snapshot
+            if snapshot and snapshot["mtime_ns"] == stat.st_mtime_ns and snapshot["size"] == stat.st_size:
+                return True
 
-            return True
+            async with self._load_lock:
+                # 等待锁期间其它请求可能已经完成加载
+                stat = self.csv_path.stat()
+                snapshot = self._snapshot
+                if snapshot and snapshot["mtime_ns"] == stat.st_mtime_ns and snapshot["size"] == stat.st_size:
+                    return True
+
+                start_time = time.time()
+                arrow_snapshot = None
+                if snapshot is None:
+                    arrow_snapshot = await asyncio.to_thread(self._open_arrow_snapshot)
+                    if arrow_snapshot and arrow_snapshot["mtime_ns"] == stat.st_mtime_ns \
+                            and arrow_snapshot["size"] == stat.st_size:
+                        self._swap_snapshot(arrow_snapshot, start_time, "Arrow快照")
+                        return True
+
+                digest = await asyncio.to_thread(self._file_digest, self.csv_path)
+                if snapshot and snapshot["digest"] == digest:
+                    self._snapshot = {**snapshot, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+                    self._stats["skipped_same_digest"] += 1
+                    logger.info("GIIN数据文件内容未变化，继续使用内存中的数据")
+                    return True
+                if arrow_snapshot and arrow_snapshot["digest"] == digest:
+                    self._swap_snapshot({**arrow_snapshot, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size},
+                                        start_time, "Arrow快照")
+                    return True
+
+                new_snapshot = await asyncio.to_thread(self._build_snapshot, stat, digest)
+                if new_snapshot is None:
+                    self._stats["load_errors"] += 1
+                    return snapshot is not None
+                self._stats["csv_parses"] += 1
+                self._swap_snapshot(new_snapshot, start_time, "CSV")
+                return True
 
         except Exception as e:
+            self._stats["load_errors"] += 1
             logger.error(f"读取CSV文件失败: {e}")
-            return False
+            return self._snapshot is not None
+
+    def stats(self) -> dict:
+        """返回内存中GIIN数据的加载情况"""
+        snapshot = self._snapshot
+        return {
+            "rows": len(snapshot["data"]) if snapshot else 0,
+            "loaded_at": snapshot["loaded_at"].isoformat() if snapshot else None,
+            "digest": snapshot["digest"][:12] if snapshot else None,
+            "index_postings": len(snapshot["index"]) if snapshot and snapshot["index"] is not None else 0,
+            **self._stats,
+        }
+
+    @staticmethod
+    def _index_candidates(entity_name: str, index: Optional[TrigramIndex]):
+        """
+        通过三元组索引取得可能匹配的行号（升序），无法使用索引时返回 None
+
+        名称按正则匹配（不区分大小写），其中的 "." 可以匹配任意字符，
+        所以按 "." 切分后的每一段字面量都必然出现在匹配的名称中
+        """
+        if index is None or any(char in REGEX_METACHARACTERS for char in entity_name):
+            return None
+        return index.candidates(entity_name.lower().split("."))
+
+    def find_giin_by_entity_name(self, entity_name: str, snapshot: Optional[dict] = None) -> str:
+        """
+        根据entity_name在FINm字段中查找对应的GIIN值（snapshot 默认为当前快照）
 
-    def find_giin_by_entity_name(self, entity_name: str) -> str:
-        """根据entity_name在FINm字段中查找对应的GIIN值"""
-        if self.giin_data is None:
+        先用三元组索引缩小到候选行，再用原来的匹配条件复核候选行，结果与全表扫描一致
+        """
+        snapshot = snapshot or self._snapshot
+        if snapshot is None:
             return ""
         try:
-            matches = self.giin_data[
-                self.giin_data['FINm'].str.contains(entity_name, case=False, na=False)
+            giin_data = snapshot["data"]
+            candidates = self._index_candidates(entity_name, snapshot["index"])
+            if candidates is not None:
+                giin_data = giin_data.iloc[candidates]
+            matches = giin_data[
+                giin_data['FINm'].str.contains(entity_name, case=False, na=False)
             ]
             if not matches.empty:
                 giin_value = matches.iloc[0]['GIIN']
@@ -186,13 +318,75 @@ class GIINService:
             logger.error(f"查找GIIN失败: {e}")
             return ""
 
+    def find_giin_batch(self, entity_names: List[str], snapshot: Optional[dict] = None) -> Dict[str, str]:
+        """
+        一次扫描为多个实体名称查找GIIN（Aho-Corasick 多模式匹配）
+
+        只处理不含正则元字符（包括 "."）的非空名称，这些名称的正则匹配等价于不区分大小写的子串匹配。
+        用所有名称构建一个自动机，按行号顺序扫描名称列一遍，记录每个名称第一次匹配的行，与逐个查找的结果一致。
+        三元组索引可用时只扫描各名称候选行的并集，否则扫描整列，所有名称都找到后提前结束。
+
+        返回: {实体名称: GIIN值（未找到时为空字符串）}，不符合条件的名称不在结果中，由调用方逐个查找
+        """
+        snapshot = snapshot or self._snapshot
+        if snapshot is None:
+            return {}
+        literal_names = {name for name in entity_names
+                         if name and not any(char in REGEX_METACHARACTERS or char == "." for char in name)}
+        if not literal_names:
+            return {}
+
+        patterns = sorted({name.lower() for name in literal_names})
+        automaton = AhoCorasick(patterns)
+        names_column = pa.array(snapshot["data"][NORMALIZED_NAME_COLUMN].array)
+
+        rows = None
+        if snapshot["index"] is not None:
+            candidate_lists = [snapshot["index"].candidates([pattern]) for pattern in patterns]
+            if all(candidates is not None for candidates in candidate_lists):
+                rows = np.unique(np.concatenate(candidate_lists + [np.empty(0, dtype=np.int64)]))
+
+        def iter_rows():
+            if rows is not None:
+                yield from zip(rows.tolist(), names_column.take(rows).to_pylist())
+                return
+            # 分段转换为 Python 字符串，提前结束时不必转换整列
+            for offset in range(0, len(names_column), BATCH_SCAN_CHUNK_ROWS):
+                yield from enumerate(names_column.slice(offset, BATCH_SCAN_CHUNK_ROWS).to_pylist(), offset)
+
+        first_rows: Dict[int, int] = {}
+        for row, name in iter_rows():
+            for pattern_id in automaton.search(name):
+                first_rows.setdefault(pattern_id, row)
+            if len(first_rows) == len(patterns):
+                break
+
+        pattern_ids = {pattern: pattern_id for pattern_id, pattern in enumerate(patterns)}
+        giin_column = snapshot["data"]["GIIN"]
+        result = {}
+        for name in literal_names:
+            row = first_rows.get(pattern_ids[name.lower()])
+            result[name] = str(giin_column.iloc[row]) if row is not None else ""
+        logger.info(f"多模式匹配完成: {len(patterns)}个名称, 扫描{len(rows) if rows is not None else '全部'}行, "
+                    f"找到{len(first_rows)}个")
+        return result
+
     async def process_entities(self, entities: List[EntityInput]) -> tuple[List[EntityOutput], float]:
         """处理实体列表，为每个实体查找对应的GIIN值"""
         start_time = time.time()
         result = []
+        # 整个请求使用同一个快照，处理过程中数据被替换也不影响本次结果
+        snapshot = self._snapshot
         logger.info(f"开始处理{len(entities)}个实体...")
+        batch_values = {}
+        if snapshot is not None and len(entities) >= settings.GIIN_BATCH_MATCH_THRESHOLD:
+            batch_values = await asyncio.to_thread(
+                self.find_giin_batch, [entity.entity_name for entity in entities], snapshot)
         for i, entity in enumerate(entities, 1):
-            giin_value = self.find_giin_by_entity_name(entity.entity_name)
+            if entity.entity_name in batch_values:
+                giin_value = batch_values[entity.entity_name]
+            else:
+                giin_value = self.find_giin_by_entity_name(entity.entity_name, snapshot)
             processed_entity = EntityOutput(
                 entity_code=entity.entity_code,
                 entity_name=entity.entity_name,
@@ -219,22 +413,14 @@ async def search_giin(request: GIINSearchRequest, background_tasks: BackgroundTa
     try:
         logger.info(f"收到GIIN查询请求，实体数量: {len(request.entities)}")
         logger.info(f"步骤1: 检查GIIN数据文件状态...")
-        file_is_current = giin_service.check_file_exists_and_current()
-        download_time = 0.0
-        file_status = "cached"
-        if not file_is_current:
-            logger.info(f"需要下载最新的GIIN数据文件...")
-            download_success, download_time = await giin_service.download_csv_file()
-            file_status = "downloaded"
-            if not download_success:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"下载CSV文件失败，请稍后重试。下载耗时: {download_time:.2f}秒"
-                )
-        else:
-            logger.info(f"使用当天的缓存文件，跳过下载步骤")
+        download_success, download_time, file_status = await giin_service.download_csv_file()
+        if not download_success:
+            raise HTTPException(
+                status_code=500,
+                detail=f"下载CSV文件失败，请稍后重试。下载耗时: {download_time:.2f}秒"
+            )
         logger.info(f"步骤2: 加载GIIN数据...")
-        if not giin_service.load_csv_data():
+        if not await giin_service.load_csv_data():
             raise HTTPException(status_code=500, detail="读取CSV文件失败")
         logger.info(f"步骤3: 查找GIIN值...")
         result, processing_time = await giin_service.process_entities(request.entities)
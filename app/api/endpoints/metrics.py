@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from app.utils.http_client import http_client
+from app.utils.download_governor import download_governor
+from app.utils.cleaner import temp_janitor
+from app.utils.temp_store import temp_store
+from app.utils.artefacts import artefact_registry
+from app.utils.msal_token_cache import msal_token_cache
+from app.utils.sharepoint_cache import folder_id_cache, site_drive_cache
+from app.utils.graph_client import graph_client
+from app.api.endpoints.giin_search import giin_service
+
+router = APIRouter()
+
+
+@router.get("/metrics", tags=["metrics"])
+async def get_metrics():
+    """查看服务运行指标（连接池复用情况等）"""
+    return {
+        "http_client": http_client.stats(),
+        "download_governor": download_governor.stats(),
+        "temp_janitor": temp_janitor.stats(),
+        "temp_store": temp_store.stats(),
+        "artefacts": artefact_registry.stats(),
+        "msal_token_cache": msal_token_cache.stats(),
+        "sharepoint_site_cache": site_drive_cache.stats(),
+        "sharepoint_folder_cache": folder_id_cache.stats(),
+        "graph_client": graph_client.stats(),
+        "giin_dataset": giin_service.stats(),
+    }
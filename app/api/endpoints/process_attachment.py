@@ -1,13 +1,15 @@
 import uuid
 from pathlib import Path
-from typing import List, Optional
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field, HttpUrl
 from app.core.config import settings
-from app.utils.cleaner import cleanup_old_temp_files
+from app.utils.cleaner import temp_janitor
 from app.utils.downloader import download_file
+from app.utils.download_governor import parse_priority
 from app.utils.filer import (extract_attachments_from_pdf, remove_pdf_password, split_pdf)
 from app.utils.logger import logger
+from app.utils.temp_store import TempQuotaExceeded, temp_store
 from app.utils.zipextractor import extract_zip
 
 router = APIRouter()
@@ -21,11 +23,14 @@ class ProcessRequest(BaseModel):
     attachment_name: Optional[str] = None
     unzip: Optional[bool] = False
     unzip_passwd: Optional[str] = None
+    unzip_depth: Optional[int] = Field(None, ge=0, description="嵌套压缩包最多展开层数，默认使用服务配置")
     pdf_passwd: Optional[List[str]] = None
     split: Optional[List[int]] = None
     split_each_page: Optional[bool] = False
     with_attachments: Optional[bool] = False
     with_passwd: Optional[List[str]] = None
+    priority: Optional[Literal["high", "normal", "low"]] = Field(
+        "normal", description="下载排队优先级，日结现金等时效性任务可设为 high，月结单归档可设为 low")
 
 
 class FileInfo(BaseModel):
@@ -33,6 +38,7 @@ class FileInfo(BaseModel):
     name: str
     path: str  # 注意：这里存储的是路径字符串，Path对象会被自动转换
     size: int
+    lineage: Optional[List[str]] = None  # 解压文件的压缩包来源链，例如 ["outer.zip", "entity_a.zip"]
 
 
 class ProcessedResponse(BaseModel):
@@ -51,7 +57,7 @@ class ProcessedResponse(BaseModel):
 
 # --- API路由 ---
 @router.post("/process_attachment", response_model=ProcessedResponse)
-async def process_attachment(request: ProcessRequest, background_tasks: BackgroundTasks):
+async def process_attachment(request: ProcessRequest):
     """
     下载文件，并根据设置条件执行任务
     1. 下载文件
@@ -62,18 +68,34 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
     根据实际执行的任务返回相应结果，final_files 包含最终处理结果
     """
 
-    # 1. 添加后台清理任务
-    background_tasks.add_task(cleanup_old_temp_files)
-    logger.debug("已添加后台清理任务")
-
-    # 2. 主要业务逻辑
     logger.info(f"收到附件处理请求: task_id={request.task_id}, attachment_id={request.attachment_id}")
 
     # 【优化 1】使用 pathlib 创建任务目录
     task_dir: Path = settings.TEMP_DIR / request.task_id
-    task_dir.mkdir(parents=True, exist_ok=True)
-    logger.info(f"任务目录已准备就绪: {task_dir}")
+    try:
+        # 处理期间任务目录计入进行中配额，完成后才可能被淘汰
+        async with temp_store.track(task_dir) as request_key:
+            task_dir.mkdir(parents=True, exist_ok=True)
+            # 登记任务目录，过期后由后台清理任务删除
+            await temp_janitor.register(task_dir)
+            logger.info(f"任务目录已准备就绪: {task_dir}")
+            return await _process_task(request, task_dir, request_key)
+    except TempQuotaExceeded as e:
+        logger.warning(f"拒绝附件处理请求: {e}")
+        raise HTTPException(status_code=507, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _pdf_bytes(files: List[dict]) -> int:
+    """待处理文件中PDF的总字节数，用于估算中间目录的大小"""
+    return sum(f["filesize"] for f in files if Path(f["filepath"]).suffix.lower() == '.pdf')
+
 
+async def _process_task(request: ProcessRequest, task_dir: Path, request_key: str) -> ProcessedResponse:
+    """
+    在任务目录中按请求参数依次执行下载、解压、解密、提取附件和分割
+
+    中间目录通过 temp_store.stage_dir 取得，可能位于本次请求（request_key）的热存储目录中
+    """
     result_files = {
         "original_files": [], "unzip_files": [], "unlocked_files": [],
         "attachment_files": [], "split_files": []
@@ -85,7 +107,8 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
 
     # 【优化 2】使用 pathlib 构建文件路径
     original_filepath: Path = task_dir / original_filename
-    download_result = await download_file(str(request.download_url), original_filepath)
+    download_result = await download_file(str(request.download_url), original_filepath,
+                                          parse_priority(request.priority))
 
     if not download_result["success"]:
         logger.error(f"文件下载失败: {download_result['error']}")
@@ -93,6 +116,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
                                  error=download_result["error"])
 
     logger.info(f"文件下载成功: {original_filepath}, 大小: {download_result['size']} 字节")
+    temp_store.record(task_dir, download_result["size"])
     original_filesize = download_result["size"]
     original_file_id = str(uuid.uuid4())
     logger.info(f"为原始文件生成 file_id: {original_file_id}")
@@ -112,7 +136,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
         extract_dir.mkdir(exist_ok=True)
         logger.info(f"创建解压目录: {extract_dir}")
 
-        extract_result = extract_zip(original_filepath, extract_dir, request.unzip_passwd)
+        extract_result = extract_zip(original_filepath, extract_dir, request.unzip_passwd, request.unzip_depth)
         if not extract_result["success"]:
             logger.error(extract_result["error"])
             return ProcessedResponse(task_id=request.task_id, attachment_id=request.attachment_id, success=False,
@@ -126,7 +150,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
             file_id = str(uuid.uuid4())
             result_files["unzip_files"].append(FileInfo(
                 name=file_info["unzip_filename"], path=str(absolute_path), size=file_info["unzip_filesize"],
-                file_id=file_id
+                file_id=file_id, lineage=file_info["unzip_lineage"]
             ))
             process_files.append({
                 "filename": file_info["unzip_filename"], "filepath": absolute_path,
@@ -138,8 +162,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
     if request.pdf_passwd:
         logger.info(f"开始处理PDF解密...")
         unlocked_files = []
-        unlocked_dir: Path = task_dir / 'unlocked'
-        unlocked_dir.mkdir(exist_ok=True)
+        unlocked_dir: Path = temp_store.stage_dir(task_dir, request_key, 'unlocked', _pdf_bytes(process_files))
 
         for file_info in process_files:
             input_path = Path(file_info["filepath"])
@@ -167,8 +190,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
     # 4. 处理文档中的附件
     if request.with_attachments:
         logger.info(f"开始提取PDF附件...")
-        attachment_dir: Path = task_dir / 'attachments'
-        attachment_dir.mkdir(exist_ok=True)
+        attachment_dir: Path = temp_store.stage_dir(task_dir, request_key, 'attachments', _pdf_bytes(process_files))
         logger.info(f"创建附件提取目录: {attachment_dir}")
 
         extracted_attachment_files = []
@@ -205,8 +227,7 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
     if request.split or request.split_each_page:
         logger.info("开始处理PDF分割")
         split_files_list = []
-        split_dir: Path = task_dir / 'split'
-        split_dir.mkdir(exist_ok=True)
+        split_dir: Path = temp_store.stage_dir(task_dir, request_key, 'split', _pdf_bytes(process_files))
 
         for file_info in process_files:
             input_path = Path(file_info["filepath"])
@@ -251,6 +272,16 @@ async def process_attachment(request: ProcessRequest, background_tasks: Backgrou
                    in process_files]
     logger.info(f"最终可用于AI解析的文件共 {len(final_files)} 个")
 
+    # 请求结束时热存储目录会被删除：响应中返回的文件都要移入持久目录，其余中间文件随热存储目录一起删除
+    response_files = [upload_files, final_files, *result_files.values()]
+    promoted = await temp_store.promote(task_dir, request_key,
+                                        [file_info.path for files in response_files for file_info in files])
+    if promoted:
+        logger.info(f"已将 {len(promoted)} 个文件从热存储移入任务目录")
+        for files in response_files:
+            for file_info in files:
+                file_info.path = promoted.get(file_info.path, file_info.path)
+
     # 返回处理结果
     return ProcessedResponse(
         task_id=request.task_id, attachment_id=request.attachment_id, success=True,
@@ -1,10 +1,12 @@
 import os
+import asyncio
+import aiohttp
 import pandas as pd
-import requests
 from typing import List, Optional, Any, Union
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
 from app.utils.logger import logger
+from app.utils.http_cache import http_cache
 
 # ==============================================================================
 # FastAPI 接口定义 (支持本地路径和URL)
@@ -108,14 +110,14 @@ async def process_citi_daily_balance(request: DailyBalanceProcessRequest):
             # --- 处理URL ---
             logger.info(f"检测到输入为URL，正在从 {source} 获取内容...")
             try:
-                response = requests.get(source, timeout=60)
-                response.raise_for_status()
+                # 条件请求：文件未变化时服务端返回304，直接使用本地缓存副本
+                fetched = await http_cache.fetch(source, timeout=60)
 
                 # 获取原始字节并用指定编码手动解码
-                content = response.content.decode(encoding)
-                logger.info(f"已成功从URL下载并以 '{encoding}' 解码内容。")
+                content = (await asyncio.to_thread(fetched["path"].read_bytes)).decode(encoding)
+                logger.info(f"已成功从URL获取文件({fetched['status']})并以 '{encoding}' 解码内容。")
 
-            except requests.exceptions.RequestException as e:
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 logger.error(f"从URL获取文件失败: {e}", exc_info=True)
                 return ProcessResponse(
                     status="error",
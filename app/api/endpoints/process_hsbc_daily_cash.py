@@ -1,5 +1,6 @@
 import json
 import os
+import uuid
 from typing import List
 from datetime import date, datetime
 from fastapi import FastAPI, HTTPException,APIRouter
@@ -8,7 +9,7 @@ from rpy2.robjects import r
 from app.core.config import settings
 from app.utils.logger import logger
 import pandas as pd
-from app.utils.cleaner import cleanup_feather_files
+from app.utils.artefacts import artefact_registry
 
 # 定义API应用
 router = APIRouter()
@@ -61,29 +62,21 @@ async def process_hsbc_daily_cash(request: ProcessRequest):
     if not os.path.exists(request.file_path):
         raise HTTPException(status_code=404, detail=f"文件不存在: {request.file_path}")
 
+    # 为本次请求分配feather输出路径，R脚本直接写入该路径
+    owner = f"{request.email_id}:{uuid.uuid4().hex}"
+    feather_path = artefact_registry.allocate("hsbc_daily_cash_", owner)
+
     try:
         # 调用R函数处理数据并保存为feather文件
-        r['process_hsbc_data_main'](request.file_path, CONN_PATH, QUERY_PATH, BANK_NAME)
-
-        # 构建feather文件名前缀
-        feather_pattern = "dataroom/hsbc_daily_cash_"
+        r['process_hsbc_data_main'](request.file_path, CONN_PATH, QUERY_PATH, BANK_NAME,
+                                    output_file=str(feather_path))
 
-        # 查找最新的feather文件
-        dataroom_files = [f for f in os.listdir("dataroom") if
-                          f.startswith("hsbc_daily_cash_") and f.endswith(".feather")]
-        if not dataroom_files:
+        if not feather_path.exists():
             raise HTTPException(status_code=404, detail="未找到处理后的数据文件")
 
-        # 获取最新的文件（按文件名排序，文件名包含时间戳）
-        latest_file = sorted(dataroom_files)[-1]
-        feather_path = os.path.join("dataroom", latest_file)
-
         # 使用pandas读取feather文件
         df = pd.read_feather(feather_path)
 
-        # 删除7天前的数据
-        cleanup_feather_files(days_to_keep=7)
-
         # 转换为API响应格式
         data_list = []
         for _, row in df.iterrows():
@@ -106,16 +99,12 @@ async def process_hsbc_daily_cash(request: ProcessRequest):
             count=len(data_list)
         )
 
-        # 删除处理完成后的feather文件
-        try:
-            if os.path.exists(feather_path):
-                os.remove(feather_path)
-                logger.info(f"已删除处理完成的feather文件: {feather_path}")
-        except Exception as e:
-            logger.warning(f"删除feather文件时出错: {str(e)}")
-
         return response
 
     except Exception as e:
         logger.error(f"处理HSBC数据时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理HSBC数据时出错: {str(e)}")
+
+    finally:
+        # 删除处理完成后的feather文件，失败时由后台清理任务处理
+        artefact_registry.release(owner)
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, HTTPException, Body
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 import urllib.parse
-import msal
-import requests
+import asyncio
 import os
+import time
+import aiohttp
+from datetime import datetime
 
 # 设置日志
 from app.utils.logger import logger
+from app.core.config import settings
+from app.utils.graph_client import THROTTLE_STATUS, backoff_delay, graph_client, retry_after_seconds
+from app.utils.msal_token_cache import TokenAcquisitionError, msal_token_cache
+from app.utils.quickxorhash import quickxorhash_file
+from app.utils.sharepoint_cache import folder_id_cache, site_drive_cache
 
 router = APIRouter()
 
@@ -25,9 +32,13 @@ class TenantInfo(BaseModel):
 
 class UploadFileInfo(BaseModel):
     site_name: str = Field(..., description="SharePoint站点名称")
-    folder_path: str = Field(..., description="上传文件的文件夹路径，例如：'香港分公司/Bank/eStatement'")
+    folder_path: str = Field(..., description="上传文件的最终目标文件夹路径（不存在时自动创建），例如：'香港分公司/Bank/eStatement'")
     file_name: Optional[str] = Field(None, description="文件名称（如果不提供，将使用上传文件的原始名称）")
     local_path: str = Field(..., description="文件在服务器上的本地路径")
+    conflict_behavior: Literal["replace", "rename", "fail"] = Field(
+        "replace", description="目标位置已存在同名文件时的处理方式：replace（覆盖）、rename（自动重命名）、fail（返回失败）")
+    skip_unchanged: bool = Field(
+        False, description="目标位置已存在内容相同（quickXorHash 一致）的文件时跳过上传，返回 status=unchanged")
 
 
 # 完整请求模型
@@ -43,6 +54,14 @@ class UploadSharepointFileResponse(BaseModel):
     message: str
     file_url: Optional[str] = None
     file_id: Optional[str] = None
+    status: Optional[str] = Field(None, description="uploaded（已上传）或 unchanged（远程文件内容相同，跳过上传）")
+    # 上传进度（分块上传会话时返回）
+    upload_mode: Optional[str] = Field(None, description="上传方式：simple（单次上传）或 session（分块上传会话）")
+    uploaded_bytes: Optional[int] = None
+    total_bytes: Optional[int] = None
+    chunk_count: Optional[int] = None
+    retries: Optional[int] = None
+    resumed: Optional[bool] = Field(None, description="是否从之前中断的上传会话继续")
 
 # 新的文件移动信息模型
 class MoveFileInfo(BaseModel):
@@ -60,6 +79,30 @@ class MoveSharepointFileRequest(BaseModel):
     move_info: MoveFileInfo
 
 
+# 批量移动请求模型
+class BulkMoveSharepointFileRequest(BaseModel):
+    client_info: ClientInfo
+    tenant_info: TenantInfo
+    move_items: List[MoveFileInfo] = Field(..., min_length=1, description="要移动的文件列表")
+
+
+class BulkMoveItemResult(BaseModel):
+    file_id: str
+    success: bool
+    message: str
+    status_code: Optional[int] = None
+    file_url: Optional[str] = None
+
+
+class BulkMoveSharepointFileResponse(BaseModel):
+    success: bool
+    message: str
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BulkMoveItemResult]
+
+
 @router.post("/upload_file_to_sharepoint_simple", response_model=UploadSharepointFileResponse)
 async def upload_file_to_sharepoint(
         request: UploadSharepointFileRequest = Body(...)
@@ -84,26 +127,18 @@ async def upload_file_to_sharepoint(
     try:
         logger.info(f"准备上传文件到SharePoint: {file_name}")
 
-        # 获取访问令牌
-        authority = f"https://login.microsoftonline.com/{request.tenant_info.tenant_id}"
-        scope = ["https://graph.microsoft.com/.default"]
-
-        app = msal.ConfidentialClientApplication(
-            request.client_info.client_id,
-            authority=authority,
-            client_credential=request.client_info.client_secret
-        )
-        result = app.acquire_token_for_client(scopes=scope)
-        access_token = result.get("access_token")
-
-        if not access_token:
-            error_msg = f"获取令牌失败: {result.get('error_description', '未知错误')}"
+        # 获取访问令牌（进程内缓存，过期前复用）
+        try:
+            access_token = await msal_token_cache.get_token(
+                request.tenant_info.tenant_id, request.client_info.client_id, request.client_info.client_secret)
+        except TokenAcquisitionError as e:
+            error_msg = f"获取令牌失败: {e}"
             logger.error(error_msg)
             return UploadSharepointFileResponse(success=False, message=error_msg)
 
         logger.info("成功获取访问令牌")
 
-        # 设置上传请求头
+        # 设置请求头
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -114,67 +149,82 @@ async def upload_file_to_sharepoint(
             "Content-Type": "application/octet-stream"
         }
 
-        # 1. 获取站点信息
-        logger.info(f"正在获取SharePoint站点信息: {request.upload_info.site_name}")
-        graph_site_url = f"https://graph.microsoft.com/v1.0/sites/{request.tenant_info.tenant_name}.sharepoint.com:/sites/{request.upload_info.site_name}"
-        site_response = requests.get(graph_site_url, headers=headers)
-
-        if site_response.status_code != 200:
-            error_msg = f"获取站点信息失败: {site_response.text}"
-            logger.error(error_msg)
-            return UploadSharepointFileResponse(success=False, message=error_msg)
-
-        # 解析站点ID
-        site_info = site_response.json()
-        site_id = site_info.get("id")
-        logger.info(f"成功获取站点ID: {site_id}")
-
-        # 2. 获取所有文档库
-        logger.info("获取站点的驱动器/文档库")
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        drives_response = requests.get(drives_url, headers=headers)
-
-        if drives_response.status_code != 200:
-            error_msg = f"获取文档库失败: {drives_response.text}"
-            logger.error(error_msg)
-            return UploadSharepointFileResponse(success=False, message=error_msg)
-
-        drives = drives_response.json().get("value", [])
-
-        if not drives:
-            error_msg = "未找到任何文档库"
-            logger.error(error_msg)
-            return UploadSharepointFileResponse(success=False, message=error_msg)
-
-        # 打印所有文档库信息
-        for drive in drives:
-            logger.info(f"找到文档库: ID={drive.get('id')}, 名称={drive.get('name')}")
-
-        # 选择默认文档库（通常是第一个）
-        drive = drives[0]
-        drive_id = drive.get("id")
-        logger.info(f"使用文档库: {drive.get('name')} (ID: {drive_id})")
+        # 1. 获取站点ID和默认文档库ID（优先使用缓存）
+        success, site_drive_or_error = await resolve_site_drive(
+            request.tenant_info.tenant_name, request.upload_info.site_name, headers)
+        if not success:
+            return UploadSharepointFileResponse(success=False, message=site_drive_or_error)
+        site_id, drive_id = site_drive_or_error
 
-        # 3. 处理文件夹路径
+        # 2. 处理文件夹路径，通过文件夹ID缓存确保最终目标文件夹存在，直接上传到该文件夹，无需再移动
         folder_path = request.upload_info.folder_path
         if folder_path.startswith('/'):
             folder_path = folder_path[1:]
         if folder_path.endswith('/'):
             folder_path = folder_path[:-1]
 
-        logger.info(f"上传路径: {folder_path}/{file_name}")
+        success, folder_id_or_error = await ensure_path_exists(drive_id, access_token, folder_path)
+        if not success:
+            logger.error(folder_id_or_error)
+            return UploadSharepointFileResponse(success=False, message=folder_id_or_error)
+        folder_id = folder_id_or_error
 
-        # 构建上传URL
-        upload_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{folder_path}/{file_name}:/content"
-        logger.info(f"上传URL: {upload_url}")
+        conflict_behavior = request.upload_info.conflict_behavior
+        logger.info(f"上传路径: {folder_path}/{file_name} (文件夹ID: {folder_id}, 同名处理: {conflict_behavior})")
 
         # 上传文件
         file_size = os.path.getsize(local_path)
         logger.info(f"上传文件大小: {file_size} 字节")
 
-        with open(local_path, "rb") as f:
-            logger.debug("发送上传请求...")
-            upload_response = requests.put(upload_url, headers=upload_headers, data=f)
+        # 本地计算 quickXorHash 的同时查询远程文件元数据，内容相同时跳过上传
+        if request.upload_info.skip_unchanged:
+            local_hash, remote_item = await asyncio.gather(
+                asyncio.to_thread(quickxorhash_file, local_path),
+                _get_remote_item(drive_id, folder_id, file_name, headers))
+            remote_hash = ((remote_item or {}).get("file") or {}).get("hashes", {}).get("quickXorHash")
+            if remote_hash == local_hash and remote_item.get("size") == file_size:
+                logger.info(f"远程文件内容未变化，跳过上传: {folder_path}/{file_name}")
+                return UploadSharepointFileResponse(
+                    success=True,
+                    message="远程文件内容相同，跳过上传",
+                    file_url=remote_item.get("webUrl"),
+                    file_id=remote_item.get("id"),
+                    status="unchanged",
+                    uploaded_bytes=0,
+                    total_bytes=file_size
+                )
+
+        # 大文件使用分块上传会话，支持单块重试和断点续传
+        if file_size > settings.SHAREPOINT_UPLOAD_SESSION_THRESHOLD:
+            success, result = await upload_file_in_session(
+                drive_id, folder_id, file_name, local_path, headers, conflict_behavior)
+            if not success:
+                if result.get("status_code") == 404:
+                    folder_id_cache.invalidate(drive_id, folder_path.split('/'))
+                logger.error(result["error"])
+                result.pop("status_code", None)
+                return UploadSharepointFileResponse(success=False, message=result.pop("error"), **result)
+            file_info = result.pop("item")
+            logger.info(f"文件分块上传成功！访问URL: {file_info.get('webUrl')}")
+            return UploadSharepointFileResponse(
+                success=True,
+                message="文件上传成功",
+                file_url=file_info.get("webUrl"),
+                file_id=file_info.get("id"),
+                status="uploaded",
+                **result
+            )
+
+        # 构建上传URL
+        upload_url = (f"{settings.GRAPH_API_BASE}/drives/{drive_id}/items/{folder_id}:/"
+                      f"{urllib.parse.quote(file_name, safe='')}:/content"
+                      f"?@microsoft.graph.conflictBehavior={conflict_behavior}")
+        logger.info(f"上传URL: {upload_url}")
+
+        # 小文件（不超过分块上传阈值）一次读入内存后上传
+        content = await asyncio.to_thread(_read_file, local_path)
+        logger.debug("发送上传请求...")
+        upload_response = await graph_client.put(upload_url, headers=upload_headers, data=content)
 
         if upload_response.status_code in [200, 201]:
             file_info = upload_response.json()
@@ -185,10 +235,22 @@ async def upload_file_to_sharepoint(
                 success=True,
                 message="文件上传成功",
                 file_url=file_url,
-                file_id=file_id
+                file_id=file_id,
+                status="uploaded",
+                upload_mode="simple",
+                uploaded_bytes=file_size,
+                total_bytes=file_size
             )
         else:
-            error_msg = f"上传失败，状态码：{upload_response.status_code}, 响应：{upload_response.text}"
+            if upload_response.status_code == 404:
+                # 目标文件夹可能已被删除；文档库也不存在时才重新解析站点
+                folder_id_cache.invalidate(drive_id, folder_path.split('/'))
+                await invalidate_site_drive_if_missing(
+                    request.tenant_info.tenant_name, request.upload_info.site_name, drive_id, headers)
+            if upload_response.status_code == 409:
+                error_msg = f"目标位置已存在同名文件: {folder_path}/{file_name}"
+            else:
+                error_msg = f"上传失败，状态码：{upload_response.status_code}, 响应：{upload_response.text}"
             logger.error(error_msg)
             return UploadSharepointFileResponse(success=False, message=error_msg)
 
@@ -199,93 +261,374 @@ async def upload_file_to_sharepoint(
 
 
 # ----------------------------------------------------
-# 辅助函数：递归创建目标路径
+# 辅助函数：分块上传会话
 # ----------------------------------------------------
 
-def ensure_path_exists(drive_id: str, access_token: str, folder_path: str) -> tuple[bool, str]:
+# Graph 要求分块大小是 320KB 的整数倍
+UPLOAD_CHUNK_UNIT = 320 * 1024
+# 分块上传可重试的状态码（416 表示该范围已被接收，查询进度后继续）
+RETRYABLE_CHUNK_STATUS = {408, 416, 429, 500, 502, 503, 504}
+# 响应中没有 expirationDateTime 时，未完成的上传会话保留的时长(秒)
+UPLOAD_SESSION_DEFAULT_TTL = 24 * 3600
+# 未完成的上传会话，(drive_id, 文件夹ID, 文件名, 同名处理方式, 文件大小, 修改时间) -> {"upload_url", "expires_at"}，
+# 用于下次请求断点续传；会话过期后在下次查找时移除
+_upload_sessions: dict = {}
+
+
+def _read_file(path: str, offset: int = 0, size: int = -1) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+async def _get_remote_item(drive_id: str, folder_id: str, file_name: str, headers: dict) -> Optional[dict]:
+    """查询目标文件夹下同名文件的元数据（含 quickXorHash），不存在或查询失败时返回 None"""
+    url = (f"{settings.GRAPH_API_BASE}/drives/{drive_id}/items/{folder_id}:/"
+           f"{urllib.parse.quote(file_name, safe='')}?$select=id,webUrl,size,file")
+    try:
+        response = await graph_client.get(url, headers=headers)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"查询远程文件元数据失败，继续上传: {e}")
+        return None
+    if response.status_code != 200:
+        if response.status_code != 404:
+            logger.warning(f"查询远程文件元数据失败，继续上传: 状态码 {response.status_code}")
+        return None
+    return response.json()
+
+
+async def _next_expected_offset(upload_url: str) -> Optional[int]:
+    """查询上传会话，返回服务端期望的下一个字节偏移"""
+    try:
+        status_response = await graph_client.get(upload_url, timeout=30)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"查询上传会话状态失败: {e}")
+        return None
+    if status_response.status_code != 200:
+        return None
+    ranges = status_response.json().get("nextExpectedRanges") or []
+    return int(ranges[0].split("-")[0]) if ranges else None
+
+
+def _session_expires_at(session: dict) -> float:
+    """解析 createUploadSession 响应中的 expirationDateTime，缺失或无法解析时按 UPLOAD_SESSION_DEFAULT_TTL 计算"""
+    try:
+        return datetime.fromisoformat(session["expirationDateTime"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time() + UPLOAD_SESSION_DEFAULT_TTL
+
+
+def _stored_upload_url(session_key: tuple) -> Optional[str]:
+    """移除已过期的上传会话，返回 session_key 对应的未过期会话的 uploadUrl"""
+    now = time.time()
+    for key in [key for key, session in _upload_sessions.items() if session["expires_at"] <= now]:
+        del _upload_sessions[key]
+    session = _upload_sessions.get(session_key)
+    return session["upload_url"] if session else None
+
+
+async def upload_file_in_session(drive_id: str, folder_id: str, file_name: str, local_path: str, headers: dict,
+                                 conflict_behavior: str = "replace") -> tuple[bool, dict]:
     """
-    检查路径是否存在，如果不存在，则逐级创建路径。
+    通过 createUploadSession 分块上传文件到指定文件夹
 
-    返回: (是否成功, 最终文件夹ID或错误信息)
+    每个分块失败后按指数退避重试，重试前向服务端查询已接收的范围并从断点继续；
+    可重试的错误重试次数用完时保留会话（直到会话过期），下次上传同一文件时从中断处继续，
+    不可重试的错误则丢弃会话。
+
+    返回: (是否成功, 进度信息)，成功时包含 "item"（上传后的文件信息），失败时包含 "error" 和 "status_code"
     """
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    file_size = os.path.getsize(local_path)
+    chunk_size = max(UPLOAD_CHUNK_UNIT, settings.SHAREPOINT_UPLOAD_CHUNK_SIZE // UPLOAD_CHUNK_UNIT * UPLOAD_CHUNK_UNIT)
+    session_key = (drive_id, folder_id, file_name, conflict_behavior, file_size, os.path.getmtime(local_path))
+    progress = {"upload_mode": "session", "uploaded_bytes": 0, "total_bytes": file_size,
+                "chunk_count": 0, "retries": 0, "resumed": False}
+
+    # 1. 继续之前中断的会话，或创建新会话
+    offset = 0
+    upload_url = _stored_upload_url(session_key)
+    if upload_url:
+        resumed_offset = await _next_expected_offset(upload_url)
+        if resumed_offset is None:
+            upload_url = None
+        else:
+            offset = resumed_offset
+            progress.update(uploaded_bytes=offset, resumed=True)
+            logger.info(f"继续之前中断的上传会话: {file_name}, 从 {offset}/{file_size} 字节开始")
+
+    if not upload_url:
+        create_url = (f"{settings.GRAPH_API_BASE}/drives/{drive_id}/items/{folder_id}:/"
+                      f"{urllib.parse.quote(file_name, safe='')}:/createUploadSession")
+        create_body = {"item": {"@microsoft.graph.conflictBehavior": conflict_behavior}}
+        create_response = await graph_client.post(create_url, headers=headers, json_body=create_body)
+        if create_response.status_code == 409:
+            return False, {"error": f"目标位置已存在同名文件: {file_name}", "status_code": 409, **progress}
+        if create_response.status_code != 200:
+            return False, {"error": f"创建上传会话失败: {create_response.text}",
+                           "status_code": create_response.status_code, **progress}
+        session = create_response.json()
+        upload_url = session.get("uploadUrl")
+        if not upload_url:
+            return False, {"error": f"创建上传会话失败，响应中没有 uploadUrl: {create_response.text}",
+                           "status_code": create_response.status_code, **progress}
+        _upload_sessions[session_key] = {"upload_url": upload_url, "expires_at": _session_expires_at(session)}
+        logger.info(f"已创建上传会话: {file_name}, 分块大小 {chunk_size} 字节")
+
+    # 2. 逐块上传（uploadUrl 已包含授权信息，不能再携带 Authorization 请求头）
+    attempts = 0
+    while True:
+        chunk = await asyncio.to_thread(_read_file, local_path, offset, chunk_size)
+        end = offset + len(chunk) - 1
+        chunk_headers = {"Content-Length": str(len(chunk)), "Content-Range": f"bytes {offset}-{end}/{file_size}"}
+        try:
+            chunk_response = await graph_client.put(upload_url, headers=chunk_headers, data=chunk)
+            error = f"状态码 {chunk_response.status_code}, 响应: {chunk_response.text}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            chunk_response = None
+            error = str(e)
+
+        if chunk_response is not None and chunk_response.status_code in (200, 201):
+            # 最后一块上传完成，返回文件信息
+            _upload_sessions.pop(session_key, None)
+            progress.update(uploaded_bytes=file_size, chunk_count=progress["chunk_count"] + 1)
+            return True, {"item": chunk_response.json(), **progress}
+
+        if chunk_response is not None and chunk_response.status_code == 202:
+            ranges = chunk_response.json().get("nextExpectedRanges") or []
+            offset = int(ranges[0].split("-")[0]) if ranges else end + 1
+            attempts = 0
+            progress.update(uploaded_bytes=offset, chunk_count=progress["chunk_count"] + 1)
+            logger.info(f"分块上传进度: {offset}/{file_size} 字节 ({offset / file_size:.0%})")
+            continue
 
-    # 1. 获取根目录ID作为起点
-    root_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root"
-    root_response = requests.get(root_url, headers=headers)
-    if root_response.status_code != 200:
-        return False, f"无法获取驱动器根目录信息: {root_response.text}"
+        retryable = chunk_response is None or chunk_response.status_code in RETRYABLE_CHUNK_STATUS
+        if not retryable or attempts >= settings.SHAREPOINT_UPLOAD_CHUNK_RETRIES:
+            if not retryable:
+                # 会话已过期(404)或请求被拒绝，无法续传，下次重新创建
+                _upload_sessions.pop(session_key, None)
+            return False, {"error": f"分块上传失败(偏移 {offset}): {error}",
+                           "status_code": chunk_response.status_code if chunk_response is not None else None,
+                           **progress}
 
-    current_parent_id = root_response.json().get("id")
+        attempts += 1
+        progress["retries"] += 1
+        delay = min(settings.SHAREPOINT_UPLOAD_RETRY_BACKOFF * 2 ** (attempts - 1), 30)
+        logger.warning(f"分块上传失败(偏移 {offset})，{delay:.1f} 秒后第 {attempts} 次重试: {error}")
+        await asyncio.sleep(delay)
 
-    # 2. 清理路径并分割组件
-    # 移除开头的斜杠，并按斜杠分割。注意：这里假设路径分隔符是 '/'
-    cleaned_path = folder_path.strip('/')
-    path_segments = cleaned_path.split('/')
+        # 查询服务端已接收的范围，从断点继续
+        resumed_offset = await _next_expected_offset(upload_url)
+        if resumed_offset is not None:
+            offset = resumed_offset
 
-    logger.info(f"路径分割组件: {path_segments}")
 
-    # 3. 逐级检查和创建
-    for segment in path_segments:
-        # 确保路径段非空
-        if not segment:
-            continue
+# ----------------------------------------------------
+# 辅助函数：解析站点和文档库ID
+# ----------------------------------------------------
 
-        # Graph API 要求路径段必须 URL 编码，以防中文或空格
-        encoded_segment = urllib.parse.quote(segment)
+async def resolve_site_drive(tenant_name: str, site_name: str, headers: dict) -> tuple[bool, object]:
+    """
+    获取站点ID和默认文档库（第一个文档库）ID，结果按 (tenant_name, site_name) 缓存
+
+    返回: (是否成功, (site_id, drive_id) 或错误信息)
+    """
+    cached = site_drive_cache.get(tenant_name, site_name)
+    if cached:
+        logger.info(f"使用缓存的站点和文档库ID: {site_name} -> {cached}")
+        return True, cached
+
+    # 获取站点信息
+    logger.info(f"正在获取SharePoint站点信息: {site_name}")
+    graph_site_url = f"{settings.GRAPH_API_BASE}/sites/{tenant_name}.sharepoint.com:/sites/{site_name}"
+    site_response = await graph_client.get(graph_site_url, headers=headers)
+
+    if site_response.status_code != 200:
+        error_msg = f"获取站点信息失败: {site_response.text}"
+        logger.error(error_msg)
+        return False, error_msg
+
+    site_id = site_response.json().get("id")
+    logger.info(f"成功获取站点ID: {site_id}")
 
-        # 3.1 检查当前段是否存在于当前父目录下
-        check_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{current_parent_id}/children?$filter=name eq '{encoded_segment}'"
+    # 获取所有文档库
+    logger.info("获取站点的驱动器/文档库")
+    drives_url = f"{settings.GRAPH_API_BASE}/sites/{site_id}/drives"
+    drives_response = await graph_client.get(drives_url, headers=headers)
 
-        # 注意: Graph API 不支持 name eq '中文' 这种过滤，所以最稳妥的方式是尝试 GET by path
-        # 但既然我们正在递归，我们可以简化为：尝试 GET by path，如果 404，则创建
+    if drives_response.status_code != 200:
+        error_msg = f"获取文档库失败: {drives_response.text}"
+        logger.error(error_msg)
+        return False, error_msg
 
-        # 优化：直接尝试通过路径查找当前段（相对于根目录）
-        # 这种方式是最好的，但如果路径很深，可能会很慢
+    drives = drives_response.json().get("value", [])
+    if not drives:
+        error_msg = "未找到任何文档库"
+        logger.error(error_msg)
+        return False, error_msg
 
-        # 重新采用最稳妥的递归创建：
-        # 尝试 GET 当前路径 (相对 root)
-        current_full_path = "/".join(path_segments[:path_segments.index(segment) + 1])
-        encoded_full_path = urllib.parse.quote(current_full_path, safe='')
+    # 打印所有文档库信息
+    for drive in drives:
+        logger.info(f"找到文档库: ID={drive.get('id')}, 名称={drive.get('name')}")
 
-        check_full_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{encoded_full_path}"
-        check_response = requests.get(check_full_url, headers=headers)
+    # 选择默认文档库（通常是第一个）
+    drive_id = drives[0].get("id")
+    logger.info(f"使用文档库: {drives[0].get('name')} (ID: {drive_id})")
 
-        if check_response.status_code == 200:
-            # 路径已存在，继续下一段
-            current_parent_id = check_response.json().get("id")
-            logger.info(f"路径段 '{segment}' 已存在，ID: {current_parent_id}")
-            continue
+    site_drive_cache.set(tenant_name, site_name, site_id, drive_id)
+    return True, (site_id, drive_id)
 
-        elif check_response.status_code == 404:
-            # 路径不存在，需要创建当前段
-            create_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{current_parent_id}/children"
-            create_body = {
-                "name": segment,
-                "folder": {}  # 标记这是一个文件夹
-            }
 
-            create_response = requests.post(create_url, headers=headers, json=create_body)
+async def invalidate_site_drive_if_missing(tenant_name: str, site_name: str, drive_id: str, headers: dict) -> bool:
+    """
+    按路径或ID查找文件/文件夹返回 404 时，确认缓存的文档库本身是否还存在：
+    只有文档库也查不到时才使站点缓存失效，文件或文件夹不存在不影响缓存的站点和文档库ID
+
+    返回: 是否已使站点缓存失效
+    """
+    drive_response = await graph_client.get(f"{settings.GRAPH_API_BASE}/drives/{drive_id}?$select=id",
+                                            headers=headers)
+    if drive_response.status_code != 404:
+        return False
+    site_drive_cache.invalidate(tenant_name, site_name)
+    return True
+
+
+async def warm_up_site_cache():
+    """启动时预先解析配置的站点（SHAREPOINT_WARM_SITES），返回成功解析的站点数"""
+    sites = [site.strip() for site in settings.SHAREPOINT_WARM_SITES.split(",") if site.strip()]
+    if not sites or not (settings.SHAREPOINT_TENANT_ID and settings.SHAREPOINT_TENANT_NAME
+                         and settings.SHAREPOINT_CLIENT_ID and settings.SHAREPOINT_CLIENT_SECRET):
+        return 0
+
+    access_token = await msal_token_cache.get_token(
+        settings.SHAREPOINT_TENANT_ID, settings.SHAREPOINT_CLIENT_ID, settings.SHAREPOINT_CLIENT_SECRET)
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    resolved = 0
+    for site_name in sites:
+        success, _ = await resolve_site_drive(settings.SHAREPOINT_TENANT_NAME, site_name, headers)
+        resolved += int(success)
+    return resolved
 
-            if create_response.status_code in [200, 201]:
-                # 创建成功
-                current_parent_id = create_response.json().get("id")
-                logger.info(f"成功创建路径段 '{segment}', ID: {current_parent_id}")
-            else:
-                # 创建失败
-                error_msg = f"创建文件夹路径段 '{segment}' 失败: {create_response.text}"
-                logger.error(error_msg)
-                return False, error_msg
+
+# ----------------------------------------------------
+# 辅助函数：递归创建目标路径
+# ----------------------------------------------------
+
+async def ensure_path_exists(drive_id: str, access_token: str, folder_path: str) -> tuple[bool, str]:
+    """
+    检查路径是否存在，如果不存在，则逐级创建路径。
+
+    已解析过的路径前缀直接从文件夹ID缓存中取得，只对缓存之外的部分访问 Graph：
+    先按完整路径查找一次，不存在时再逐级查找，找到第一个缺失的路径段后只创建缺失的后缀。
+
+    返回: (是否成功, 最终文件夹ID或错误信息)
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    # 1. 清理路径并分割组件
+    # 移除开头和结尾的斜杠，并按斜杠分割。注意：这里假设路径分隔符是 '/'
+    path_segments = [segment for segment in folder_path.strip('/').split('/') if segment]
+    logger.info(f"路径分割组件: {path_segments}")
+
+    success, result = await _resolve_or_create_path(drive_id, path_segments, headers)
+    if not success and result == 404:
+        # 缓存的父文件夹已不存在，清空该文档库的缓存后重新解析一次
+        folder_id_cache.invalidate(drive_id)
+        success, result = await _resolve_or_create_path(drive_id, path_segments, headers)
+    if not success and result == 404:
+        return False, f"创建文件夹路径 '{folder_path}' 失败: 父文件夹不存在"
+    return success, result
+
+
+async def _get_folder_id(drive_id: str, segments: list, headers: dict) -> tuple[int, Optional[str], str]:
+    """按路径（相对于根目录）查找文件夹，返回 (状态码, 文件夹ID, 响应内容)"""
+    if segments:
+        # Graph API 要求路径段必须 URL 编码，以防中文或空格
+        encoded_path = urllib.parse.quote("/".join(segments), safe='')
+        url = f"{settings.GRAPH_API_BASE}/drives/{drive_id}/root:/{encoded_path}"
+    else:
+        url = f"{settings.GRAPH_API_BASE}/drives/{drive_id}/root"
+    response = await graph_client.get(url, headers=headers)
+    folder_id = response.json().get("id") if response.status_code == 200 else None
+    if folder_id:
+        folder_id_cache.store(drive_id, segments, folder_id)
+    return response.status_code, folder_id, response.text
+
+
+async def _resolve_or_create_path(drive_id: str, path_segments: list, headers: dict) -> tuple[bool, object]:
+    """
+    解析或创建文件夹路径
+
+    返回: (是否成功, 文件夹ID或错误信息)；在缓存的父文件夹下创建时返回 404，则返回 (False, 404)
+    """
+    # 2. 从缓存中取得已知的最长前缀
+    depth, current_parent_id = folder_id_cache.lookup(drive_id, path_segments)
+    if depth == len(path_segments) and current_parent_id:
+        logger.info(f"使用缓存的文件夹ID: {'/'.join(path_segments)} -> {current_parent_id}")
+        return True, current_parent_id
+
+    # 3. 先按完整路径查找一次，已存在时只需要这一次请求
+    status, folder_id, text = await _get_folder_id(drive_id, path_segments, headers)
+    if status == 200:
+        logger.info(f"路径 '{'/'.join(path_segments)}' 已存在，ID: {folder_id}")
+        return True, folder_id
+    if status != 404:
+        error_msg = f"检查路径 '{'/'.join(path_segments)}' 时发生未知错误: {text}"
+        logger.error(error_msg)
+        return False, error_msg
+
+    # 4. 完整路径不存在：从缓存前缀之后逐级查找，找到第一个缺失的路径段
+    if current_parent_id is None:
+        status, current_parent_id, text = await _get_folder_id(drive_id, [], headers)
+        if status != 200:
+            return False, f"无法获取驱动器根目录信息: {text}"
+
+    index = depth
+    while index < len(path_segments) - 1:
+        status, folder_id, text = await _get_folder_id(drive_id, path_segments[:index + 1], headers)
+        if status == 404:
+            break
+        if status != 200:
+            error_msg = f"检查路径段 '{path_segments[index]}' 时发生未知错误: {text}"
+            logger.error(error_msg)
+            return False, error_msg
+        current_parent_id = folder_id
+        logger.info(f"路径段 '{path_segments[index]}' 已存在，ID: {current_parent_id}")
+        index += 1
+
+    # 5. 只创建缺失的后缀（新建文件夹下不会有子文件夹，无需再查找）
+    for index in range(index, len(path_segments)):
+        segment = path_segments[index]
+        create_url = f"{settings.GRAPH_API_BASE}/drives/{drive_id}/items/{current_parent_id}/children"
+        create_body = {
+            "name": segment,
+            "folder": {},  # 标记这是一个文件夹
+            "@microsoft.graph.conflictBehavior": "fail"
+        }
+        create_response = await graph_client.post(create_url, headers=headers, json_body=create_body)
+
+        if create_response.status_code in [200, 201]:
+            # 创建成功
+            current_parent_id = create_response.json().get("id")
+            folder_id_cache.store(drive_id, path_segments[:index + 1], current_parent_id)
+            logger.info(f"成功创建路径段 '{segment}', ID: {current_parent_id}")
+        elif create_response.status_code == 409:
+            # 其它请求已同时创建了该文件夹
+            status, current_parent_id, text = await _get_folder_id(drive_id, path_segments[:index + 1], headers)
+            if status != 200:
+                return False, f"创建文件夹路径段 '{segment}' 冲突后查找失败: {text}"
+        elif create_response.status_code == 404:
+            return False, 404
         else:
-            # 其他错误，如权限问题等
-            error_msg = f"检查或创建路径段 '{segment}' 时发生未知错误: {check_response.text}"
+            # 创建失败
+            error_msg = f"创建文件夹路径段 '{segment}' 失败: {create_response.text}"
             logger.error(error_msg)
             return False, error_msg
 
-    # 4. 循环结束，返回最终的目标文件夹 ID
+    # 6. 返回最终的目标文件夹 ID
     return True, current_parent_id
 
 
@@ -304,23 +647,14 @@ async def move_file_sharepoint(
     try:
         logger.info(f"准备移动文件: FileID={file_id}")
 
-        # --- 1. 获取访问令牌 (沿用上传接口逻辑) ---
-        authority = f"https://login.microsoftonline.com/{request.tenant_info.tenant_id}"
-        scope = ["https://graph.microsoft.com/.default"]
-
-        app = msal.ConfidentialClientApplication(
-            request.client_info.client_id,
-            authority=authority,
-            client_credential=request.client_info.client_secret
-        )
-        result = app.acquire_token_for_client(scopes=scope)
-        access_token = result.get("access_token")
-
-        if not access_token:
-            error_msg = f"获取令牌失败: {result.get('error_description', '未知错误')}"
+        # --- 1. 获取访问令牌 (进程内缓存，过期前复用) ---
+        try:
+            access_token = await msal_token_cache.get_token(
+                request.tenant_info.tenant_id, request.client_info.client_id, request.client_info.client_secret)
+        except TokenAcquisitionError as e:
+            error_msg = f"获取令牌失败: {e}"
             logger.error(error_msg)
-            # 注意: 如果 msal.ConfidentialClientApplication 失败，会抛出异常，因此这里可能不需要返回
-            raise Exception(error_msg)
+            return UploadSharepointFileResponse(success=False, message=error_msg)
 
         logger.info("成功获取访问令牌")
 
@@ -330,37 +664,19 @@ async def move_file_sharepoint(
             "Content-Type": "application/json"
         }
 
-        # --- 2. 获取站点和驱动器ID (沿用上传接口逻辑) ---
-        # 步骤 2.1: 获取站点信息
-        graph_site_url = f"https://graph.microsoft.com/v1.0/sites/{request.tenant_info.tenant_name}.sharepoint.com:/sites/{request.move_info.site_name}"
-        site_response = requests.get(graph_site_url, headers=headers)
-
-        if site_response.status_code != 200:
-            error_msg = f"获取站点信息失败: {site_response.text}"
-            logger.error(error_msg)
-            raise HTTPException(status_code=500, detail=error_msg)
-
-        site_id = site_response.json().get("id")
-
-        # 步骤 2.2: 获取默认文档库/驱动器ID
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        drives_response = requests.get(drives_url, headers=headers)
-        drives = drives_response.json().get("value", [])
-        if not drives:
-            raise HTTPException(status_code=500, detail="未找到任何文档库")
-
-        # 使用默认文档库
-        drive_id = drives[0].get("id")
-        logger.info(f"使用文档库: {drives[0].get('name')} (ID: {drive_id})")
+        # --- 2. 获取站点和驱动器ID (优先使用缓存) ---
+        success, site_drive_or_error = await resolve_site_drive(
+            request.tenant_info.tenant_name, request.move_info.site_name, headers)
+        if not success:
+            raise HTTPException(status_code=500, detail=site_drive_or_error)
+        site_id, drive_id = site_drive_or_error
 
         # --- 3. 检查/创建目标文件夹路径 ---
         target_folder_path = request.move_info.target_folder_path
         file_id_to_move = request.move_info.file_id
         new_file_name = request.move_info.new_file_name
 
-        # 假设 ensure_path_exists 函数定义在文件外部
-        # 注意: ensure_path_exists 必须被定义为常规函数，而不是 async def
-        success, result_id_or_error = ensure_path_exists(
+        success, result_id_or_error = await ensure_path_exists(
             drive_id=drive_id,
             access_token=access_token,
             folder_path=target_folder_path
@@ -368,6 +684,9 @@ async def move_file_sharepoint(
 
         # 4. 如果路径创建/查找失败，则不执行 Move 操作
         if not success:
+            # 缓存的文档库可能已变化，文档库确实不存在时下次请求重新解析
+            await invalidate_site_drive_if_missing(
+                request.tenant_info.tenant_name, request.move_info.site_name, drive_id, headers)
             logger.error(f"路径准备失败，终止移动操作: {result_id_or_error}")
             return UploadSharepointFileResponse(
                 success=False,
@@ -390,10 +709,10 @@ async def move_file_sharepoint(
 
         # --- 6. 执行 PATCH 请求 (Move 操作) ---
         # !!! 注意：这部分现在已正确缩进到 try 块内 !!!
-        move_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{file_id_to_move}"
+        move_url = f"{settings.GRAPH_API_BASE}/drives/{drive_id}/items/{file_id_to_move}"
         logger.info(f"执行移动操作 URL: {move_url}")
 
-        move_response = requests.patch(move_url, headers=headers, json=move_body)
+        move_response = await graph_client.patch(move_url, headers=headers, json_body=move_body)
 
         if move_response.status_code == 200:
             file_info = move_response.json()
@@ -407,6 +726,11 @@ async def move_file_sharepoint(
                 file_id=file_info.get("id")
             )
         else:
+            if move_response.status_code == 404:
+                # 要移动的文件或目标文件夹可能已被删除；文档库也不存在时才重新解析站点
+                folder_id_cache.invalidate(drive_id, [segment for segment in target_folder_path.split('/') if segment])
+                await invalidate_site_drive_if_missing(
+                    request.tenant_info.tenant_name, request.move_info.site_name, drive_id, headers)
             error_msg = f"文件移动失败: 状态码 {move_response.status_code}. 响应: {move_response.text}"
             logger.error(f"❌ {error_msg}")
             # 同样抛出异常或返回失败响应
@@ -420,4 +744,172 @@ async def move_file_sharepoint(
         # 捕获所有其他未预期的异常 (如网络错误，msal错误等)
         error_msg = f"移动过程中发生意外错误: {str(e)}"
         logger.exception(error_msg)
-        return UploadSharepointFileResponse(success=False, message=error_msg)
\ No newline at end of file
+        return UploadSharepointFileResponse(success=False, message=error_msg)
+
+# ----------------------------------------------------
+# 批量移动：共享的站点/文件夹只解析一次，移动请求通过 $batch 每批最多 20 个发送
+# ----------------------------------------------------
+
+# Graph JSON 批处理每次最多包含的请求数
+GRAPH_BATCH_LIMIT = 20
+
+
+async def send_graph_batch(batch_requests: List[dict], headers: dict) -> dict:
+    """
+    通过 Graph $batch 发送一批请求（最多 20 个）
+
+    批处理中单个请求被限流(429/503)时，按其 Retry-After 等待后只重发这些请求。
+
+    返回: {请求id: {"status": 状态码, "body": 响应体}}；整批失败时每个请求都返回该批的状态码和错误信息
+    """
+    batch_url = f"{settings.GRAPH_API_BASE}/$batch"
+    results = {}
+    pending = batch_requests
+    attempt = 0
+    while pending:
+        try:
+            batch_response = await graph_client.post(batch_url, headers=headers, json_body={"requests": pending})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            results.update({item["id"]: {"status": None, "body": {"error": {"message": str(e)}}} for item in pending})
+            break
+
+        if batch_response.status_code != 200:
+            error_body = {"error": {"message": batch_response.text}}
+            results.update({item["id"]: {"status": batch_response.status_code, "body": error_body} for item in pending})
+            break
+
+        throttled_ids, retry_after = set(), None
+        for item in batch_response.json().get("responses", []):
+            results[item["id"]] = {"status": item.get("status"), "body": item.get("body") or {}}
+            if item.get("status") in THROTTLE_STATUS:
+                throttled_ids.add(item["id"])
+                item_retry_after = retry_after_seconds(item.get("headers") or {})
+                if item_retry_after is not None:
+                    retry_after = max(retry_after or 0, item_retry_after)
+
+        pending = [item for item in pending if item["id"] in throttled_ids]
+        if not pending or attempt >= settings.GRAPH_MAX_RETRIES:
+            break
+        attempt += 1
+        delay = backoff_delay(attempt, retry_after)
+        logger.warning(f"批处理中 {len(pending)} 个请求被限流，{delay:.1f} 秒后第 {attempt} 次重试")
+        await asyncio.sleep(delay)
+    return results
+
+
+def _gathered_result(result, action: str) -> tuple:
+    """把 gather(..., return_exceptions=True) 中抛出的异常转换为 (False, 错误信息)，其它结果原样返回"""
+    if isinstance(result, BaseException):
+        logger.opt(exception=result).error(f"{action}时发生意外错误: {result}")
+        return False, f"{action}时发生意外错误: {result}"
+    return result
+
+
+@router.post("/move_files_sharepoint_bulk", response_model=BulkMoveSharepointFileResponse)
+async def move_files_sharepoint_bulk(
+        request: BulkMoveSharepointFileRequest = Body(...)
+):
+    """
+    批量将文件重命名并移动到SharePoint指定文件夹
+
+    令牌只获取一次，相同站点和目标文件夹只解析/创建一次，移动请求通过 Graph $batch 每批最多 20 个发送，
+    返回每个文件的移动结果（顺序与请求一致）。
+    """
+    items = request.move_items
+    results: List[Optional[BulkMoveItemResult]] = [None] * len(items)
+    logger.info(f"准备批量移动文件: 共 {len(items)} 个")
+
+    # 1. 获取访问令牌
+    try:
+        access_token = await msal_token_cache.get_token(
+            request.tenant_info.tenant_id, request.client_info.client_id, request.client_info.client_secret)
+    except TokenAcquisitionError as e:
+        error_msg = f"获取令牌失败: {e}"
+        logger.error(error_msg)
+        results = [BulkMoveItemResult(file_id=item.file_id, success=False, message=error_msg) for item in items]
+        return BulkMoveSharepointFileResponse(success=False, message=error_msg, total=len(items), succeeded=0,
+                                              failed=len(items), results=results)
+
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    # 2. 每个站点只解析一次，某个站点解析出错只影响该站点的文件
+    tenant_name = request.tenant_info.tenant_name
+    site_names = {item.site_name.casefold(): item.site_name for item in items}
+    site_results = await asyncio.gather(*[resolve_site_drive(tenant_name, name, headers)
+                                          for name in site_names.values()], return_exceptions=True)
+    drives = {key: _gathered_result(result, f"获取站点信息 '{site_names[key]}'")
+              for key, result in zip(site_names.keys(), site_results)}
+
+    # 3. 每个目标文件夹只解析/创建一次
+    def folder_key(item: MoveFileInfo) -> tuple:
+        return item.site_name.casefold(), "/".join(
+            segment.casefold() for segment in item.target_folder_path.split('/') if segment)
+
+    folder_items = {}
+    for item in items:
+        success, site_drive = drives[item.site_name.casefold()]
+        if success:
+            folder_items.setdefault(folder_key(item), (site_drive[1], item.target_folder_path))
+    folder_results = await asyncio.gather(*[ensure_path_exists(drive_id, access_token, path)
+                                            for drive_id, path in folder_items.values()], return_exceptions=True)
+    folders = {key: _gathered_result(result, f"准备文件夹路径 '{path}'")
+               for (key, (_, path)), result in zip(folder_items.items(), folder_results)}
+    logger.info(f"批量移动涉及 {len(site_names)} 个站点, {len(folders)} 个目标文件夹")
+
+    # 4. 构造移动请求，站点或文件夹解析失败的文件直接记录失败
+    batch_requests = []
+    for index, item in enumerate(items):
+        success, site_drive = drives[item.site_name.casefold()]
+        if not success:
+            results[index] = BulkMoveItemResult(file_id=item.file_id, success=False, message=site_drive)
+            continue
+        success, folder_id = folders[folder_key(item)]
+        if not success:
+            results[index] = BulkMoveItemResult(file_id=item.file_id, success=False,
+                                                message=f"目标文件夹路径准备失败: {folder_id}")
+            continue
+
+        drive_id = site_drive[1]
+        move_body = {"parentReference": {"id": folder_id, "driveId": drive_id}}
+        if item.new_file_name:
+            move_body["name"] = item.new_file_name
+        batch_requests.append({
+            "id": str(index),
+            "method": "PATCH",
+            "url": f"/drives/{drive_id}/items/{item.file_id}",
+            "headers": {"Content-Type": "application/json"},
+            "body": move_body,
+        })
+
+    # 5. 每批最多 20 个请求，各批并发发送
+    batches = [batch_requests[i:i + GRAPH_BATCH_LIMIT] for i in range(0, len(batch_requests), GRAPH_BATCH_LIMIT)]
+    batch_results = await asyncio.gather(*[send_graph_batch(batch, headers) for batch in batches])
+    responses = {}
+    for batch_result in batch_results:
+        responses.update(batch_result)
+
+    for batch_request in batch_requests:
+        index = int(batch_request["id"])
+        item = items[index]
+        response = responses.get(batch_request["id"], {"status": None, "body": {}})
+        status, body = response["status"], response["body"]
+        if status == 200:
+            results[index] = BulkMoveItemResult(
+                file_id=item.file_id, success=True, status_code=status,
+                message="文件移动和重命名成功" if item.new_file_name else "文件移动成功", file_url=body.get("webUrl"))
+        else:
+            if status == 404:
+                folder_id_cache.invalidate(batch_request["body"]["parentReference"]["driveId"],
+                                           [segment for segment in item.target_folder_path.split('/') if segment])
+            error_message = body.get("error", {}).get("message", "未知错误") if isinstance(body, dict) else str(body)
+            results[index] = BulkMoveItemResult(file_id=item.file_id, success=False, status_code=status,
+                                                message=f"文件移动失败: 状态码 {status}. {error_message}")
+
+    succeeded = sum(1 for result in results if result.success)
+    message = f"批量移动完成: 成功 {succeeded} 个, 失败 {len(items) - succeeded} 个"
+    logger.info(f"{message}（{len(batches)} 个批处理请求）")
+    return BulkMoveSharepointFileResponse(success=succeeded == len(items), message=message, total=len(items),
+                                          succeeded=succeeded, failed=len(items) - succeeded, results=results)
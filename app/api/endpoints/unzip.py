@@ -1,12 +1,16 @@
 import os
 import shutil
-from typing import List, Optional, Dict
+import asyncio
+from typing import List, Literal, Optional, Dict
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Form, Response, Query
 from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 from app.utils.logger import logger
 from app.utils.downloader import download_file
+from app.utils.download_governor import parse_priority
 from app.utils.zipextractor import extract_zip
+from app.utils.cleaner import temp_janitor
+from app.utils.temp_store import TempQuotaExceeded, temp_store
 from app.core.config import settings
 from app.utils.filer import remove_pdf_password, split_pdf
 
@@ -19,8 +23,10 @@ class UnzipRequest(BaseModel):
     attachment_id: str
     download_url: HttpUrl
     unzip_passwd: Optional[str] = None   # ZIP 文件解压密码（可选）
+    unzip_depth: Optional[int] = Field(None, ge=0)  # 嵌套压缩包最多展开层数（可选，默认使用服务配置）
     pdf_passwd: Optional[List[str]] = None  # PDF 文件解密密码列表（可选）
     split: Optional[List[int]] = None  # split 参数（可选）
+    priority: Optional[Literal["high", "normal", "low"]] = "normal"  # 下载排队优先级（可选）
 
 
 class FileInfo(BaseModel):
@@ -30,6 +36,7 @@ class FileInfo(BaseModel):
     split_file_name: Optional[str]
     split_file_size: Optional[int]
     split_file_path: Optional[str]
+    unzip_lineage: List[str] = []  # 来源链，例如 ["outer.zip", "entity_a.zip"]
 
 
 class UnzipResponse(BaseModel):
@@ -47,10 +54,11 @@ task_status = {}
 
 
 # 清理临时文件的函数
-def cleanup_temp_files(task_dir: str):
+async def cleanup_temp_files(task_dir: str):
     try:
-        if os.path.exists(task_dir) and task_dir.startswith(settings.TEMP_DIR):
-            shutil.rmtree(task_dir)
+        if os.path.exists(task_dir) and task_dir.startswith(str(settings.TEMP_DIR)):
+            await asyncio.to_thread(shutil.rmtree, task_dir)
+            await temp_janitor.unregister(task_dir)
             logger.info(f"已清理临时目录: {task_dir}")
             # 从任务状态中移除
             task_id = os.path.basename(task_dir)
@@ -70,16 +78,28 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
     """
     logger.info(f"收到解压请求: task_id={request.task_id}, attachment_id={request.attachment_id}")
 
-    # 创建任务目录
     task_dir = os.path.join(settings.TEMP_DIR, request.task_id)
+    try:
+        # 处理期间任务目录计入进行中配额，完成后才可能被淘汰
+        async with temp_store.track(task_dir):
+            return await _unzip_task(request, task_dir)
+    except TempQuotaExceeded as e:
+        logger.warning(f"拒绝解压请求: {e}")
+        raise HTTPException(status_code=507, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def _unzip_task(request: UnzipRequest, task_dir: str) -> UnzipResponse:
+    # 创建任务目录
     os.makedirs(task_dir, exist_ok=True)
+    # 登记任务目录，过期后由后台清理任务删除
+    await temp_janitor.register(task_dir)
 
     # 保存 ZIP 文件路径
     save_filename = f"{request.attachment_id}.zip"
     save_path = os.path.join(task_dir, save_filename)
 
     # 下载文件
-    download_result = await download_file(str(request.download_url), save_path)
+    download_result = await download_file(str(request.download_url), save_path, parse_priority(request.priority))
     if not download_result["success"]:
         return UnzipResponse(
             task_id=request.task_id,
@@ -87,13 +107,14 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
             success=False,
             error=download_result["error"]
         )
+    temp_store.record(task_dir, download_result["size"])
 
     # 创建解压目录
     extract_dir = os.path.join(task_dir, "extracted")
     os.makedirs(extract_dir, exist_ok=True)
 
     # 解压文件
-    extract_result = extract_zip(save_path, extract_dir, request.unzip_passwd)
+    extract_result = extract_zip(save_path, extract_dir, request.unzip_passwd, request.unzip_depth)
     if not extract_result["success"]:
         return UnzipResponse(
             task_id=request.task_id,
@@ -102,19 +123,18 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
             error=extract_result["error"]
         )
 
-    # 使用 extract_result 中的 final_extract_dir
-    extract_dir = extract_result["extracted_dir"]
-
     # 遍历解压结果文件，处理 PDF 解密(如有)并生成下载链接
     extracted_files_info = []
     for file_data in extract_result["extracted_files"]:
-        file_name = file_data["name"]  # 获取文件名
-        original_file_path = os.path.join(extract_dir, file_name)  # 解压缩后的文件路径
+        file_name = file_data["unzip_filename"]  # 获取文件名
+        # unzip_filepath 相对于解压根目录；嵌套压缩包展开的文件位于子目录中
+        original_file_path = os.path.join(extract_dir, file_data["unzip_filepath"])  # 解压缩后的文件路径
+        file_dir = os.path.dirname(original_file_path)
 
         # 如果提供了 pdf_passwd 且文件是 PDF，则尝试解密
         if request.pdf_passwd and file_name.lower().endswith('.pdf'):
             output_file_name = f"{os.path.splitext(file_name)[0]}_unlocked.pdf"  # 无密码文件另存为新文件名
-            output_file_path = os.path.join(extract_dir, output_file_name)
+            output_file_path = os.path.join(file_dir, output_file_name)
 
             # 调用解密函数
             success = remove_pdf_password(original_file_path, output_file_path, request.pdf_passwd)
@@ -127,11 +147,11 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
                 # 解密失败，保留原始文件并记录警告
                 logger.warning(f"PDF 解密失败: {file_name}")
                 file_path = original_file_path
-                file_size = file_data["size"]
+                file_size = file_data["unzip_filesize"]
         else:
             # 非 PDF 文件或未提供密码，直接使用原始文件
             file_path = original_file_path
-            file_size = file_data["size"]
+            file_size = file_data["unzip_filesize"]
 
 
         # 构建下载链接
@@ -143,7 +163,7 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
         split_file_name = None
         split_file_size = None
         if request.split:
-            split_files = split_pdf(file_path, extract_dir, request.split)
+            split_files = split_pdf(file_path, file_dir, request.split)
             if split_files:
                 # 取第一个拆分文件（假设每次只生成一个拆分文件）
                 split_file = split_files[0]
@@ -160,7 +180,8 @@ async def unzip_file(request: UnzipRequest, background_tasks: BackgroundTasks):
             size=file_size,
             split_file_name=split_file_name,
             split_file_size=split_file_size,
-            split_file_path=split_download_url
+            split_file_path=split_download_url,
+            unzip_lineage=file_data["unzip_lineage"]
         ))
 
     # 返回最终响应结果
@@ -217,5 +238,5 @@ async def cleanup_task(task_id: str):
     if not os.path.exists(task_dir):
         return {"message": "任务目录不存在或已被清理"}
 
-    cleanup_temp_files(task_dir)
+    await cleanup_temp_files(task_dir)
     return {"message": f"任务 {task_id} 的临时文件已清理"}
@@ -121,11 +121,23 @@ API_HELP_CONTENT = {
         {
             "path": "/api/sharepoint/upload",
             "method": "POST",
-            "description": "上传文件到SharePoint",
+            "description": "上传文件到SharePoint，直接上传到最终目标文件夹（不存在时自动创建），无需再移动",
             "body": {
                 "task_id": "任务ID",
                 "file_path": "文件路径",
-                "target_folder": "目标文件夹"
+                "target_folder": "目标文件夹",
+                "conflict_behavior": "同名文件处理方式：replace（默认）/ rename / fail",
+                "skip_unchanged": "远程已有内容相同（quickXorHash 一致）的文件时跳过上传，返回 status=unchanged"
+            }
+        },
+        {
+            "path": "/api/move_files_sharepoint_bulk",
+            "method": "POST",
+            "description": "批量移动/重命名SharePoint文件（Graph $batch，每批最多20个），返回每个文件的结果",
+            "body": {
+                "client_info": "应用凭证 {client_id, client_secret}",
+                "tenant_info": "租户信息 {tenant_id, tenant_name}",
+                "move_items": "文件列表 [{file_id, site_name, target_folder_path, new_file_name}]"
             }
         },
 
@@ -253,6 +265,25 @@ API_HELP_CONTENT = {
             }
         },
 
+        # 运行指标
+        {
+            "path": "/api/metrics",
+            "method": "GET",
+            "description": "查看服务运行指标",
+            "response": {
+                "http_client": "共享HTTP连接池的请求数、新建/复用连接数、DNS缓存命中情况",
+                "download_governor": "下载并发控制的活跃数、排队数、按优先级/主机的等待时间",
+                "temp_janitor": "临时目录清理索引中的条目数、下一次过期时间、累计删除数",
+                "temp_store": "临时目录配额、已用字节、进行中任务占用、淘汰和拒绝次数",
+                "artefacts": "R脚本输出文件的登记数、分配/释放/后台清理数量",
+                "msal_token_cache": "SharePoint访问令牌缓存的条目数、命中率、刷新和失败次数",
+                "sharepoint_site_cache": "SharePoint站点/文档库ID缓存的条目数、命中率、失效次数",
+                "sharepoint_folder_cache": "SharePoint文件夹ID缓存的文档库数、文件夹数、命中率、失效次数",
+                "graph_client": "Graph请求的并发上限、进行中/累计请求数、错误数和连接池复用情况",
+                "giin_dataset": "内存中GIIN数据的记录数、加载时间、内容摘要、重新加载次数和耗时"
+            }
+        },
+
         # PDF转Markdown
         {
             "path": "/api/pdf_to_markdown",
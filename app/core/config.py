@@ -35,10 +35,80 @@ class Settings(BaseSettings):
     SQL_DIR: Path = BASE_DIR / "r_scripts" / "sql"
     TEMPLATE_DIR: Path = BASE_DIR / "app" / "templates"
     FONT_DIR: Path = BASE_DIR / "resources" / "fonts"
+    DATAROOM_DIR: Path = BASE_DIR / "dataroom"  # R 脚本输出的 feather 等中间文件
+
+    # R 输出文件（dataroom）清理设置
+    ARTEFACT_MAX_AGE_HOURS: float = 24  # 登记的R输出文件超过该时长(小时)未被释放时由后台清理
+    ARTEFACT_RETENTION_DAYS: int = 7  # dataroom 中未登记的遗留feather文件保留天数
 
     # 文件下载设置
     DOWNLOAD_TIMEOUT: int = 180  # 下载超时时间(秒)
     MAX_DOWNLOAD_SIZE: int = 1024 * 1024 * 100  # 最大下载大小(100MB)
+    DOWNLOAD_MAX_RETRIES: int = 3  # 临时性错误的最大重试次数
+    DOWNLOAD_RETRY_BACKOFF: float = 1.0  # 重试退避基数(秒)，按 2 的指数增长
+    DOWNLOAD_RETRY_BACKOFF_MAX: float = 30.0  # 单次重试的最大等待时间(秒)
+    DOWNLOAD_SEGMENTS: int = 4  # 大文件分段并发下载的分段数，1表示禁用分段下载
+    DOWNLOAD_SEGMENT_THRESHOLD: int = 1024 * 1024 * 16  # 超过该大小(16MB)且服务端支持Range时使用分段下载
+    DOWNLOAD_SEGMENT_MIN_SIZE: int = 1024 * 1024 * 4  # 单个分段的最小大小(4MB)
+    DOWNLOAD_CHUNK_MIN: int = 1024 * 64  # 自适应读取块的初始大小(64KB)
+    DOWNLOAD_CHUNK_MAX: int = 1024 * 1024  # 自适应读取块的最大大小(1MB)
+    DOWNLOAD_WRITE_BUFFER: int = 1024 * 1024 * 4  # 合并写盘的缓冲区大小(4MB)
+    DOWNLOAD_MAX_CONCURRENCY: int = 8  # 同时进行的下载连接数上限（分段下载的每个分段占一个），超出的请求排队
+    DOWNLOAD_MAX_CONCURRENCY_PER_HOST: int = 4  # 同一主机同时进行的下载连接数上限，分段数也不超过该值
+
+    # 共享HTTP连接池设置
+    HTTP_POOL_LIMIT: int = 100  # 连接池总连接数上限
+    HTTP_POOL_LIMIT_PER_HOST: int = 20  # 单个主机的连接数上限
+    HTTP_DNS_CACHE_TTL: int = 300  # DNS缓存时间(秒)
+    HTTP_KEEPALIVE_TIMEOUT: float = 60  # 空闲连接保持时间(秒)
+    HTTP_CONNECT_TIMEOUT: float = 10  # 建立连接超时时间(秒)
+    HTTP_SOCK_READ_TIMEOUT: float = 60  # 两次读取数据之间的超时时间(秒)
+
+    # 远程文件条件请求缓存设置
+    HTTP_CACHE_MAX_AGE: int = 7 * 24 * 3600  # 缓存条目超过该时间(秒)未被使用时清理
+    GIIN_REVALIDATE_SECONDS: int = 3600  # GIIN数据文件在该时间(秒)内不重复向IRS校验
+    GIIN_BATCH_MATCH_THRESHOLD: int = 50  # 一次查询的实体数达到该数量时，用多模式匹配一次扫描完成
+
+    # 临时目录清理设置
+    TEMP_FILE_TTL_HOURS: float = 24  # 任务目录保留时长(小时)
+    JANITOR_INTERVAL_SECONDS: float = 300  # 后台清理检查间隔(秒)
+    JANITOR_DELETE_PAUSE_SECONDS: float = 0.2  # 每删除一个目录后的暂停时间(秒)，避免与业务I/O争抢
+    JANITOR_BATCH_SIZE: int = 50  # 每次检查最多删除的目录数
+    TEMP_QUOTA_BYTES: int = 20 * 1024 * 1024 * 1024  # 临时目录磁盘配额(字节)，超出时按最近最少访问淘汰已完成任务
+    TEMP_QUOTA_RETRY_AFTER: int = 30  # 进行中任务已占满配额时，建议客户端重试的等待时间(秒)
+    TEMP_HOT_DIR: str = os.getenv("TEMP_HOT_DIR", "/dev/shm/reportautomate")  # 中间文件热存储目录(tmpfs)，为空表示禁用
+    TEMP_HOT_MAX_BYTES: int = 1024 * 1024 * 512  # 热存储可用的最大字节数(512MB)，超出时中间文件写入持久目录
+
+    # Microsoft Graph / SharePoint 设置
+    GRAPH_API_BASE: str = os.getenv("GRAPH_API_BASE", "https://graph.microsoft.com/v1.0")  # Graph API 地址
+    GRAPH_POOL_LIMIT: int = 50  # Graph 连接池连接数上限
+    GRAPH_MAX_CONCURRENCY: int = 16  # 同时进行的 Graph 请求数上限
+    GRAPH_REQUEST_TIMEOUT: float = 60  # 普通 Graph 请求的总超时时间(秒)
+    GRAPH_UPLOAD_TIMEOUT: float = 600  # 上传文件内容请求的总超时时间(秒)
+    GRAPH_MAX_RETRIES: int = 5  # 被限流(429/503)时的最大重试次数
+    GRAPH_RETRY_BACKOFF: float = 1.0  # 未返回 Retry-After 时的退避基数(秒)，按 2 的指数增长并带随机抖动
+    GRAPH_RETRY_BACKOFF_MAX: float = 60.0  # 单次重试的最大等待时间(秒)
+    GRAPH_TENANT_CONCURRENCY: int = 8  # 每个租户的初始并发数，被限流时减半，成功时逐步增加（不超过 GRAPH_MAX_CONCURRENCY）
+    MSAL_AUTHORITY_HOST: str = os.getenv("MSAL_AUTHORITY_HOST", "https://login.microsoftonline.com")  # 登录服务地址
+    GRAPH_SCOPE: str = "https://graph.microsoft.com/.default"  # 客户端凭证授权的scope
+    MSAL_TOKEN_REFRESH_MARGIN: int = 300  # 令牌距离过期不足该秒数时提前刷新
+    SHAREPOINT_UPLOAD_SESSION_THRESHOLD: int = 1024 * 1024 * 4  # 超过该大小(4MB)的文件使用分块上传会话
+    SHAREPOINT_UPLOAD_CHUNK_SIZE: int = 320 * 1024 * 32  # 分块大小(10MB)，必须是320KB的整数倍
+    SHAREPOINT_UPLOAD_CHUNK_RETRIES: int = 3  # 单个分块失败后的最大重试次数
+    SHAREPOINT_UPLOAD_RETRY_BACKOFF: float = 1.0  # 分块重试退避基数(秒)，按 2 的指数增长，最长30秒
+    SHAREPOINT_SITE_CACHE_TTL: int = 6 * 3600  # 站点ID/文档库ID缓存时间(秒)
+    SHAREPOINT_FOLDER_CACHE_TTL: int = 6 * 3600  # 文件夹路径 -> 文件夹ID 缓存时间(秒)
+    # 启动时预先解析的站点（可选），需要同时配置下面的租户和应用凭证
+    SHAREPOINT_TENANT_ID: str = os.getenv("SHAREPOINT_TENANT_ID", "")
+    SHAREPOINT_TENANT_NAME: str = os.getenv("SHAREPOINT_TENANT_NAME", "")
+    SHAREPOINT_CLIENT_ID: str = os.getenv("SHAREPOINT_CLIENT_ID", "")
+    SHAREPOINT_CLIENT_SECRET: str = os.getenv("SHAREPOINT_CLIENT_SECRET", "")
+    SHAREPOINT_WARM_SITES: str = os.getenv("SHAREPOINT_WARM_SITES", "")  # 逗号分隔的站点名称
+
+    # 解压设置
+    UNZIP_MAX_DEPTH: int = int(os.getenv("UNZIP_MAX_DEPTH", "3"))  # 嵌套压缩包最多展开层数，0表示不展开
+    UNZIP_MAX_TOTAL_BYTES: int = 1024 * 1024 * 1024 * 2  # 展开嵌套压缩包后解压目录的总大小上限(2GB)
+    UNZIP_MAX_ENTRIES: int = 10000  # 展开嵌套压缩包后解压目录的文件总数上限
 
     # Pydantic配置
     model_config = SettingsConfigDict(
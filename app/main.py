@@ -4,6 +4,10 @@ from fastapi.templating import Jinja2Templates
 from app.core.config import settings
 from app.core.security import verify_api_auth
 from app.core.api_docs import API_HELP_CONTENT
+from app.utils.http_client import http_client
+from app.utils.graph_client import graph_http
+from app.utils.cleaner import temp_janitor
+from app.utils.temp_store import temp_store
 from app.api.endpoints import (
     unzip,
     sharepoint,
@@ -17,6 +21,7 @@ from app.api.endpoints import (
     process_citi_daily_balance,
     process_csb_daily_balance,
     generate_account_file,
+    metrics,
 )
 
 # 创建FastAPI应用实例
@@ -54,6 +59,7 @@ ROUTERS = [
     process_citi_daily_balance,
     process_csb_daily_balance,
     generate_account_file,
+    metrics,
 ]
 
 # 批量注册路由
@@ -117,6 +123,29 @@ async def startup_event():
     print(f"📚 API文档: http://localhost:8000/docs")
     print(f"❓ API帮助: http://localhost:8000/api/help")
 
+    # 创建全局共享的HTTP连接池
+    await http_client.start()
+    await graph_http.start()
+    print("✅ HTTP连接池已创建")
+
+    # 启动临时目录后台清理任务
+    await temp_janitor.start()
+    print("✅ 临时目录清理任务已启动")
+
+    # 统计已有任务目录的磁盘占用，超出配额时淘汰旧任务
+    await temp_store.start()
+    print("✅ 临时目录配额管理已启动")
+
+    # 预先解析配置的SharePoint站点（如果配置了）
+    try:
+        from app.api.endpoints.sharepoint import warm_up_site_cache
+
+        resolved = await warm_up_site_cache()
+        if resolved:
+            print(f"✅ 已预先解析 {resolved} 个SharePoint站点")
+    except Exception as e:
+        print(f"⚠️  SharePoint站点预解析失败: {e}")
+
     # 初始化Typst渲染器（如果需要）
     try:
         from app.api.endpoints.render_pdf_doc import init_typst_renderer
@@ -132,7 +161,12 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭时的清理操作"""
     print("👋 应用关闭")
-    # 这里可以添加清理临时文件等操作
+
+    # 释放HTTP连接池
+    await http_client.close()
+    await graph_http.close()
+    # 停止临时目录后台清理任务
+    await temp_janitor.stop()
 
 
 # 全局异常处理
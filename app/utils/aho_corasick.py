@@ -0,0 +1,65 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    多模式字符串匹配自动机（Aho-Corasick）
+
+    用所有模式串构建一棵字典树，并为每个节点计算失败指针（当前匹配的最长真后缀所在的节点），
+    之后对文本只扫描一遍即可找出其中出现的所有模式串，耗时与文本长度成正比，与模式串数量无关。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个节点结束的模式串编号（包括通过失败指针可达的后缀节点上结束的模式串）
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (pattern_id,)
+
+        # 按层（广度优先）计算失败指针，父节点的失败指针总是先于子节点确定
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail if fail != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        """返回文本中出现的所有模式串编号"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while True:
+                next_state = goto[state].get(char)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def __len__(self) -> int:
+        return len(self.patterns)
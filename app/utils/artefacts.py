@@ -0,0 +1,92 @@
+import os
+import time
+import uuid
+import asyncio
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from app.core.config import settings
+from app.utils.logger import logger
+from app.utils.cleaner import FEATHER_PREFIXES, cleanup_feather_files, temp_janitor
+
+
+class ArtefactRegistry:
+    """
+    R 脚本输出文件（dataroom 中的 feather 等）的登记表
+
+    调用 R 之前先分配一个唯一的输出路径并登记创建时间和所属请求，R 直接写入该路径，
+    Python 按所属请求直接取回，不再列出并排序整个 dataroom 目录。用完后释放（删除文件），
+    释放失败或进程中断遗留的文件由后台清理任务按前缀统一清理。
+    """
+
+    def __init__(self, directory: Path, prefixes: Iterable[str], max_age_seconds: float, retention_days: int):
+        self.directory = Path(directory)
+        self.prefixes = tuple(prefixes)
+        self.max_age_seconds = max_age_seconds
+        self.retention_days = retention_days
+        self._artefacts: Dict[str, Dict] = {}
+        self._stats = {"allocated": 0, "released": 0, "swept": 0}
+
+    def allocate(self, prefix: str, owner: str, suffix: str = ".feather") -> Path:
+        """
+        为请求分配一个输出文件路径并登记
+
+        :param prefix: 文件名前缀（如 hsbc_daily_cash_），必须是已知前缀，以便后台清理
+        :param owner: 所属请求的唯一标识
+        :param suffix: 文件扩展名
+        """
+        if prefix not in self.prefixes:
+            raise ValueError(f"未知的输出文件前缀: {prefix}")
+        if owner in self._artefacts:
+            raise ValueError(f"请求 {owner} 已分配输出文件: {self._artefacts[owner]['path']}")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{prefix}{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}{suffix}"
+        path = self.directory / name
+        self._artefacts[owner] = {"path": path, "prefix": prefix, "owner": owner, "created_at": time.time()}
+        self._stats["allocated"] += 1
+        return path
+
+    def lookup(self, owner: str) -> Optional[Dict]:
+        """按所属请求查找登记的输出文件"""
+        return self._artefacts.get(owner)
+
+    def release(self, owner: str):
+        """删除请求的输出文件并取消登记"""
+        artefact = self._artefacts.pop(owner, None)
+        if artefact is None:
+            return
+        self._stats["released"] += 1
+        try:
+            artefact["path"].unlink(missing_ok=True)
+            logger.info(f"已删除处理完成的输出文件: {artefact['path']}")
+        except OSError as e:
+            logger.warning(f"删除输出文件时出错，将由后台清理: {artefact['path']}, {str(e)}")
+
+    async def sweep(self) -> int:
+        """删除超时未释放的登记文件，以及目录中超过保留天数的遗留文件"""
+        cutoff = time.time() - self.max_age_seconds
+        expired = [owner for owner, artefact in self._artefacts.items() if artefact["created_at"] < cutoff]
+        deleted = 0
+        for owner in expired:
+            artefact = self._artefacts.pop(owner)
+            if os.path.exists(artefact["path"]):
+                await asyncio.to_thread(os.remove, artefact["path"])
+                deleted += 1
+        if self.directory.exists():
+            deleted += await asyncio.to_thread(cleanup_feather_files, str(self.directory), self.retention_days,
+                                               self.prefixes)
+        self._stats["swept"] += deleted
+        return deleted
+
+    def stats(self) -> Dict:
+        return {"registered": len(self._artefacts), **self._stats}
+
+
+# 全局R输出文件登记表，随临时目录清理任务定期清理
+artefact_registry = ArtefactRegistry(
+    directory=settings.DATAROOM_DIR,
+    prefixes=FEATHER_PREFIXES,
+    max_age_seconds=settings.ARTEFACT_MAX_AGE_HOURS * 3600,
+    retention_days=settings.ARTEFACT_RETENTION_DAYS,
+)
+temp_janitor.add_sweeper(artefact_registry.sweep)
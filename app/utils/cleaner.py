@@ -4,14 +4,23 @@ import os
 import time
 import shutil
 import glob
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, List, Optional, Union
 from datetime import datetime, timedelta
 from app.core.config import settings
 from app.utils.logger import logger
+from app.utils.http_cache import http_cache
+
+# 临时目录中需要长期保留的条目（远程文件缓存、清理索引），不按修改时间整体删除
+PERSISTENT_ENTRIES = {'.gitkeep', 'giin', 'http_cache', '.janitor.sqlite3'}
 
 
 def cleanup_old_temp_files(max_age_hours: int = 24):
     """
-    清理超过指定小时数的临时文件（后台任务）
+    全量扫描并清理超过指定小时数的临时文件（手动维护用，日常清理由 temp_janitor 负责）
 
     Args:
         max_age_hours: 文件保留时长（小时），默认24小时
@@ -38,8 +47,8 @@ def cleanup_old_temp_files(max_age_hours: int = 24):
         for entry in os.listdir(temp_dir):
             entry_path = os.path.join(temp_dir, entry)
 
-            # 跳过.gitkeep文件
-            if entry == '.gitkeep':
+            # 跳过.gitkeep文件和远程文件缓存
+            if entry in PERSISTENT_ENTRIES:
                 continue
 
             try:
@@ -71,14 +80,204 @@ def cleanup_old_temp_files(max_age_hours: int = 24):
     return {"deleted": deleted_count, "errors": error_count}
 
 
-def cleanup_feather_files(directory="dataroom", days_to_keep=7):
-    """清理指定目录下超过一定天数的feather文件"""
+class TempDirJanitor:
+    """
+    临时目录清理器
+
+    任务目录创建时写入一条过期记录（SQLite 索引），后台协程定期只取出已过期的记录删除，
+    不再每个请求都遍历并 stat 整个 TEMP_DIR。删除操作在线程中执行，且每删除一个目录后暂停一下，
+    避免与正在进行的请求争抢磁盘 I/O。索引丢失时可通过启动时的一次扫描重建。
+    """
+
+    def __init__(self, temp_dir: Path, ttl_seconds: float, interval_seconds: float,
+                 delete_pause_seconds: float, batch_size: int):
+        self.temp_dir = Path(temp_dir)
+        self.index_path = self.temp_dir / ".janitor.sqlite3"
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self.delete_pause_seconds = delete_pause_seconds
+        self.batch_size = batch_size
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[str], None]] = []
+        self._sweepers: List[Callable[[], Awaitable[int]]] = []
+        self._stats = {"deleted": 0, "errors": 0, "runs": 0, "last_run": None}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.temp_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False, isolation_level=None)
+            # 索引可以通过扫描重建，不需要每次写入都落盘
+            self._conn.execute("PRAGMA synchronous=OFF")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_dirs (path TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_task_dirs_expires ON task_dirs (expires_at)")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """注册条目移出索引（过期删除或手动清理）时的回调，参数为条目的绝对路径"""
+        self._listeners.append(callback)
+
+    def add_sweeper(self, sweeper: Callable[[], Awaitable[int]]):
+        """注册随清理任务定期执行的协程函数（例如清理其它目录的过期文件），返回删除数量"""
+        self._sweepers.append(sweeper)
+
+    def _notify_removed(self, path: str):
+        for callback in self._listeners:
+            try:
+                callback(path)
+            except Exception as e:
+                logger.error(f"[清理任务] 回调处理 {path} 时出错: {str(e)}")
+
+    def _register(self, path: Union[str, Path], ttl_seconds: Optional[float] = None):
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._execute("INSERT INTO task_dirs (path, expires_at) VALUES (?, ?) "
+                      "ON CONFLICT(path) DO UPDATE SET expires_at = excluded.expires_at",
+                      (str(Path(path).resolve()), expires_at))
+
+    def _unregister(self, path: Union[str, Path]) -> str:
+        path = str(Path(path).resolve())
+        self._execute("DELETE FROM task_dirs WHERE path = ?", (path,))
+        return path
+
+    async def register(self, path: Union[str, Path], ttl_seconds: Optional[float] = None):
+        """登记（或续期）一个任务目录，到期后由后台清理（SQLite 写入在线程中执行，不阻塞事件循环）"""
+        await asyncio.to_thread(self._register, path, ttl_seconds)
+
+    async def unregister(self, path: Union[str, Path]):
+        """任务目录已被其它逻辑删除时，移除其索引记录（回调在事件循环中执行）"""
+        path = await asyncio.to_thread(self._unregister, path)
+        self._notify_removed(path)
+
+    def backfill(self) -> int:
+        """扫描一次临时目录，为尚未登记的条目按修改时间补登记，返回补登记数量"""
+        indexed = {row[0] for row in self._execute("SELECT path FROM task_dirs")}
+        added = 0
+        for entry in os.scandir(self.temp_dir):
+            if entry.name in PERSISTENT_ENTRIES or entry.name.startswith('.'):
+                continue
+            path = str(Path(entry.path).resolve())
+            if path in indexed:
+                continue
+            expires_at = entry.stat().st_mtime + self.ttl_seconds
+            self._execute("INSERT OR IGNORE INTO task_dirs (path, expires_at) VALUES (?, ?)", (path, expires_at))
+            added += 1
+        logger.info(f"[清理任务] 索引重建完成，补登记 {added} 个临时条目")
+        return added
+
+    async def run_once(self) -> dict:
+        """删除已过期的条目，返回本次删除数量、其中过期任务目录的数量和错误数量"""
+        deleted_count = 0
+        error_count = 0
+        due = await asyncio.to_thread(
+            self._execute, "SELECT path FROM task_dirs WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+            (time.time(), self.batch_size))
+        for (path,) in due:
+            try:
+                if os.path.isdir(path):
+                    await asyncio.to_thread(shutil.rmtree, path)
+                elif os.path.exists(path):
+                    await asyncio.to_thread(os.remove, path)
+                await asyncio.to_thread(self._execute, "DELETE FROM task_dirs WHERE path = ?", (path,))
+                self._notify_removed(path)
+                deleted_count += 1
+                logger.debug(f"[清理任务] 删除过期临时条目: {path}")
+            except Exception as e:
+                error_count += 1
+                logger.error(f"[清理任务] 清理 {path} 时出错: {str(e)}")
+            # 限速：每次删除后让出磁盘 I/O
+            await asyncio.sleep(self.delete_pause_seconds)
+        task_dir_count = deleted_count
+
+        # 远程文件缓存只清理长期未使用的条目
+        deleted_count += await asyncio.to_thread(http_cache.prune, settings.HTTP_CACHE_MAX_AGE)
+
+        for sweeper in self._sweepers:
+            try:
+                deleted_count += await sweeper()
+            except Exception as e:
+                error_count += 1
+                logger.error(f"[清理任务] 执行 {getattr(sweeper, '__qualname__', sweeper)} 时出错: {str(e)}")
+
+        self._stats["deleted"] += deleted_count
+        self._stats["errors"] += error_count
+        self._stats["runs"] += 1
+        self._stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+        if deleted_count or error_count:
+            logger.info(f"[清理任务] 删除了 {deleted_count} 个过期条目, 有 {error_count} 个错误")
+        return {"deleted": deleted_count, "task_dirs": task_dir_count, "errors": error_count}
+
+    async def _loop(self):
+        while True:
+            try:
+                result = await self.run_once()
+                # 过期任务目录本批次删满时说明还有积压，立即继续（缓存和其它清理的数量不计入）
+                if result["task_dirs"] < self.batch_size:
+                    await asyncio.sleep(self.interval_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[清理任务] 运行异常: {str(e)}", exc_info=True)
+                await asyncio.sleep(self.interval_seconds)
+
+    async def start(self):
+        """在应用启动时重建索引并启动后台清理协程"""
+        await asyncio.to_thread(self.backfill)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """在应用关闭时停止后台清理协程"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        pending = self._execute("SELECT COUNT(*), MIN(expires_at) FROM task_dirs")[0]
+        return {
+            "indexed": pending[0],
+            "next_expiry": datetime.fromtimestamp(pending[1]).isoformat(timespec="seconds") if pending[1] else None,
+            **self._stats,
+        }
+
+
+# 全局临时目录清理器
+temp_janitor = TempDirJanitor(
+    temp_dir=settings.TEMP_DIR,
+    ttl_seconds=settings.TEMP_FILE_TTL_HOURS * 3600,
+    interval_seconds=settings.JANITOR_INTERVAL_SECONDS,
+    delete_pause_seconds=settings.JANITOR_DELETE_PAUSE_SECONDS,
+    batch_size=settings.JANITOR_BATCH_SIZE,
+)
+
+
+# R 脚本输出到 dataroom 的 feather 文件前缀
+FEATHER_PREFIXES = ("citi_monthly_statement_", "hsbc_daily_cash_")
+
+
+def cleanup_feather_files(directory="dataroom", days_to_keep=7, prefixes: Iterable[str] = FEATHER_PREFIXES):
+    """清理指定目录下超过一定天数的feather文件（按文件名前缀匹配）"""
     try:
         # 获取当前时间
         now = datetime.now()
         # 查找目录下所有feather文件
-        pattern = os.path.join(directory, "citi_monthly_statement_*.feather")
-        feather_files = glob.glob(pattern)
+        feather_files = []
+        for prefix in prefixes:
+            feather_files.extend(glob.glob(os.path.join(directory, f"{prefix}*.feather")))
 
         deleted_count = 0
         for file_path in feather_files:
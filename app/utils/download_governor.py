@@ -0,0 +1,218 @@
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from enum import IntEnum
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadPriority(IntEnum):
+    """下载优先级，数值越小越优先（例如日结现金任务优先于月结单归档）"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class PrioritySemaphore:
+    """
+    支持优先级排队的信号量
+
+    没有空闲名额时请求进入等待堆，释放名额时直接交给优先级最高、等待最久的请求。
+    """
+
+    def __init__(self, value: int):
+        self._limit = value
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    @property
+    def idle(self) -> bool:
+        """名额全部空闲且没有等待者"""
+        return self._value == self._limit and not self.waiting
+
+    async def acquire(self, priority: int = DownloadPriority.NORMAL):
+        if self._value > 0 and not self.waiting:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经拿到名额但随即被取消时，需要把名额还回去
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._value += 1
+
+
+class DownloadLease:
+    """
+    一次下载持有的名额
+
+    重试前的退避等待期间通过 sleep() 让出名额，等待结束后按原优先级重新排队获取，
+    避免一个反复失败的下载长时间占用主机和全局名额。
+    """
+
+    def __init__(self, governor: "DownloadGovernor", host: str, priority: DownloadPriority):
+        self.governor = governor
+        self.host = host
+        self.priority = priority
+        self.held = False
+
+    async def acquire(self):
+        await self.governor._acquire(self.host, self.priority)
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.governor._release(self.host)
+
+    async def sleep(self, delay: float):
+        """让出名额等待 delay 秒后重新获取；重新获取时被取消则不再持有名额"""
+        self.release()
+        await asyncio.sleep(delay)
+        await self.acquire()
+
+    def sibling(self) -> "DownloadLease":
+        """同一下载额外的连接（例如分段下载的其它分段）使用的名额，同样计入主机和全局并发，需要单独获取和释放"""
+        return DownloadLease(self.governor, self.host, self.priority)
+
+
+class DownloadGovernor:
+    """
+    全局 + 按主机的下载并发控制
+
+    同一主机的并发连接数不超过 per_host_limit，所有下载的并发连接数不超过 global_limit（分段下载的每个分段各占一个名额），
+    超出的请求按优先级排队，并记录排队等待时间。
+    """
+
+    def __init__(self, global_limit: int, per_host_limit: int):
+        self.global_limit = global_limit
+        self.per_host_limit = per_host_limit
+        self._global = PrioritySemaphore(global_limit)
+        self._hosts: Dict[str, PrioritySemaphore] = {}
+        self._active: Dict[str, int] = {}
+        self._stats = {
+            "acquired": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+        self._priority_stats = {priority.name.lower(): {"acquired": 0, "total_wait_seconds": 0.0}
+                                for priority in DownloadPriority}
+
+    def _host_semaphore(self, host: str) -> PrioritySemaphore:
+        if host not in self._hosts:
+            self._hosts[host] = PrioritySemaphore(self.per_host_limit)
+        return self._hosts[host]
+
+    def _record_wait(self, priority: DownloadPriority, wait: float):
+        self._stats["acquired"] += 1
+        self._stats["total_wait_seconds"] += wait
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], wait)
+        priority_stats = self._priority_stats[priority.name.lower()]
+        priority_stats["acquired"] += 1
+        priority_stats["total_wait_seconds"] += wait
+
+    @asynccontextmanager
+    async def slot(self, url: str, priority: DownloadPriority = DownloadPriority.NORMAL):
+        """获取一个下载名额，返回 DownloadLease，退出时释放（退避期间可通过 lease.sleep() 临时让出）"""
+        lease = DownloadLease(self, urlparse(url).hostname or "", priority)
+        await lease.acquire()
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    async def _acquire(self, host: str, priority: DownloadPriority):
+        """先占主机名额再占全局名额，避免等待全局名额时阻塞其它主机"""
+        host_semaphore = self._host_semaphore(host)
+        start = time.monotonic()
+
+        try:
+            await host_semaphore.acquire(priority)
+        except BaseException:
+            self._drop_if_idle(host)
+            raise
+        try:
+            await self._global.acquire(priority)
+        except BaseException:
+            host_semaphore.release()
+            self._drop_if_idle(host)
+            raise
+
+        wait = time.monotonic() - start
+        self._record_wait(priority, wait)
+        if wait > 1:
+            logger.info(f"下载排队等待 {wait:.2f} 秒: host={host}, priority={priority.name}")
+
+        self._active[host] = self._active.get(host, 0) + 1
+
+    def _release(self, host: str):
+        self._active[host] -= 1
+        self._global.release()
+        self._hosts[host].release()
+        self._drop_if_idle(host)
+
+    def _drop_if_idle(self, host: str):
+        """主机没有进行中和排队的下载时移除其信号量，避免不同主机的条目无限累积"""
+        host_semaphore = self._hosts.get(host)
+        if host_semaphore is not None and host_semaphore.idle:
+            del self._hosts[host]
+            self._active.pop(host, None)
+
+    def stats(self) -> Dict:
+        """返回并发控制的排队和等待时间统计"""
+        acquired = self._stats["acquired"]
+        priorities = {}
+        for name, item in self._priority_stats.items():
+            priorities[name] = {
+                "acquired": item["acquired"],
+                "avg_wait_seconds": round(item["total_wait_seconds"] / item["acquired"], 4) if item["acquired"] else 0.0,
+            }
+        return {
+            "global_limit": self.global_limit,
+            "per_host_limit": self.per_host_limit,
+            "active": sum(self._active.values()),
+            "waiting": self._global.waiting + sum(semaphore.waiting for semaphore in self._hosts.values()),
+            "acquired": acquired,
+            "avg_wait_seconds": round(self._stats["total_wait_seconds"] / acquired, 4) if acquired else 0.0,
+            "max_wait_seconds": round(self._stats["max_wait_seconds"], 4),
+            "priorities": priorities,
+            "hosts": {host: {"active": self._active.get(host, 0), "waiting": semaphore.waiting}
+                      for host, semaphore in self._hosts.items()},
+        }
+
+
+def parse_priority(value: Optional[str]) -> DownloadPriority:
+    """将请求中的优先级字符串（high/normal/low）转换为 DownloadPriority"""
+    if not value:
+        return DownloadPriority.NORMAL
+    return DownloadPriority[value.upper()]
+
+
+# 全局下载并发控制器
+download_governor = DownloadGovernor(
+    global_limit=settings.DOWNLOAD_MAX_CONCURRENCY,
+    per_host_limit=settings.DOWNLOAD_MAX_CONCURRENCY_PER_HOST,
+)
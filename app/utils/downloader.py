@@ -1,61 +1,412 @@
 import os
+import time
+import random
+import hashlib
+import asyncio
 import aiohttp
-import aiofiles
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
 from app.core.config import settings
+from app.utils.http_client import http_client
+from app.utils.download_governor import DownloadLease, DownloadPriority, download_governor
 
 logger = logging.getLogger(__name__)
 
+# 可重试的HTTP状态码（服务端临时错误或限流）
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
 
-async def download_file(url: str, save_path: str) -> Dict:
-    """下载文件并保存到指定路径"""
+
+class DownloadError(Exception):
+    """下载失败且不应重试（例如404、超过大小限制）"""
+
+
+class TransientDownloadError(Exception):
+    """临时性下载错误，可以重试（可能从已下载的位置续传）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _SegmentFallback(Exception):
+    """分段下载无法继续（例如文件在分段之间发生变化），需要退回单连接下载"""
+
+
+class _UseSegments(Exception):
+    """首次响应表明文件超过分段阈值且服务端支持 Range，放弃该响应改用分段下载"""
+
+    def __init__(self, state: "_DownloadState"):
+        super().__init__("文件较大，改用分段下载")
+        self.state = state
+
+
+class _DownloadState:
+    """记录一次下载在多次重试之间需要保持的信息"""
+
+    def __init__(self):
+        self.offset = 0  # 已写入磁盘的字节数
+        self.total_size: Optional[int] = None
+        self.accept_ranges = False
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.sha256 = hashlib.sha256()  # 与 offset 同步更新的摘要
+
+    @property
+    def validator(self) -> Optional[str]:
+        """用于 If-Range 的校验值；弱ETag不能用于 If-Range，此时退回 Last-Modified"""
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def can_resume(self) -> bool:
+        return self.offset > 0 and self.accept_ranges and self.validator is not None
+
+    def remember(self, response: aiohttp.ClientResponse):
+        """
+        记录首次完整响应的校验信息
+
+        带 Content-Encoding（gzip/deflate 等）的响应由连接池自动解压，Content-Length 和 Range 都按压缩后的字节计算，
+        与写入磁盘的字节数对不上，此时不校验总长度，也不续传或分段下载
+        """
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        encoded = response.headers.get("Content-Encoding", "identity").lower() != "identity"
+        self.accept_ranges = not encoded and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        content_length = response.headers.get("Content-Length")
+        self.total_size = int(content_length) if content_length and not encoded else None
+
+    def matches(self, response: aiohttp.ClientResponse) -> bool:
+        """检查续传响应是否来自同一版本的文件"""
+        if self.etag and response.headers.get("ETag") != self.etag:
+            return False
+        if self.last_modified and response.headers.get("Last-Modified") != self.last_modified:
+            return False
+        return True
+
+
+class _CoalescingWriter:
+    """
+    合并小块写入：数据先累积在内存缓冲区，达到 DOWNLOAD_WRITE_BUFFER 后一次性在线程中写盘
+
+    每次写盘都要切换到线程池执行，逐块写入时一个 100MB 文件需要上万次线程切换；
+    合并为数 MB 的批次后只需几十次。write_func(data, position) 负责实际写入。
+    """
+
+    def __init__(self, write_func: Callable[[bytes, int], object], position: int = 0):
+        self.write_func = write_func
+        self.position = position  # 下一次写盘的文件位置
+        self.buffer = bytearray()
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= settings.DOWNLOAD_WRITE_BUFFER:
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        await asyncio.to_thread(self.write_func, data, self.position)
+        self.position += len(data)
+
+
+async def _iter_adaptive(content: aiohttp.StreamReader) -> AsyncIterator[bytes]:
+    """自适应块大小读取：每次读满时块大小翻倍，直到 DOWNLOAD_CHUNK_MAX"""
+    chunk_size = settings.DOWNLOAD_CHUNK_MIN
+    while True:
+        chunk = await content.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+        if len(chunk) == chunk_size and chunk_size < settings.DOWNLOAD_CHUNK_MAX:
+            chunk_size *= 2
+
+
+def _hash_file(path: str):
+    """读取磁盘上的文件计算 sha256（用于续传校正和分段下载等无法按顺序计算摘要的场景）"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.DOWNLOAD_WRITE_BUFFER), b""):
+            sha256.update(block)
+    return sha256
+
+
+def _remove_partial(save_path: str):
+    """删除无法续传的未完成文件"""
+    try:
+        os.remove(save_path)
+    except FileNotFoundError:
+        pass
+
+
+def _retry_after_seconds(response: aiohttp.ClientResponse) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return float(value)
+    return None
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指数退避（带随机抖动），服务端给出 Retry-After 时优先使用"""
+    if retry_after is not None:
+        return min(retry_after, settings.DOWNLOAD_RETRY_BACKOFF_MAX)
+    delay = min(settings.DOWNLOAD_RETRY_BACKOFF_MAX, settings.DOWNLOAD_RETRY_BACKOFF * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def _fetch_once(url: str, save_path: str, state: _DownloadState, segmentable: bool = False):
+    """
+    执行一次下载请求，尽可能从 state.offset 处续传
+
+    segmentable 为 True 时，如果完整响应的头部表明文件超过 DOWNLOAD_SEGMENT_THRESHOLD 且支持 Range，
+    不读取响应体，抛出 _UseSegments 改用分段下载；否则直接使用该响应，不需要额外的探测请求。
+    """
+    headers = {}
+    if state.offset > 0 and os.path.getsize(save_path) != state.offset:
+        # 以磁盘上实际写入的字节数为准，重新计算已下载部分的摘要
+        state.offset = os.path.getsize(save_path)
+        state.sha256 = await asyncio.to_thread(_hash_file, save_path)
+    resuming = state.can_resume()
+    if resuming:
+        headers["Range"] = f"bytes={state.offset}-"
+        headers["If-Range"] = state.validator
+        logger.info(f"从第 {state.offset} 字节处续传: {url}")
+
+    timeout = http_client.timeout(total=settings.DOWNLOAD_TIMEOUT)
+    async with http_client.session.get(url, headers=headers, timeout=timeout) as response:
+        if response.status in RETRYABLE_STATUS:
+            raise TransientDownloadError(f"HTTP状态码: {response.status}", _retry_after_seconds(response))
+
+        if response.status == 206 and resuming:
+            content_range = response.headers.get("Content-Range", "")
+            if not state.matches(response) or not content_range.startswith(f"bytes {state.offset}-"):
+                # 文件在两次请求之间发生了变化，丢弃已下载部分重新开始
+                logger.warning(f"续传响应与原文件不一致，重新下载: {url}")
+                state.offset = 0
+                raise TransientDownloadError("续传校验失败，文件已变更")
+            mode = "ab"
+        elif response.status == 200:
+            if resuming:
+                # 服务端忽略了 Range 或 If-Range 校验失败（文件已变更），需要从头下载
+                logger.warning(f"服务端未接受续传请求，从头重新下载: {url}")
+            state.offset = 0
+            state.sha256 = hashlib.sha256()
+            state.remember(response)
+            mode = "wb"
+        else:
+            raise DownloadError(f"下载失败，HTTP状态码: {response.status}")
+
+        # 获取文件大小
+        if state.total_size and state.total_size > settings.MAX_DOWNLOAD_SIZE:
+            logger.error(f"文件大小超过限制: {state.total_size} > {settings.MAX_DOWNLOAD_SIZE}")
+            raise DownloadError("文件大小超过限制")
+
+        if segmentable and mode == "wb" and state.accept_ranges \
+                and state.total_size and state.total_size >= settings.DOWNLOAD_SEGMENT_THRESHOLD:
+            response.close()
+            raise _UseSegments(state)
+
+        # 保存文件：读取、计数、摘要在同一个循环内完成，写盘按批次合并
+        with open(save_path, mode) as f:
+            writer = _CoalescingWriter(lambda data, position: f.write(data), state.offset)
+            try:
+                async for chunk in _iter_adaptive(response.content):
+                    state.offset += len(chunk)
+
+                    # 检查下载大小是否超过限制
+                    if state.offset > settings.MAX_DOWNLOAD_SIZE:
+                        logger.error(f"下载中止，文件大小超过限制: {state.offset}")
+                        raise DownloadError("文件大小超过限制")
+
+                    state.sha256.update(chunk)
+                    await writer.write(chunk)
+            finally:
+                # 中断时也把已收到的数据写盘，以便续传
+                await writer.flush()
+
+    if state.total_size is not None and state.offset != state.total_size:
+        raise TransientDownloadError(f"下载不完整: {state.offset}/{state.total_size} 字节")
+
+
+async def _download_single(url: str, save_path: str, sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+                           segmentable: bool = False) -> tuple[int, str]:
+    """
+    单连接下载，失败时按指数退避重试并尽可能续传，返回 (请求次数, sha256)
+
+    sleep 用于退避等待，download_file 传入 DownloadLease.sleep，等待期间让出下载名额。
+    segmentable 为 True 时第一次请求可能抛出 _UseSegments（见 _fetch_once）。
+    """
+    state = _DownloadState()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            await _fetch_once(url, save_path, state, segmentable and attempt == 1)
+            return attempt, state.sha256.hexdigest()
+        except (TransientDownloadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt > settings.DOWNLOAD_MAX_RETRIES:
+                logger.error(f"单连接下载已重试 {attempt - 1} 次仍失败")
+                raise
+            if state.offset > 0 and not state.can_resume():
+                # 服务端不支持续传，已下载的部分无法复用
+                _remove_partial(save_path)
+                state.offset = 0
+                state.sha256 = hashlib.sha256()
+            delay = _backoff_delay(attempt, getattr(e, "retry_after", None))
+            logger.warning(f"下载中断({type(e).__name__}: {e})，{delay:.1f}秒后进行第 {attempt} 次重试，"
+                           f"已下载 {state.offset} 字节")
+            await sleep(delay)
+
+
+async def _fetch_segment(url: str, fd: int, start: int, end: int, probe: _DownloadState,
+                         lease: DownloadLease) -> int:
+    """
+    下载 [start, end] 字节区间并按位置写入文件，失败时从本段已写入的位置续传
+
+    调用方已持有 lease；退避等待期间通过 lease.sleep 让出名额。
+    """
+    position = start
+    attempt = 0
+    while True:
+        attempt += 1
+        headers = {"Range": f"bytes={position}-{end}"}
+        if probe.validator:
+            headers["If-Range"] = probe.validator
+        try:
+            timeout = http_client.timeout(total=settings.DOWNLOAD_TIMEOUT)
+            async with http_client.session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status in RETRYABLE_STATUS:
+                    raise TransientDownloadError(f"HTTP状态码: {response.status}", _retry_after_seconds(response))
+                if response.status != 206 or not probe.matches(response):
+                    raise _SegmentFallback(f"分段请求返回 {response.status}，文件可能已变更")
+                writer = _CoalescingWriter(lambda data, offset: os.pwrite(fd, data, offset), position)
+                try:
+                    async for chunk in _iter_adaptive(response.content):
+                        position += len(chunk)
+                        await writer.write(chunk)
+                finally:
+                    await writer.flush()
+            if position != end + 1:
+                raise TransientDownloadError(f"分段下载不完整: {position - start}/{end - start + 1} 字节")
+            return position - start
+        except (TransientDownloadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt > settings.DOWNLOAD_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt, getattr(e, "retry_after", None))
+            logger.warning(f"分段 {start}-{end} 下载中断({type(e).__name__}: {e})，{delay:.1f}秒后从 {position} 续传")
+            await lease.sleep(delay)
+
+
+async def _fetch_extra_segment(url: str, fd: int, start: int, end: int, probe: _DownloadState,
+                               lease: DownloadLease) -> int:
+    """除第一个分段外，每个分段单独获取一个名额（计入主机并发限制），完成后释放"""
+    await lease.acquire()
+    try:
+        return await _fetch_segment(url, fd, start, end, probe, lease)
+    finally:
+        lease.release()
+
+
+async def _download_segmented(url: str, save_path: str, probe: _DownloadState, lease: DownloadLease):
+    """
+    将文件分为 N 段并发下载到预分配的文件中，完成后校验总大小
+
+    第一个分段使用本次下载已持有的 lease，其它分段各自排队获取名额，分段数不超过主机并发上限。
+    """
+    total = probe.total_size
+    segment_count = min(settings.DOWNLOAD_SEGMENTS, lease.governor.per_host_limit,
+                        max(1, total // settings.DOWNLOAD_SEGMENT_MIN_SIZE))
+    segment_size = -(-total // segment_count)
+    ranges = [(start, min(start + segment_size, total) - 1) for start in range(0, total, segment_size)]
+    logger.info(f"使用分段下载: 总大小 {total} 字节, {len(ranges)} 个分段")
+
+    fd = os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # 预分配文件空间，各分段按位置写入
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, total)
+        else:
+            os.ftruncate(fd, total)
+        tasks = [asyncio.create_task(_fetch_segment(url, fd, start, end, probe, lease) if index == 0 else
+                                     _fetch_extra_segment(url, fd, start, end, probe, lease.sibling()))
+                 for index, (start, end) in enumerate(ranges)]
+        try:
+            written = sum(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+
+    if written != total or os.path.getsize(save_path) != total:
+        raise TransientDownloadError(f"分段下载大小校验失败: {written}/{total} 字节")
+
+
+async def download_file(url: str, save_path: str, priority: DownloadPriority = DownloadPriority.NORMAL) -> Dict:
+    """
+    下载文件并保存到指定路径
+
+    下载受全局和按主机的并发限制，超出时按 priority 排队。
+    先发送普通 GET：响应头表明文件超过 DOWNLOAD_SEGMENT_THRESHOLD 且支持 Range 时放弃该响应，分 N 段并发下载，
+    否则直接使用该响应单连接下载。
+    遇到网络中断、超时或服务端临时错误时按指数退避重试（最多 DOWNLOAD_MAX_RETRIES 次）；
+    服务端支持 Range 时从已写入磁盘的位置续传，并通过 ETag/Last-Modified（If-Range）确保续传的是同一版本的文件。
+    """
+    async with download_governor.slot(url, priority) as lease:
+        return await _download(url, save_path, lease)
+
+
+async def _download(url: str, save_path: str, lease: DownloadLease) -> Dict:
+    """执行下载并返回结果字典，失败时删除未完成的文件；退避等待和分段下载的名额都通过 lease 管理"""
+    start_time = time.monotonic()
+    mode = "single"
+    attempts = 1
     try:
         # 确保目录存在
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
-        # 设置超时
-        timeout = aiohttp.ClientTimeout(total=settings.DOWNLOAD_TIMEOUT)
-
-        # 开始下载
+        # 开始下载（复用全局连接池）
         logger.info(f"开始下载文件: {url}")
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.error(f"下载失败，HTTP状态码: {response.status}")
-                    return {"success": False, "error": f"下载失败，HTTP状态码: {response.status}"}
-
-                # 获取文件大小
-                content_length = int(response.headers.get("Content-Length", 0))
-                if content_length > settings.MAX_DOWNLOAD_SIZE:
-                    logger.error(f"文件大小超过限制: {content_length} > {settings.MAX_DOWNLOAD_SIZE}")
-                    return {"success": False, "error": "文件大小超过限制"}
-
-                # 保存文件
-                async with aiofiles.open(save_path, "wb") as f:
-                    downloaded = 0
-                    async for chunk in response.content.iter_chunked(8192):
-                        downloaded += len(chunk)
-                        await f.write(chunk)
-
-                        # 检查下载大小是否超过限制
-                        if downloaded > settings.MAX_DOWNLOAD_SIZE:
-                            logger.error(f"下载中止，文件大小超过限制: {downloaded}")
-                            await f.close()
-                            os.remove(save_path)
-                            return {"success": False, "error": "文件大小超过限制"}
+        segmentable = settings.DOWNLOAD_SEGMENTS > 1 and hasattr(os, "pwrite")
+        try:
+            attempts, sha256 = await _download_single(url, save_path, lease.sleep, segmentable)
+        except _UseSegments as e:
+            try:
+                await _download_segmented(url, save_path, e.state, lease)
+                mode = "segmented"
+                sha256 = (await asyncio.to_thread(_hash_file, save_path)).hexdigest()
+            except _SegmentFallback as fallback:
+                logger.warning(f"分段下载中止，改用单连接下载: {fallback}")
+                attempts, sha256 = await _download_single(url, save_path, lease.sleep)
 
         # 检查文件是否存在且大小大于0
         if not os.path.exists(save_path) or os.path.getsize(save_path) == 0:
             logger.error(f"下载完成，但文件为空或不存在: {save_path}")
             return {"success": False, "error": "下载的文件为空或不存在"}
 
-        logger.info(f"文件下载完成: {save_path}, 大小: {os.path.getsize(save_path)} 字节")
-        return {"success": True, "path": save_path, "size": os.path.getsize(save_path)}
+        file_size = os.path.getsize(save_path)
+        elapsed = max(time.monotonic() - start_time, 1e-6)
+        logger.info(f"文件下载完成: {save_path}, 大小: {file_size} 字节, 方式: {mode}, 请求次数: {attempts}, "
+                    f"耗时: {elapsed:.2f}秒, 吞吐: {file_size / elapsed / (1024 * 1024):.2f} MB/s")
+        return {"success": True, "path": save_path, "size": file_size, "sha256": sha256, "attempts": attempts,
+                "mode": mode}
 
+    except DownloadError as e:
+        logger.error(f"下载失败: {str(e)}")
+        _remove_partial(save_path)
+        return {"success": False, "error": str(e)}
+    except TransientDownloadError as e:
+        logger.error(f"下载失败: {str(e)}")
+        _remove_partial(save_path)
+        return {"success": False, "error": f"下载失败: {str(e)}"}
     except aiohttp.ClientError as e:
         logger.error(f"下载出现客户端错误: {str(e)}")
+        _remove_partial(save_path)
         return {"success": False, "error": f"下载错误: {str(e)}"}
     except Exception as e:
         logger.error(f"下载过程中发生异常: {str(e)}")
+        _remove_partial(save_path)
         return {"success": False, "error": f"下载异常: {str(e)}"}
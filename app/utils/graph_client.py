@@ -0,0 +1,281 @@
+import json
+import time
+import base64
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+import aiohttp
+from app.core.config import settings
+from app.utils.http_client import HttpClientPool
+from app.utils.msal_token_cache import msal_token_cache
+
+logger = logging.getLogger(__name__)
+
+
+class GraphResponse:
+    """Graph 响应（已读取完整响应体），接口与 requests.Response 的常用部分一致"""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = body
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content) if self.content else {}
+
+
+# Graph 限流时返回的状态码
+THROTTLE_STATUS = {429, 503}
+
+
+def retry_after_seconds(headers: Dict[str, str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数）"""
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if value and str(value).isdigit():
+        return float(value)
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指数退避（带随机抖动），服务端给出 Retry-After 时优先使用"""
+    if retry_after is not None:
+        return min(retry_after, settings.GRAPH_RETRY_BACKOFF_MAX)
+    delay = min(settings.GRAPH_RETRY_BACKOFF_MAX, settings.GRAPH_RETRY_BACKOFF * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制（AIMD）
+
+    每次成功后并发上限增加 1/limit（约每轮增加 1），被限流时减半（同一秒内多次限流只减一次），
+    上限在 [1, max_limit] 之间。
+    """
+
+    def __init__(self, initial_limit: int, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = float(min(initial_limit, max_limit))
+        self.in_flight = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= 1:
+            self.limit = max(1.0, self.limit / 2)
+            self._last_decrease = now
+
+    def stats(self) -> Dict:
+        return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "throttled": self.throttled}
+
+
+class GraphClient:
+    """
+    Microsoft Graph 异步客户端
+
+    基于独立的共享连接池（与文件下载的连接池分开），所有请求都有明确的超时时间，
+    并通过信号量限制同时进行的 Graph 请求数，避免大量上传同时占满连接或触发限流。
+
+    Graph 按租户限流：每个租户有一个自适应并发限制，收到 429/503 时减半，成功时逐步恢复；
+    被限流的请求按 Retry-After（没有时按带抖动的指数退避）等待后重试。
+
+    带访问令牌的请求返回 401 时（令牌在过期前被撤销或轮换），通过 token_renewer 换取新令牌后重试一次。
+    """
+
+    def __init__(self, pool: HttpClientPool, base_url: str, max_concurrency: int,
+                 request_timeout: float, upload_timeout: float, max_retries: int = 0,
+                 tenant_concurrency: Optional[int] = None,
+                 token_renewer: Optional[Callable[[str], Awaitable[Optional[str]]]] = None):
+        self.pool = pool
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.upload_timeout = upload_timeout
+        self.max_retries = max_retries
+        self.tenant_concurrency = tenant_concurrency or max_concurrency
+        self.token_renewer = token_renewer
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._tenant_keys: Dict[str, str] = {}
+        self._stats = {"requests": 0, "errors": 0, "active": 0, "throttled": 0, "retries": 0,
+                       "retry_wait_seconds": 0.0, "token_renewals": 0}
+
+    def url(self, path: str) -> str:
+        """将相对路径（如 /drives/{id}/root）拼接为完整的 Graph URL"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _tenant_key(self, url: str, headers: Optional[Dict[str, str]]) -> str:
+        """
+        确定请求所属的租户：带访问令牌的请求取令牌中的 tid，
+        上传会话等预授权URL（不带令牌）按主机名（{tenant}.sharepoint.com）区分
+        """
+        authorization = (headers or {}).get("Authorization", "")
+        if not authorization.startswith("Bearer "):
+            return urlparse(url).hostname or "default"
+        token = authorization[len("Bearer "):]
+        if token not in self._tenant_keys:
+            try:
+                payload = token.split(".")[1]
+                claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+                tenant = claims.get("tid") or "default"
+            except (IndexError, ValueError):
+                tenant = "default"
+            if len(self._tenant_keys) > 1000:
+                self._tenant_keys.clear()
+            self._tenant_keys[token] = tenant
+        return self._tenant_keys[token]
+
+    def _limiter(self, key: str) -> AdaptiveLimiter:
+        if key not in self._limiters:
+            self._limiters[key] = AdaptiveLimiter(self.tenant_concurrency, self.max_concurrency)
+        return self._limiters[key]
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                      json_body=None, data=None, timeout: Optional[float] = None) -> GraphResponse:
+        """
+        发送 Graph 请求并读取完整响应，被限流(429/503)时等待后重试
+
+        令牌被拒绝(401)时换取新令牌并重试一次，新令牌直接写回 headers，
+        调用方后续使用同一个 headers 的请求也会带上新令牌。
+
+        :param method: HTTP 方法
+        :param url: 完整URL或相对于 base_url 的路径
+        :param headers: 请求头
+        :param json_body: JSON 请求体
+        :param data: 二进制请求体（上传文件内容）
+        :param timeout: 总超时时间(秒)，默认普通请求使用 request_timeout，带二进制请求体时使用 upload_timeout
+        """
+        if timeout is None:
+            timeout = self.upload_timeout if data is not None else self.request_timeout
+        limiter = self._limiter(self._tenant_key(self.url(url), headers))
+        attempt = 0
+        renewed = False
+        while True:
+            # 先占租户名额再占全局名额，避免等待某个被限流租户时占住全局名额
+            async with limiter:
+                response = await self._send(method, url, headers, json_body, data, timeout)
+
+            authorization = (headers or {}).get("Authorization", "")
+            if response.status_code == 401 and not renewed and self.token_renewer is not None \
+                    and authorization.startswith("Bearer "):
+                renewed = True
+                token = await self.token_renewer(authorization[len("Bearer "):])
+                if token:
+                    self._stats["token_renewals"] += 1
+                    headers["Authorization"] = f"Bearer {token}"
+                    logger.warning(f"Graph 访问令牌被拒绝(401)，已重新获取令牌后重试: {method} {self.url(url)}")
+                    continue
+
+            if response.status_code not in THROTTLE_STATUS:
+                limiter.on_success()
+                return response
+
+            self._stats["throttled"] += 1
+            limiter.on_throttle()
+            if attempt >= self.max_retries:
+                return response
+            attempt += 1
+            delay = backoff_delay(attempt, retry_after_seconds(response.headers))
+            self._stats["retries"] += 1
+            self._stats["retry_wait_seconds"] += delay
+            logger.warning(f"Graph 请求被限流({response.status_code})，{delay:.1f} 秒后第 {attempt} 次重试: "
+                           f"{method} {self.url(url)}")
+            await asyncio.sleep(delay)
+
+    async def _send(self, method: str, url: str, headers: Optional[Dict[str, str]], json_body, data,
+                    timeout: float) -> GraphResponse:
+        async with self.semaphore:
+            self._stats["requests"] += 1
+            self._stats["active"] += 1
+            try:
+                async with self.pool.session.request(method, self.url(url), headers=headers, json=json_body,
+                                                     data=data, timeout=self.pool.timeout(total=timeout)) as response:
+                    body = await response.read()
+                    return GraphResponse(response.status, dict(response.headers), body)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._stats["errors"] += 1
+                raise
+            finally:
+                self._stats["active"] -= 1
+
+    async def get(self, url: str, **kwargs) -> GraphResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> GraphResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> GraphResponse:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> GraphResponse:
+        return await self.request("PATCH", url, **kwargs)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["retry_wait_seconds"] = round(stats["retry_wait_seconds"], 2)
+        return {
+            "max_concurrency": self.max_concurrency,
+            **stats,
+            "tenants": {key: limiter.stats() for key, limiter in self._limiters.items()},
+            "pool": self.pool.stats(),
+        }
+
+
+# Graph 专用连接池
+graph_http = HttpClientPool(
+    name="graph",
+    limit=settings.GRAPH_POOL_LIMIT,
+    limit_per_host=settings.GRAPH_POOL_LIMIT,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    sock_read_timeout=settings.HTTP_SOCK_READ_TIMEOUT,
+)
+
+# 全局 Graph 客户端
+graph_client = GraphClient(
+    pool=graph_http,
+    base_url=settings.GRAPH_API_BASE,
+    max_concurrency=settings.GRAPH_MAX_CONCURRENCY,
+    request_timeout=settings.GRAPH_REQUEST_TIMEOUT,
+    upload_timeout=settings.GRAPH_UPLOAD_TIMEOUT,
+    max_retries=settings.GRAPH_MAX_RETRIES,
+    tenant_concurrency=settings.GRAPH_TENANT_CONCURRENCY,
+    token_renewer=msal_token_cache.renew,
+)
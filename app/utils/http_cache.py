@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from app.core.config import settings
+from app.utils.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# 预签名URL中每次都会变化的签名类查询参数（AWS S3 / 阿里云OSS / CloudFront / Azure SAS / GCS），不参与缓存键
+SIGNATURE_PARAMS = {"signature", "expires", "awsaccesskeyid", "ossaccesskeyid", "policy", "key-pair-id",
+                    "security-token", "sig", "se", "st", "sp", "sv", "sr", "spr", "skoid", "sktid", "skt",
+                    "ske", "sks", "skv"}
+SIGNATURE_PARAM_PREFIXES = ("x-amz-", "x-goog-", "x-oss-")
+
+
+def cache_key(url: str) -> str:
+    """去掉签名类查询参数后的URL，同一个对象的不同预签名URL得到相同的缓存键"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in SIGNATURE_PARAMS and not key.lower().startswith(SIGNATURE_PARAM_PREFIXES)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+class HttpCache:
+    """
+    基于 ETag/Last-Modified 的远程文件缓存
+
+    每个URL的内容保存在本地文件中，旁边的 .meta.json 记录服务端返回的 ETag/Last-Modified。
+    再次获取时发送条件请求（If-None-Match / If-Modified-Since），服务端返回 304 时直接使用本地副本。
+    默认保存路径按去掉签名参数的URL计算（见 cache_key），预签名URL每次签名不同也能命中缓存。
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        # 保存路径 -> [锁, 使用中的请求数]，没有请求使用时移除
+        self._locks: Dict[str, list] = {}
+
+    def _default_path(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha1(cache_key(url).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _meta_path(path: Path) -> Path:
+        return path.with_name(path.name + ".meta.json")
+
+    def _load_meta(self, path: Path) -> Optional[Dict]:
+        meta_path = self._meta_path(path)
+        if not path.exists() or not meta_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"缓存元数据损坏，忽略: {meta_path}, {e}")
+            return None
+
+    def _save_meta(self, path: Path, meta: Dict):
+        self._meta_path(path).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    async def fetch(self, url: str, path: Optional[Path] = None, timeout: Optional[float] = None,
+                    revalidate_after: float = 0) -> Dict:
+        """
+        获取远程文件，优先使用本地缓存
+
+        :param url: 远程文件URL
+        :param path: 本地保存路径，默认保存在缓存目录中
+        :param timeout: 请求总超时时间(秒)
+        :param revalidate_after: 距上次校验不足该秒数时直接使用本地副本，不发送请求
+        :return: {"path": 本地文件路径, "status": "fresh"/"not_modified"/"downloaded", "elapsed": 耗时秒数}
+        """
+        path = Path(path) if path else self._default_path(url)
+        lock_key = str(path)
+        lock_entry = self._locks.setdefault(lock_key, [asyncio.Lock(), 0])
+        lock_entry[1] += 1
+        try:
+            async with lock_entry[0]:
+                return await self._fetch(url, path, timeout, revalidate_after)
+        finally:
+            lock_entry[1] -= 1
+            if not lock_entry[1]:
+                del self._locks[lock_key]
+
+    async def _fetch(self, url: str, path: Path, timeout: Optional[float], revalidate_after: float) -> Dict:
+        """在持有该路径的锁时执行条件请求"""
+        start_time = time.monotonic()
+        meta = self._load_meta(path)
+        if meta and revalidate_after and time.time() - meta.get("validated_at", 0) < revalidate_after:
+            logger.info(f"使用本地缓存（{revalidate_after:.0f}秒内已校验）: {cache_key(url)}")
+            return {"path": path, "status": "fresh", "elapsed": time.monotonic() - start_time}
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with http_client.session.get(url, headers=headers, timeout=http_client.timeout(total=timeout)) \
+                as response:
+            if response.status == 304 and meta:
+                meta["validated_at"] = time.time()
+                self._save_meta(path, meta)
+                logger.info(f"远程文件未变化(304)，使用本地缓存: {cache_key(url)}")
+                return {"path": path, "status": "not_modified", "elapsed": time.monotonic() - start_time}
+
+            response.raise_for_status()
+
+            # 先写入临时文件，完整下载后再替换，避免并发读取到半个文件；下载失败时删除临时文件
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(path.name + ".part")
+            try:
+                with temp_path.open("wb") as f:
+                    async for chunk in response.content.iter_chunked(1024 * 1024):
+                        await asyncio.to_thread(f.write, chunk)
+                os.replace(temp_path, path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+
+            # 元数据中只记录去掉签名参数的URL
+            self._save_meta(path, {
+                "url": cache_key(url),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "validated_at": time.time(),
+            })
+
+        logger.info(f"远程文件已下载并缓存: {cache_key(url)} -> {path}")
+        return {"path": path, "status": "downloaded", "elapsed": time.monotonic() - start_time}
+
+    def prune(self, max_age_seconds: float) -> int:
+        """删除缓存目录中超过指定时间未被校验的条目（以及进程中断时遗留的 .part 文件），返回删除数量"""
+        if not self.cache_dir.exists():
+            return 0
+        cutoff = time.time() - max_age_seconds
+        deleted = 0
+        for meta_path in self.cache_dir.glob("*.meta.json"):
+            path = meta_path.with_name(meta_path.name[:-len(".meta.json")])
+            meta = self._load_meta(path) or {}
+            if meta.get("validated_at", 0) < cutoff:
+                path.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                deleted += 1
+        for temp_path in self.cache_dir.glob("*.part"):
+            try:
+                if temp_path.stat().st_mtime < cutoff:
+                    temp_path.unlink()
+                    deleted += 1
+            except FileNotFoundError:
+                continue
+        return deleted
+
+
+# 全局共享的远程文件缓存
+http_cache = HttpCache(settings.TEMP_DIR / "http_cache")
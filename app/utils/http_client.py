@@ -0,0 +1,117 @@
+import asyncio
+import aiohttp
+import logging
+from typing import Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClientPool:
+    """
+    应用级共享的 aiohttp 连接池
+
+    所有对外的 HTTP 请求都复用同一个 ClientSession，从而复用 TCP/TLS 连接（keep-alive）和 DNS 缓存，
+    避免每次下载都重新握手。连接池在应用启动时创建，在应用关闭时释放；
+    如果在应用生命周期之外使用（例如脚本或测试），会在首次访问时自动创建。
+    """
+
+    def __init__(self, name: str, limit: int, limit_per_host: int, dns_cache_ttl: int,
+                 keepalive_timeout: float, connect_timeout: float, sock_read_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.sock_read_timeout = sock_read_timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """通过 aiohttp 的 trace 钩子统计连接复用情况"""
+        trace_config = aiohttp.TraceConfig()
+
+        def counter(key: str):
+            async def _on_event(session, context, params):
+                self._stats[key] += 1
+            return _on_event
+
+        trace_config.on_request_start.append(counter("requests"))
+        trace_config.on_connection_create_end.append(counter("connections_created"))
+        trace_config.on_connection_reuseconn.append(counter("connections_reused"))
+        trace_config.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        return trace_config
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.sock_read_timeout)
+        logger.info(f"创建HTTP连接池[{self.name}]: limit={self.limit}, limit_per_host={self.limit_per_host}")
+        return aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     trace_configs=[self._build_trace_config()])
+
+    async def start(self):
+        """在应用启动时创建连接池"""
+        if self._session is None or self._session.closed:
+            self._loop = asyncio.get_running_loop()
+            self._session = self._create_session()
+
+    async def close(self):
+        """在应用关闭时释放连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info(f"HTTP连接池[{self.name}]已关闭")
+        self._session = None
+        self._loop = None
+
+    def timeout(self, total: Optional[float] = None) -> aiohttp.ClientTimeout:
+        """构造单次请求的超时设置，保留连接池默认的连接/读取超时"""
+        return aiohttp.ClientTimeout(total=total, sock_connect=self.connect_timeout, sock_read=self.sock_read_timeout)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """获取共享的 ClientSession，必须在事件循环内访问"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = self._create_session()
+        return self._session
+
+    def stats(self) -> Dict:
+        """返回连接复用统计"""
+        stats = dict(self._stats)
+        total_connects = stats["connections_created"] + stats["connections_reused"]
+        stats["reuse_ratio"] = round(stats["connections_reused"] / total_connects, 4) if total_connects else 0.0
+        if self._session is not None and not self._session.closed:
+            # aiohttp 未公开连接池状态，这里读取其内部字段，仅用于监控
+            connector = self._session.connector
+            stats["idle_connections"] = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+            stats["active_connections"] = sum(
+                len(conns) for conns in getattr(connector, "_acquired_per_host", {}).values())
+        return {"name": self.name, "limit": self.limit, "limit_per_host": self.limit_per_host, **stats}
+
+
+# 全局共享的下载连接池
+http_client = HttpClientPool(
+    name="download",
+    limit=settings.HTTP_POOL_LIMIT,
+    limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    sock_read_timeout=settings.HTTP_SOCK_READ_TIMEOUT,
+)
@@ -0,0 +1,168 @@
+import time
+import asyncio
+import hashlib
+from typing import Dict, Optional, Tuple
+import msal
+from app.core.config import settings
+from app.utils.logger import logger
+
+
+class TokenAcquisitionError(Exception):
+    """获取 Microsoft Graph 访问令牌失败"""
+    pass
+
+
+class MsalTokenCache:
+    """
+    进程级共享的 MSAL 客户端凭证令牌缓存
+
+    按 (tenant_id, client_id) 缓存 ConfidentialClientApplication 和访问令牌，令牌在过期前
+    refresh_margin 秒内才重新获取，避免每个请求都访问一次 login.microsoftonline.com。
+    同一个键同时只有一个请求去刷新（single-flight），刷新期间旧令牌仍然有效时其它请求直接使用旧令牌。
+    客户端密钥只保存摘要，用于在密钥更换时丢弃旧的缓存。
+    令牌在过期前被撤销或轮换时，Graph 返回 401，GraphClient 调用 renew() 换取新令牌后重试一次；
+    被拒绝的令牌在原有效期内记录其所属的键，之后带着同一个旧令牌的请求直接换成当前令牌。
+    """
+
+    def __init__(self, authority_host: str, scope: str, refresh_margin: float, http_client=None):
+        """
+        :param authority_host: 登录服务地址，例如 https://login.microsoftonline.com
+        :param scope: 请求的权限范围
+        :param refresh_margin: 令牌距离过期不足该秒数时刷新
+        :param http_client: 传给 msal 的 requests 兼容客户端（测试或代理场景使用），默认由 msal 创建
+        """
+        self.authority_host = authority_host.rstrip("/")
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.http_client = http_client
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # 被拒绝的令牌 -> (所属的键, 原过期时间)
+        self._rejected: Dict[str, Tuple[Tuple[str, str], float]] = {}
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0, "errors": 0, "renewals": 0}
+
+    @staticmethod
+    def _fingerprint(client_secret: str) -> str:
+        return hashlib.sha256(client_secret.encode("utf-8")).hexdigest()
+
+    def _build_app(self, tenant_id: str, client_id: str, client_secret: str) -> msal.ConfidentialClientApplication:
+        kwargs = {"http_client": self.http_client} if self.http_client is not None else {}
+        return msal.ConfidentialClientApplication(
+            client_id,
+            authority=f"{self.authority_host}/{tenant_id}",
+            client_credential=client_secret,
+            **kwargs
+        )
+
+    async def get_token(self, tenant_id: str, client_id: str, client_secret: str) -> str:
+        """获取访问令牌，优先使用缓存；获取失败时抛出 TokenAcquisitionError"""
+        key = (tenant_id, client_id)
+        fingerprint = self._fingerprint(client_secret)
+        entry = self._cached_entry(key, fingerprint)
+        now = time.time()
+
+        if entry and entry["expires_at"] - self.refresh_margin > now:
+            self._stats["hits"] += 1
+            return entry["access_token"]
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        if entry and entry["expires_at"] > now and lock.locked():
+            # 其它请求正在刷新，旧令牌仍然有效，直接使用
+            self._stats["hits"] += 1
+            return entry["access_token"]
+
+        async with lock:
+            # 等待锁期间其它请求可能已经刷新完成
+            entry = self._cached_entry(key, fingerprint)
+            if entry and entry["expires_at"] - self.refresh_margin > time.time():
+                self._stats["hits"] += 1
+                return entry["access_token"]
+
+            self._stats["misses"] += 1
+            return await self._refresh(key, fingerprint, client_secret, entry)
+
+    def _cached_entry(self, key: Tuple[str, str], fingerprint: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry and entry["fingerprint"] != fingerprint:
+            logger.info(f"客户端密钥已变更，丢弃缓存的令牌: tenant={key[0]}, client={key[1]}")
+            self._entries.pop(key, None)
+            return None
+        return entry
+
+    async def _refresh(self, key: Tuple[str, str], fingerprint: str, client_secret: str,
+                       entry: Optional[Dict]) -> str:
+        app = entry["app"] if entry else await asyncio.to_thread(self._build_app, key[0], key[1], client_secret)
+        started = time.monotonic()
+        # msal 使用同步HTTP请求，放到线程中执行避免阻塞事件循环
+        result = await asyncio.to_thread(app.acquire_token_for_client, scopes=[self.scope])
+        access_token = result.get("access_token")
+        if not access_token:
+            self._stats["errors"] += 1
+            raise TokenAcquisitionError(result.get("error_description", "未知错误"))
+
+        self._entries[key] = {
+            "app": app,
+            "fingerprint": fingerprint,
+            "access_token": access_token,
+            "expires_at": time.time() + int(result.get("expires_in", 0)),
+        }
+        self._stats["refreshes"] += 1
+        logger.info(f"已获取访问令牌: tenant={key[0]}, 有效期 {result.get('expires_in')} 秒, "
+                    f"耗时 {time.monotonic() - started:.2f} 秒")
+        return access_token
+
+    def invalidate(self, tenant_id: str, client_id: str):
+        """丢弃缓存的令牌，下次 get_token 时重新获取"""
+        self._entries.pop((tenant_id, client_id), None)
+
+    async def renew(self, rejected_token: str) -> Optional[str]:
+        """
+        令牌被服务端拒绝（401）时丢弃该令牌并重新获取，返回新令牌
+
+        同一令牌被多个请求拒绝时只重新获取一次，之后的请求直接得到当前令牌；不是本缓存发出的令牌时返回 None。
+        """
+        now = time.time()
+        self._rejected = {token: value for token, value in self._rejected.items() if value[1] > now}
+        key = next((key for key, entry in self._entries.items() if entry["access_token"] == rejected_token), None)
+        if key is None and rejected_token in self._rejected:
+            key = self._rejected[rejected_token][0]
+        if key is None:
+            return None
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["access_token"] != rejected_token:
+                # 等待锁期间其它请求已经换过令牌
+                return entry["access_token"]
+            self._rejected[rejected_token] = (key, entry["expires_at"])
+            self.invalidate(*key)
+            # msal 会优先返回自身缓存中未过期的令牌，需要先清空
+            app = entry["app"]
+            if hasattr(app, "remove_tokens_for_client"):
+                app.remove_tokens_for_client()
+            else:
+                app.token_cache = msal.TokenCache()
+            self._stats["renewals"] += 1
+            logger.warning(f"访问令牌被拒绝(401)，重新获取: tenant={key[0]}, client={key[1]}")
+            try:
+                return await self._refresh(key, entry["fingerprint"], "", entry)
+            except TokenAcquisitionError as e:
+                logger.error(f"重新获取访问令牌失败: {e}")
+                return None
+
+    def stats(self) -> Dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self._stats,
+        }
+
+
+# 全局令牌缓存
+msal_token_cache = MsalTokenCache(
+    authority_host=settings.MSAL_AUTHORITY_HOST,
+    scope=settings.GRAPH_SCOPE,
+    refresh_margin=settings.MSAL_TOKEN_REFRESH_MARGIN,
+)
@@ -0,0 +1,62 @@
+import base64
+import numpy as np
+
+# quickXorHash 参数：160 位的循环移位寄存器，每个字节比前一个字节左移 11 位
+WIDTH_IN_BITS = 160
+SHIFT = 11
+# 第 i 个字节的位置只取决于 i % 160，每 160 个字节循环一次
+PERIOD = WIDTH_IN_BITS
+
+
+class QuickXorHash:
+    """
+    OneDrive/SharePoint 使用的 quickXorHash
+
+    第 i 个字节异或到 160 位寄存器的第 (i * 11) % 160 位（跨越末尾时回绕到开头），最后把总长度（64 位小端）
+    异或到结果的最后 8 个字节，以 Base64 输出。由于字节位置每 160 个字节循环一次，这里先用 numpy 把
+    同一位置的字节按列异或到 160 字节的累加器中，最后只需对 160 个字节做移位，支持分块流式计算。
+    """
+
+    def __init__(self):
+        self._acc = np.zeros(PERIOD, dtype=np.uint8)
+        self._length = 0
+
+    def update(self, data: bytes):
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        phase = self._length % PERIOD
+        self._length += len(buffer)
+
+        # 1. 补齐上一块末尾未满 160 字节的那一行
+        if phase:
+            head = buffer[:PERIOD - phase]
+            self._acc[phase:phase + len(head)] ^= head
+            buffer = buffer[len(head):]
+
+        # 2. 完整的行按列异或，剩余不足一行的字节从第 0 列开始
+        full = len(buffer) // PERIOD * PERIOD
+        if full:
+            self._acc ^= np.bitwise_xor.reduce(buffer[:full].reshape(-1, PERIOD), axis=0)
+        tail = buffer[full:]
+        self._acc[:len(tail)] ^= tail
+
+    def digest(self) -> bytes:
+        mask = (1 << WIDTH_IN_BITS) - 1
+        state = 0
+        for index, value in enumerate(self._acc.tolist()):
+            if value:
+                shift = index * SHIFT % WIDTH_IN_BITS
+                state ^= ((value << shift) | (value >> (WIDTH_IN_BITS - shift))) & mask
+        state ^= self._length << (WIDTH_IN_BITS - 64)
+        return state.to_bytes(WIDTH_IN_BITS // 8, "little")
+
+    def base64digest(self) -> str:
+        return base64.b64encode(self.digest()).decode("ascii")
+
+
+def quickxorhash_file(path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """分块读取文件并计算 quickXorHash（Base64），适合在线程中调用"""
+    hasher = QuickXorHash()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.base64digest()
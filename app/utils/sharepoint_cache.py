@@ -0,0 +1,131 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.logger import logger
+
+
+class SiteDriveCache:
+    """
+    SharePoint 站点ID和默认文档库ID的缓存
+
+    (tenant_name, site_name) -> (site_id, drive_id)，站点和文档库ID几乎不会变化，
+    缓存 ttl_seconds 秒；Graph 返回 404 说明站点或文档库已变化，调用方应使对应条目失效。
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(tenant_name: str, site_name: str) -> Tuple[str, str]:
+        # SharePoint 的租户和站点名称不区分大小写
+        return tenant_name.casefold(), site_name.casefold()
+
+    def get(self, tenant_name: str, site_name: str) -> Optional[Tuple[str, str]]:
+        entry = self._entries.get(self._key(tenant_name, site_name))
+        if entry and entry["expires_at"] > time.time():
+            self._stats["hits"] += 1
+            return entry["site_id"], entry["drive_id"]
+        self._stats["misses"] += 1
+        return None
+
+    def set(self, tenant_name: str, site_name: str, site_id: str, drive_id: str):
+        self._entries[self._key(tenant_name, site_name)] = {
+            "site_id": site_id,
+            "drive_id": drive_id,
+            "expires_at": time.time() + self.ttl_seconds,
+        }
+
+    def invalidate(self, tenant_name: str, site_name: str):
+        if self._entries.pop(self._key(tenant_name, site_name), None) is not None:
+            self._stats["invalidations"] += 1
+            logger.info(f"站点缓存已失效: {tenant_name}/{site_name}")
+
+    def stats(self) -> Dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self._stats,
+        }
+
+
+class FolderIdCache:
+    """
+    按文档库缓存已解析的文件夹ID（前缀树）
+
+    每个文档库一棵树，节点以小写化（casefold）的文件夹名为键，保存文件夹ID。查询时返回已知的最长前缀，
+    调用方只需要解析或创建缺失的后缀；Graph 返回 404 说明文件夹已被删除或移动，应使对应子树失效。
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._drives: Dict[str, Dict] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _new_node(folder_id: Optional[str]) -> Dict:
+        return {"id": folder_id, "children": {}, "expires_at": time.time()}
+
+    def _valid(self, node: Dict) -> bool:
+        return node["id"] is not None and node["expires_at"] + self.ttl_seconds > time.time()
+
+    def lookup(self, drive_id: str, segments: List[str]) -> Tuple[int, Optional[str]]:
+        """
+        返回 (已知前缀的段数, 该前缀对应的文件夹ID)；根目录也未知时返回 (0, None)
+        """
+        node = self._drives.get(drive_id)
+        if node is None:
+            self._stats["misses"] += 1
+            return 0, None
+        # 按完整路径直接查到的文件夹不会记录根目录ID，根目录未知时仍可命中更深的前缀
+        depth, folder_id = 0, node["id"] if self._valid(node) else None
+        for index, segment in enumerate(segments):
+            node = node["children"].get(segment.casefold())
+            if node is None:
+                break
+            if self._valid(node):
+                depth, folder_id = index + 1, node["id"]
+        self._stats["hits" if depth == len(segments) else "misses"] += 1
+        return depth, folder_id
+
+    def store(self, drive_id: str, segments: List[str], folder_id: str):
+        """记录路径（segments 为空表示根目录）对应的文件夹ID"""
+        node = self._drives.setdefault(drive_id, self._new_node(None))
+        for segment in segments:
+            node = node["children"].setdefault(segment.casefold(), self._new_node(None))
+        node["id"] = folder_id
+        node["expires_at"] = time.time()
+
+    def invalidate(self, drive_id: str, segments: Optional[List[str]] = None):
+        """删除路径及其所有子路径的缓存，segments 为空时清空整个文档库的缓存"""
+        if not segments:
+            removed = self._drives.pop(drive_id, None) is not None
+        else:
+            node = self._drives.get(drive_id)
+            for segment in segments[:-1]:
+                node = node["children"].get(segment.casefold()) if node else None
+            removed = bool(node) and node["children"].pop(segments[-1].casefold(), None) is not None
+        if removed:
+            self._stats["invalidations"] += 1
+            logger.info(f"文件夹缓存已失效: drive={drive_id}, path={'/'.join(segments or [])}")
+
+    def stats(self) -> Dict:
+        def count(node: Dict) -> int:
+            return 1 + sum(count(child) for child in node["children"].values())
+
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "drives": len(self._drives),
+            "folders": sum(count(node) for node in self._drives.values()),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self._stats,
+        }
+
+
+# 全局站点/文档库ID缓存
+site_drive_cache = SiteDriveCache(settings.SHAREPOINT_SITE_CACHE_TTL)
+
+# 全局文件夹ID缓存
+folder_id_cache = FolderIdCache(settings.SHAREPOINT_FOLDER_CACHE_TTL)
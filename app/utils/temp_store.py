@@ -0,0 +1,281 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Optional, Union
+from app.core.config import settings
+from app.utils.logger import logger
+from app.utils.cleaner import PERSISTENT_ENTRIES, temp_janitor
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+
+class TempQuotaExceeded(Exception):
+    """进行中的任务已占满临时目录配额，调用方应稍后重试"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _dir_size(path: Union[str, Path]) -> int:
+    """统计目录（或文件）占用的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class TempStore:
+    """
+    带配额的临时目录管理
+
+    按任务目录记录占用字节数和访问顺序（OrderedDict，末尾为最近访问）。总占用超过配额时，
+    从最久未访问的已完成任务开始删除；进行中的任务不会被淘汰，如果仅进行中的任务就已占满配额，
+    新任务直接被拒绝（HTTP 507），由客户端按 Retry-After 稍后重试。
+
+    另外可以配置一个内存盘（tmpfs）作为热存储：处理过程中写入后很快被读回的中间文件放在热存储中，
+    热存储空间不足时写入持久目录；请求结束时需要保留的文件被移入持久目录，热存储中的目录随即删除。
+    同一任务目录可能同时有多个请求，每个请求在热存储中使用独立的目录（hot/<任务目录名>/<请求键>）。
+    """
+
+    def __init__(self, temp_dir: Path, quota_bytes: int, retry_after: int,
+                 hot_dir: Optional[Union[str, Path]] = None, hot_max_bytes: int = 0):
+        self.temp_dir = Path(temp_dir)
+        self.quota_bytes = quota_bytes
+        self.retry_after = retry_after
+        self.hot_dir = self._init_hot_dir(hot_dir) if hot_dir and hot_max_bytes > 0 else None
+        self.hot_max_bytes = hot_max_bytes
+        self._tasks: "OrderedDict[str, Dict]" = OrderedDict()
+        self._hot_reserved: Dict[str, int] = {}
+        self._stats = {"evicted": 0, "evicted_bytes": 0, "rejected": 0,
+                       "hot_staged": 0, "hot_spilled": 0, "promoted": 0}
+
+    @staticmethod
+    def _init_hot_dir(hot_dir: Union[str, Path]) -> Optional[Path]:
+        try:
+            path = Path(hot_dir)
+            path.mkdir(parents=True, exist_ok=True)
+            return path
+        except OSError as e:
+            logger.warning(f"[临时目录热存储] 无法使用 {hot_dir}，中间文件将写入持久目录: {e}")
+            return None
+
+    @staticmethod
+    def _key(path: Union[str, Path]) -> str:
+        return str(Path(path).resolve())
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(item["bytes"] for item in self._tasks.values())
+
+    @property
+    def in_flight_bytes(self) -> int:
+        return sum(item["bytes"] for item in self._tasks.values() if item["state"] == IN_FLIGHT)
+
+    def _task_key(self, path: Union[str, Path]) -> Optional[str]:
+        """将任务目录内的任意路径映射为任务目录本身"""
+        try:
+            relative = Path(path).resolve().relative_to(self.temp_dir.resolve())
+        except ValueError:
+            return None
+        if not relative.parts:
+            return None
+        return self._key(self.temp_dir / relative.parts[0])
+
+    def scan(self):
+        """启动时统计已有任务目录的占用，按修改时间排列访问顺序"""
+        entries = []
+        for entry in os.scandir(self.temp_dir):
+            if entry.name in PERSISTENT_ENTRIES or entry.name.startswith('.'):
+                continue
+            entries.append((entry.stat().st_mtime, self._key(entry.path), _dir_size(entry.path)))
+        for mtime, key, size in sorted(entries):
+            self._tasks[key] = {"bytes": size, "state": COMPLETED, "accessed_at": mtime, "in_flight": 0}
+        logger.info(f"[临时目录配额] 已统计 {len(entries)} 个任务目录, 共 {self.used_bytes} 字节")
+
+    async def start(self):
+        await asyncio.to_thread(self.scan)
+        await self.enforce()
+        if self.hot_dir is not None:
+            # 上次运行遗留的热存储目录已无任务引用
+            for entry in os.scandir(self.hot_dir):
+                await asyncio.to_thread(shutil.rmtree, entry.path, True)
+
+    def _hot_request_dir(self, task_dir: Union[str, Path], request_key: str) -> Path:
+        return self.hot_dir / Path(task_dir).name / request_key
+
+    def stage_dir(self, task_dir: Union[str, Path], request_key: str, name: str, expected_bytes: int = 0) -> Path:
+        """
+        返回任务中间文件的目录：热存储有足够空间时放在热存储，否则放在任务目录中
+
+        :param task_dir: 任务目录
+        :param request_key: 请求键（track() 返回），区分同一任务目录的并发请求
+        :param name: 中间目录名称（如 unlocked、split）
+        :param expected_bytes: 预计写入的字节数
+        """
+        task_dir = Path(task_dir)
+        if self.hot_dir is not None:
+            reserved = sum(self._hot_reserved.values())
+            if reserved + expected_bytes <= self.hot_max_bytes \
+                    and shutil.disk_usage(self.hot_dir).free > expected_bytes:
+                request_dir = self._hot_request_dir(task_dir, request_key)
+                path = request_dir / name
+                path.mkdir(parents=True, exist_ok=True)
+                reserved_key = str(request_dir)
+                self._hot_reserved[reserved_key] = self._hot_reserved.get(reserved_key, 0) + expected_bytes
+                self._stats["hot_staged"] += 1
+                return path
+            self._stats["hot_spilled"] += 1
+            logger.info(f"[临时目录热存储] 空间不足(已预留 {reserved} 字节)，{name} 写入持久目录")
+        path = task_dir / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    async def promote(self, task_dir: Union[str, Path], request_key: str,
+                      paths: Iterable[Union[str, Path]]) -> Dict[str, str]:
+        """将请求在热存储中的文件移入任务目录（保持相对路径），返回 {原路径: 新路径}"""
+        promoted = {}
+        if self.hot_dir is None:
+            return promoted
+        hot_request_dir = self._hot_request_dir(task_dir, request_key).resolve()
+        for path in paths:
+            source = Path(path).resolve()
+            if str(path) in promoted or not source.is_relative_to(hot_request_dir) or not source.exists():
+                continue
+            target = Path(task_dir) / source.relative_to(hot_request_dir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(shutil.move, source, target)
+            promoted[str(path)] = str(target)
+            self._stats["promoted"] += 1
+        return promoted
+
+    async def release_hot(self, task_dir: Union[str, Path], request_key: str):
+        """删除请求在热存储中的目录并释放预留空间，不影响同一任务目录的其它请求"""
+        if self.hot_dir is None:
+            return
+        request_dir = self._hot_request_dir(task_dir, request_key)
+        self._hot_reserved.pop(str(request_dir), None)
+        if request_dir.exists():
+            await asyncio.to_thread(shutil.rmtree, request_dir, True)
+        try:
+            # 任务目录下已没有其它请求的目录时一并删除
+            request_dir.parent.rmdir()
+        except OSError:
+            pass
+
+    def begin(self, task_dir: Union[str, Path]):
+        """
+        标记任务开始；仅进行中的任务就已占满配额时抛出 TempQuotaExceeded
+
+        同一任务目录可能同时有多个请求（例如同一 task_id 的不同附件），按请求计数，
+        最后一个请求完成后任务目录才变为已完成、可被淘汰。
+        """
+        if self.in_flight_bytes >= self.quota_bytes:
+            self._stats["rejected"] += 1
+            raise TempQuotaExceeded(
+                f"临时目录配额已满: 进行中任务占用 {self.in_flight_bytes} 字节, 配额 {self.quota_bytes} 字节",
+                self.retry_after)
+        key = self._key(task_dir)
+        item = self._tasks.pop(key, {"bytes": 0, "in_flight": 0})
+        item.update(state=IN_FLIGHT, accessed_at=time.time(), in_flight=item.get("in_flight", 0) + 1)
+        self._tasks[key] = item
+
+    def record(self, task_dir: Union[str, Path], nbytes: int):
+        """记录任务新写入的字节数（例如下载完成后），用于配额判断"""
+        item = self._tasks.get(self._key(task_dir))
+        if item is not None:
+            item["bytes"] += nbytes
+
+    async def complete(self, task_dir: Union[str, Path]):
+        """
+        标记一个请求完成；任务目录没有其它进行中的请求时标记为已完成，
+        重新统计实际占用，并在超出配额时淘汰旧任务
+        """
+        key = self._key(task_dir)
+        item = self._tasks.get(key)
+        if item is not None:
+            item["in_flight"] = max(item.get("in_flight", 0) - 1, 0)
+            if item["in_flight"]:
+                return
+        size = await asyncio.to_thread(_dir_size, key) if os.path.exists(key) else 0
+        # 统计期间可能有新的请求开始处理该任务目录
+        item = self._tasks.get(key)
+        if item is not None and not item["in_flight"]:
+            item.update(bytes=size, state=COMPLETED)
+        await self.enforce()
+
+    @asynccontextmanager
+    async def track(self, task_dir: Union[str, Path]):
+        """在请求处理期间将任务目录标记为进行中，返回本次请求的热存储请求键（用于 stage_dir/promote）"""
+        self.begin(task_dir)
+        request_key = uuid.uuid4().hex
+        try:
+            await self.enforce()
+            yield request_key
+        finally:
+            await self.release_hot(task_dir, request_key)
+            await self.complete(task_dir)
+
+    def touch(self, path: Union[str, Path]):
+        """记录一次访问（例如文件被下载），使其所在任务目录最后被淘汰"""
+        key = self._task_key(path)
+        if key in self._tasks:
+            self._tasks[key]["accessed_at"] = time.time()
+            self._tasks.move_to_end(key)
+
+    def forget(self, path: Union[str, Path]):
+        """任务目录已被删除时移除记录"""
+        self._tasks.pop(self._key(path), None)
+
+    async def enforce(self):
+        """总占用超过配额时，从最久未访问的已完成任务开始删除"""
+        while self.used_bytes > self.quota_bytes:
+            victim = next((key for key, item in self._tasks.items() if item["state"] == COMPLETED), None)
+            if victim is None:
+                break
+            size = self._tasks.pop(victim)["bytes"]
+            try:
+                if os.path.isdir(victim):
+                    await asyncio.to_thread(shutil.rmtree, victim)
+                elif os.path.exists(victim):
+                    await asyncio.to_thread(os.remove, victim)
+            except Exception as e:
+                logger.error(f"[临时目录配额] 淘汰 {victim} 时出错: {str(e)}")
+            await temp_janitor.unregister(victim)
+            self._stats["evicted"] += 1
+            self._stats["evicted_bytes"] += size
+            logger.info(f"[临时目录配额] 超出配额，淘汰最久未访问的任务目录: {victim} ({size} 字节)")
+
+    def stats(self) -> Dict:
+        in_flight = [item for item in self._tasks.values() if item["state"] == IN_FLIGHT]
+        used = self.used_bytes
+        return {
+            "quota_bytes": self.quota_bytes,
+            "used_bytes": used,
+            "usage_ratio": round(used / self.quota_bytes, 4) if self.quota_bytes else 0.0,
+            "in_flight_bytes": sum(item["bytes"] for item in in_flight),
+            "tasks": len(self._tasks),
+            "in_flight_tasks": len(in_flight),
+            "hot_dir": str(self.hot_dir) if self.hot_dir else None,
+            "hot_max_bytes": self.hot_max_bytes,
+            "hot_reserved_bytes": sum(self._hot_reserved.values()),
+            **self._stats,
+        }
+
+
+# 全局临时目录配额管理
+temp_store = TempStore(settings.TEMP_DIR, settings.TEMP_QUOTA_BYTES, settings.TEMP_QUOTA_RETRY_AFTER,
+                       hot_dir=settings.TEMP_HOT_DIR, hot_max_bytes=settings.TEMP_HOT_MAX_BYTES)
+temp_janitor.add_listener(temp_store.forget)
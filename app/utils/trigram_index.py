@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+
+
+class TrigramIndex:
+    """
+    字符串列的三元组（trigram）倒排索引
+
+    按 UTF-8 字节计算三元组：文本包含某个子串时，其 UTF-8 编码也包含该子串的编码，
+    所以子串的每个字节三元组都必然出现在匹配的行中。索引保存两列等长数组：
+    按 (三元组, 行号) 排序的三元组键和行号，查询时对键做二分查找取得每个三元组的行号列表再求交集，
+    得到的候选行由调用方用原来的匹配条件复核。
+
+    索引可以保存为 Arrow IPC 文件，之后通过内存映射加载，不占用额外内存。
+    """
+
+    def __init__(self, keys: np.ndarray, rows: np.ndarray):
+        self.keys = keys
+        self.rows = rows
+
+    @classmethod
+    def build(cls, column: pa.ChunkedArray) -> "TrigramIndex":
+        """从（已规范化的）字符串列构建索引，列中不能有空值"""
+        array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+        if pa.types.is_string(array.type):
+            array = array.cast(pa.large_string())
+        offset_buffer, data_buffer = array.buffers()[1], array.buffers()[2]
+        offsets = np.frombuffer(offset_buffer, dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+        data = np.frombuffer(data_buffer, dtype=np.uint8)[offsets[0]:offsets[-1]] if data_buffer else \
+            np.empty(0, dtype=np.uint8)
+        if len(data) < 3:
+            return cls(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32))
+
+        # 每个字节所属的行号；三个字节属于同一行时才构成有效的三元组
+        row_of_byte = np.repeat(np.arange(len(array), dtype=np.uint32), np.diff(offsets))
+        valid = row_of_byte[:-2] == row_of_byte[2:]
+        data = data.astype(np.uint32)
+        keys = ((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])[valid]
+        rows = row_of_byte[:-2][valid]
+
+        # 按 (三元组, 行号) 排序并去重，同一三元组下的行号保持升序（np.unique 在大数组上较慢，这里直接排序）
+        combined = (keys.astype(np.uint64) << np.uint64(32)) | rows
+        combined.sort()
+        combined = combined[np.concatenate(([True], combined[1:] != combined[:-1]))]
+        return cls((combined >> np.uint64(32)).astype(np.uint32),
+                   (combined & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+
+    @staticmethod
+    def trigrams(text: str) -> np.ndarray:
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint32)
+        if len(data) < 3:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+
+    def candidates(self, literals: List[str]) -> Optional[np.ndarray]:
+        """
+        返回同时包含所有字面量（已规范化）的候选行号（升序）
+
+        字面量都短于 3 个字节、无法使用索引时返回 None，调用方应回退到全表扫描
+        """
+        keys = np.unique(np.concatenate([self.trigrams(literal) for literal in literals] + [np.empty(0, np.uint32)]))
+        if not len(keys):
+            return None
+
+        starts = np.searchsorted(self.keys, keys, side="left")
+        ends = np.searchsorted(self.keys, keys, side="right")
+        # 从最短的行号列表开始求交集，候选集合为空时提前结束
+        result = None
+        for index in np.argsort(ends - starts):
+            postings = self.rows[starts[index]:ends[index]]
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+            if not len(result):
+                break
+        return result.astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def save(self, path: Path, metadata: Dict[str, str]):
+        """保存为 Arrow IPC 文件（先写临时文件再替换）"""
+        table = pa.table({"key": self.keys, "row": self.rows}).replace_schema_metadata(metadata)
+        temp_path = path.with_name(path.name + ".part")
+        with pa.OSFile(str(temp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open(cls, path: Path) -> Tuple["TrigramIndex", Dict[str, str]]:
+        """内存映射加载索引文件，返回 (索引, 元数据)"""
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+        metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+        if not len(table):
+            return cls(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)), metadata
+        # 写入时只有一个批次，直接引用映射的内存
+        keys = table.column("key").chunk(0).to_numpy(zero_copy_only=True)
+        rows = table.column("row").chunk(0).to_numpy(zero_copy_only=True)
+        return cls(keys, rows), metadata
@@ -1,8 +1,10 @@
 import os
+import shutil
 import zipfile
 import logging
 import subprocess
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -50,35 +52,189 @@ def find_files_dir(directory: str) -> str:
     return directory
 
 
-def extract_zip(zip_path: str, extract_dir: str, password: Optional[str] = None) -> Dict:
-    """解压ZIP文件到指定目录，优先用zipfile，失败时自动用7z再试"""
+# 视为嵌套压缩包的扩展名。注意：xlsx/docx 等本质上也是zip格式，因此只按扩展名判断，不使用 zipfile.is_zipfile
+NESTED_ARCHIVE_EXTENSIONS = ('.zip', '.7z', '.rar')
+
+
+def is_nested_archive(file_name: str) -> bool:
+    """判断文件是否为需要继续展开的嵌套压缩包"""
+    return os.path.splitext(file_name)[1].lower() in NESTED_ARCHIVE_EXTENSIONS
+
+
+def _extract_with_7z(archive_path: str, extract_dir: str, password: Optional[str] = None) -> Dict:
+    """使用7z工具解压，支持zip/7z/rar等格式"""
+    # 组装7z命令；未提供密码时传入空密码，避免7z在加密文件上等待交互输入
+    cmd = ['7z', 'x', '-y', f'-o{extract_dir}', f'-p{password or ""}', str(archive_path)]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    logger.debug(f"7z输出: {result.stdout}")
+    if result.returncode != 0:
+        logger.error(f"7z解压失败: {result.stderr.strip()}")
+        return {"success": False, "error": f"7z解压失败: {result.stderr.strip()}"}
+    return {"success": True}
+
+
+def _extract_archive(archive_path: str, extract_dir: str, password: Optional[str] = None) -> Dict:
+    """解压单个压缩包到指定目录，zip优先用zipfile，失败或非zip格式时用7z"""
+    os.makedirs(extract_dir, exist_ok=True)
+
+    if os.path.splitext(str(archive_path))[1].lower() in ('.7z', '.rar'):
+        logger.debug(f"非zip格式，直接使用7z解压: {archive_path}")
+        return _extract_with_7z(archive_path, extract_dir, password)
+
+    pwd = password.encode('utf-8') if password else None
+
+    # 优先尝试标准zipfile
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            if any(info.flag_bits & 0x1 for info in zip_ref.infolist()) and not pwd:
+                logger.error("ZIP文件受密码保护，但未提供密码")
+                return {"success": False, "error": "ZIP文件受密码保护，请提供密码"}
+            logger.debug(f"解压所有文件到: {extract_dir}")
+            zip_ref.extractall(path=extract_dir, pwd=pwd)
+    except (RuntimeError, zipfile.BadZipFile, NotImplementedError, OSError) as e:
+        logger.warning(f"标准库zipfile解压失败，尝试使用7z工具处理。错误信息: {e}")
+        return _extract_with_7z(archive_path, extract_dir, password)
+
+    return {"success": True}
+
+
+def _unique_dir(path: str) -> str:
+    """如果目录已存在，追加计数器后缀生成唯一目录名"""
+    candidate = path
+    counter = 1
+    while os.path.exists(candidate):
+        candidate = f"{path}_{counter}"
+        counter += 1
+    return candidate
+
+
+def _dir_usage(path: str) -> Tuple[int, int]:
+    """统计目录下所有文件的总字节数和文件数"""
+    total_bytes = total_entries = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            total_bytes += os.path.getsize(os.path.join(root, file))
+            total_entries += 1
+    return total_bytes, total_entries
+
+
+def _declared_usage(archive_path: str) -> Optional[Tuple[int, int]]:
+    """zip格式时从中央目录读取声明的解压后总字节数和条目数，无法读取（如7z/rar）时返回 None"""
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            infos = zip_ref.infolist()
+            return sum(info.file_size for info in infos), len(infos)
+    except (zipfile.BadZipFile, OSError):
+        return None
+
+
+def expand_nested_archives(root_dir: str, lineage: List[str], password: Optional[str] = None,
+                           max_depth: int = 0, max_total_bytes: Optional[int] = None,
+                           max_entries: Optional[int] = None) -> Dict[str, List[str]]:
+    """
+    在进程内逐层展开目录中的嵌套压缩包（zip-in-zip、7z、rar）
+
+    每个内层压缩包解压到同级的 "<文件名>_extracted" 目录，解压成功后删除该压缩包文件；
+    解压失败时保留压缩包文件本身，作为普通文件返回。
+
+    解压目录的总大小和文件数（包括外层压缩包解压出的文件）不能超过 max_total_bytes / max_entries，
+    展开某个内层压缩包会超出上限时不再展开它，保留压缩包文件本身，防止压缩炸弹逐层放大。
+
+    :param root_dir: 外层压缩包的解压目录
+    :param lineage: 外层压缩包的来源链，例如 ["outer.zip"]
+    :param password: 解压密码，内层压缩包沿用外层密码
+    :param max_depth: 最多展开的嵌套层数，0 表示不展开
+    :param max_total_bytes: 解压目录总字节数上限，默认取 settings.UNZIP_MAX_TOTAL_BYTES
+    :param max_entries: 解压目录文件总数上限，默认取 settings.UNZIP_MAX_ENTRIES
+    :return: 解压目录 -> 来源链 的映射
+    """
+    if max_total_bytes is None:
+        max_total_bytes = settings.UNZIP_MAX_TOTAL_BYTES
+    if max_entries is None:
+        max_entries = settings.UNZIP_MAX_ENTRIES
+    lineage_map = {os.path.abspath(root_dir): list(lineage)}
+    pending = [(root_dir, list(lineage), 0)]
+    used_bytes, used_entries = _dir_usage(root_dir) if max_depth > 0 else (0, 0)
+
+    while pending:
+        current_dir, current_lineage, depth = pending.pop(0)
+        if depth >= max_depth:
+            continue
+
+        for root, _, files in os.walk(current_dir):
+            for file in files:
+                if not is_nested_archive(file):
+                    continue
+
+                archive_path = os.path.join(root, file)
+                target_dir = _unique_dir(os.path.join(root, f"{os.path.splitext(file)[0]}_extracted"))
+                logger.info(f"发现嵌套压缩包(第 {depth + 1} 层): {archive_path}")
+
+                # zip格式先按声明的大小检查，避免解压出超量数据后再删除
+                archive_size = os.path.getsize(archive_path)
+                declared = _declared_usage(archive_path)
+                if declared and (used_bytes - archive_size + declared[0] > max_total_bytes
+                                 or used_entries - 1 + declared[1] > max_entries):
+                    logger.warning(f"嵌套压缩包展开后将超过解压总量限制，保留原文件: {archive_path}")
+                    continue
+
+                result = _extract_archive(archive_path, target_dir, password)
+                if not result["success"]:
+                    logger.warning(f"嵌套压缩包解压失败，保留原文件: {archive_path}, 错误: {result['error']}")
+                    shutil.rmtree(target_dir, ignore_errors=True)
+                    continue
+
+                # 按实际解压出的数据再检查一次（7z/rar 没有声明大小，zip 的声明也可能不准确）
+                extracted_bytes, extracted_entries = _dir_usage(target_dir)
+                if (used_bytes - archive_size + extracted_bytes > max_total_bytes
+                        or used_entries - 1 + extracted_entries > max_entries):
+                    logger.warning(f"嵌套压缩包展开后超过解压总量限制，保留原文件: {archive_path}")
+                    shutil.rmtree(target_dir, ignore_errors=True)
+                    continue
+
+                used_bytes += extracted_bytes - archive_size
+                used_entries += extracted_entries - 1
+                os.remove(archive_path)
+                child_lineage = current_lineage + [file]
+                lineage_map[os.path.abspath(target_dir)] = child_lineage
+                pending.append((target_dir, child_lineage, depth + 1))
+
+    return lineage_map
+
+
+def _lookup_lineage(file_path: str, lineage_map: Dict[str, List[str]]) -> List[str]:
+    """向上查找文件所在的最近一层解压目录，返回其来源链"""
+    current = os.path.dirname(os.path.abspath(file_path))
+    while current not in lineage_map:
+        parent = os.path.dirname(current)
+        if parent == current:
+            return []
+        current = parent
+    return lineage_map[current]
+
+
+def extract_zip(zip_path: str, extract_dir: str, password: Optional[str] = None,
+                max_depth: Optional[int] = None) -> Dict:
+    """
+    解压ZIP文件到指定目录，优先用zipfile，失败时自动用7z再试
+
+    解压后会继续展开其中的嵌套压缩包，最多 max_depth 层（默认取 settings.UNZIP_MAX_DEPTH），
+    展开后的总大小和文件数受 settings.UNZIP_MAX_TOTAL_BYTES / UNZIP_MAX_ENTRIES 限制，
+    返回的每个文件都带有 unzip_lineage 来源链，例如 ["outer.zip", "entity_a.zip"]。
+    """
     try:
         logger.info(f"开始解压文件: {zip_path} 到 {extract_dir}")
         os.makedirs(extract_dir, exist_ok=True)
         logger.info(f"创建解压目录: {extract_dir}")
 
-        pwd = password.encode('utf-8') if password else None
+        extract_result = _extract_archive(zip_path, extract_dir, password)
+        if not extract_result["success"]:
+            return extract_result
 
-        # 优先尝试标准zipfile
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                if any(info.flag_bits & 0x1 for info in zip_ref.infolist()) and not pwd:
-                    logger.error("ZIP文件受密码保护，但未提供密码")
-                    return {"success": False, "error": "ZIP文件受密码保护，请提供密码"}
-                logger.debug(f"解压所有文件到: {extract_dir}")
-                zip_ref.extractall(path=extract_dir, pwd=pwd)
-        except (RuntimeError, zipfile.BadZipFile, NotImplementedError, OSError) as e:
-            logger.warning(f"标准库zipfile解压失败，尝试使用7z工具处理。错误信息: {e}")
-            # 组装7z命令
-            cmd = ['7z', 'x', '-y', f'-o{extract_dir}']
-            if password:
-                cmd.append(f'-p{password}')
-            cmd.append(zip_path)
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            logger.debug(f"7z输出: {result.stdout}")
-            if result.returncode != 0:
-                logger.error(f"7z解压失败: {result.stderr.strip()}")
-                return {"success": False, "error": f"7z解压失败: {result.stderr.strip()}"}
+        # 展开嵌套压缩包
+        if max_depth is None:
+            max_depth = settings.UNZIP_MAX_DEPTH
+        lineage_map = expand_nested_archives(extract_dir, [os.path.basename(str(zip_path))], password, max_depth)
 
         # 检查解压目录，收集所有文件
         final_extract_dir = find_files_dir(extract_dir)
@@ -92,7 +248,8 @@ def extract_zip(zip_path: str, extract_dir: str, password: Optional[str] = None)
                 extracted_files.append({
                     "unzip_filename": file,
                     "unzip_filepath": relative_path,
-                    "unzip_filesize": os.path.getsize(file_path)
+                    "unzip_filesize": os.path.getsize(file_path),
+                    "unzip_lineage": _lookup_lineage(file_path, lineage_map)
                 })
 
         logger.info(f"文件解压完成，共 {len(extracted_files)} 个文件")
@@ -104,4 +261,4 @@ def extract_zip(zip_path: str, extract_dir: str, password: Optional[str] = None)
 
     except Exception as e:
         logger.error(f"解压过程中发生异常: {str(e)}")
-        return {"success": False, "error": f"解压异常: {str(e)}"}
\ No newline at end of file
+        return {"success": False, "error": f"解压异常: {str(e)}"}
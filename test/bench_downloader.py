@@ -0,0 +1,117 @@
+"""
+下载器写盘路径的微基准测试
+
+在本地启动一个 aiohttp 文件服务（支持 Range），分别用旧实现（8KB 分块 + aiofiles 逐块写入）
+和当前的 download_file（自适应块大小 + 合并写盘 + 内联 sha256，单连接/分段）下载不同大小的文件，输出耗时和吞吐。
+
+用法:
+    python test/bench_downloader.py [--sizes 1,10,50,90] [--repeat 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiofiles
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.utils.downloader import download_file  # noqa: E402
+from app.utils.http_client import http_client  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def build_app(files: dict) -> web.Application:
+    """按文件大小提供随机内容，支持 Range 请求，以 64KB 分块发送模拟网络传输"""
+    async def handler(request):
+        data = files[request.match_info["name"]]
+        start, end = 0, len(data) - 1
+        status = 200
+        headers = {"Accept-Ranges": "bytes", "ETag": f'"{request.match_info["name"]}"'}
+        range_header = request.headers.get("Range")
+        if range_header:
+            first, last = range_header.split("=")[1].split("-")
+            start, end = int(first), int(last) if last else end
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        headers["Content-Length"] = str(end - start + 1)
+
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        view = memoryview(data)[start:end + 1]
+        for offset in range(0, len(view), 64 * 1024):
+            await response.write(view[offset:offset + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    return app
+
+
+async def legacy_download(url: str, save_path: str) -> int:
+    """旧实现：每次下载新建 ClientSession，8KB 分块，每块一次 aiofiles 写入"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            downloaded = 0
+            async with aiofiles.open(save_path, "wb") as f:
+                async for chunk in response.content.iter_chunked(8192):
+                    downloaded += len(chunk)
+                    await f.write(chunk)
+    return downloaded
+
+
+async def current_download(url: str, save_path: str, segments: int) -> int:
+    settings.DOWNLOAD_SEGMENTS = segments
+    result = await download_file(url, save_path)
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return result["size"]
+
+
+async def run(sizes: list, repeat: int):
+    files = {f"{size}mb.bin": os.urandom(size * MB) for size in sizes}
+    runner = web.AppRunner(build_app(files))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    variants = {
+        "legacy(8KB+aiofiles)": lambda url, path: legacy_download(url, path),
+        "single(coalesced)": lambda url, path: current_download(url, path, segments=1),
+        f"segmented(x{settings.DOWNLOAD_SEGMENTS})": lambda url, path, n=settings.DOWNLOAD_SEGMENTS:
+            current_download(url, path, segments=n),
+    }
+
+    print(f"{'size':>8} {'variant':<24} {'best(s)':>9} {'MB/s':>9}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            url = f"http://127.0.0.1:{port}/{size}mb.bin"
+            for name, func in variants.items():
+                timings = []
+                for i in range(repeat):
+                    save_path = os.path.join(temp_dir, f"{size}_{i}.bin")
+                    start = time.perf_counter()
+                    await func(url, save_path)
+                    timings.append(time.perf_counter() - start)
+                    os.remove(save_path)
+                best = min(timings)
+                print(f"{size:>6}MB {name:<24} {best:>9.3f} {size / best:>9.1f}")
+
+    await http_client.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下载器写盘路径微基准测试")
+    parser.add_argument("--sizes", default="1,10,50,90", help="文件大小列表(MB)，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合重复次数，取最好成绩")
+    args = parser.parse_args()
+    asyncio.run(run([int(size) for size in args.sizes.split(",")], args.repeat))
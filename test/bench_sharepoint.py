@@ -0,0 +1,153 @@
+"""
+SharePoint 接口的压测脚本
+
+在本地启动模拟的 Graph/登录服务（mock_graph_server.py），msal 通过注入的 http_client 把令牌请求改写到模拟服务，
+Graph 请求通过 GRAPH_API_BASE 指向模拟服务。按不同并发数调用上传、单个移动和批量移动接口，
+输出成功数、耗时、吞吐、延迟分位数，以及模拟服务收到的请求数和限流次数。
+
+用法:
+    python test/bench_sharepoint.py [--files 40] [--size-kb 256] [--concurrency 1,4,16] [--latency 0.05]
+                                    [--throttle-rate 0.05] [--failure-rate 0.0]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.api.endpoints import sharepoint  # noqa: E402
+from app.utils.graph_client import graph_client, graph_http  # noqa: E402
+from app.utils.msal_token_cache import msal_token_cache  # noqa: E402
+from mock_graph_server import MockGraphServer  # noqa: E402
+
+CLIENT_INFO = {"client_id": "bench-client", "client_secret": "bench-secret"}
+TENANT_INFO = {"tenant_id": "bench-tenant", "tenant_name": "bench"}
+SITE_NAME = "bench"
+
+
+class RedirectSession(requests.Session):
+    """把 msal 发往 https://login.microsoftonline.com 等地址的请求改写到本地模拟服务"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        split = urlsplit(url)
+        url = f"{self.base_url}{split.path}" + (f"?{split.query}" if split.query else "")
+        return super().request(method, url, *args, **kwargs)
+
+
+def _percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent))] if values else 0.0
+
+
+async def _timed(semaphore: asyncio.Semaphore, coroutine_factory):
+    async with semaphore:
+        start = time.perf_counter()
+        response = await coroutine_factory()
+        return response.success, time.perf_counter() - start, response.file_id
+
+
+def _report(phase: str, concurrency: int, results: list, elapsed: float, server: MockGraphServer, before: dict):
+    ok = sum(1 for success, _, _ in results if success)
+    latencies = [latency for _, latency, _ in results]
+    after = server.stats()
+    requests_sent = after.get("requests", 0) - before.get("requests", 0)
+    throttled = after.get("throttled", 0) - before.get("throttled", 0)
+    print(f"{phase:<8} {concurrency:>4} {ok:>4}/{len(results):<4} {elapsed:>8.2f} {len(results) / elapsed:>8.1f} "
+          f"{statistics.median(latencies) if latencies else 0:>8.3f} {_percentile(latencies, 0.95):>8.3f} "
+          f"{requests_sent:>8} {throttled:>6}")
+
+
+async def run(args):
+    server = MockGraphServer(latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+                             retry_after=args.retry_after, failure_rate=args.failure_rate,
+                             token_latency=args.token_latency, seed=args.seed)
+    base_url = await server.start()
+    settings.GRAPH_API_BASE = server.graph_base
+    settings.GRAPH_RETRY_BACKOFF = args.retry_backoff
+    msal_token_cache.http_client = RedirectSession(base_url)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for index in range(args.files):
+            path = os.path.join(temp_dir, f"statement_{index:04d}.pdf")
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.size_kb * 1024))
+            paths.append(path)
+
+        print(f"{'phase':<8} {'conc':>4} {'ok/total':>9} {'wall(s)':>8} {'req/s':>8} {'p50(s)':>8} {'p95(s)':>8} "
+              f"{'graph':>8} {'429':>6}")
+        for concurrency in args.concurrency:
+            semaphore = asyncio.Semaphore(concurrency)
+            prefix = f"bench/c{concurrency}"
+
+            # 1. 上传到暂存文件夹
+            def upload(path):
+                request = sharepoint.UploadSharepointFileRequest(
+                    client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+                    upload_info={"site_name": SITE_NAME, "folder_path": f"{prefix}/staging", "local_path": path})
+                return lambda: sharepoint.upload_file_to_sharepoint(request)
+
+            before, start = server.stats(), time.perf_counter()
+            results = await asyncio.gather(*[_timed(semaphore, upload(path)) for path in paths])
+            _report("upload", concurrency, results, time.perf_counter() - start, server, before)
+            file_ids = [file_id for success, _, file_id in results if success]
+
+            # 2. 逐个移动到归档文件夹
+            def move(file_id, index):
+                request = sharepoint.MoveSharepointFileRequest(
+                    client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+                    move_info={"file_id": file_id, "site_name": SITE_NAME,
+                               "target_folder_path": f"{prefix}/archive/{index % 4}"})
+                return lambda: sharepoint.move_file_sharepoint(request)
+
+            before, start = server.stats(), time.perf_counter()
+            results = await asyncio.gather(*[_timed(semaphore, move(file_id, index))
+                                             for index, file_id in enumerate(file_ids)])
+            _report("move", concurrency, results, time.perf_counter() - start, server, before)
+
+            # 3. 批量移动（$batch）回到另一个文件夹
+            request = sharepoint.BulkMoveSharepointFileRequest(
+                client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+                move_items=[{"file_id": file_id, "site_name": SITE_NAME, "target_folder_path": f"{prefix}/bulk"}
+                            for file_id in file_ids])
+            before, start = server.stats(), time.perf_counter()
+            response = await sharepoint.move_files_sharepoint_bulk(request)
+            elapsed = time.perf_counter() - start
+            bulk_results = [(result.success, elapsed, result.file_id) for result in response.results]
+            _report("bulk", len(file_ids), bulk_results, elapsed, server, before)
+
+    print(f"\nmock: {server.stats()}")
+    print(f"graph_client: {graph_client.stats()}")
+    print(f"msal_token_cache: {msal_token_cache.stats()}")
+    await graph_http.close()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SharePoint 接口压测（本地模拟 Graph 服务）")
+    parser.add_argument("--files", type=int, default=40, help="每轮上传的文件数")
+    parser.add_argument("--size-kb", type=int, default=256, help="文件大小(KB)，超过分块上传阈值时走上传会话")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发数列表，逗号分隔")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务每个请求的延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="模拟服务的随机延迟上限(秒)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="模拟服务返回429的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟服务返回500的概率")
+    parser.add_argument("--token-latency", type=float, default=0.2, help="令牌接口的延迟(秒)")
+    parser.add_argument("--retry-backoff", type=float, default=0.1, help="客户端未收到 Retry-After 时的退避基数(秒)")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    asyncio.run(run(args))
@@ -0,0 +1,442 @@
+"""
+Microsoft Graph 和登录服务的本地模拟
+
+只实现 sharepoint.py 用到的接口：站点、文档库、按路径/按名称查找文件、创建文件夹、单次上传（content PUT）、
+分块上传会话、PATCH 移动/重命名、$batch，以及 msal 客户端凭证流程需要的 OIDC 发现和令牌接口。
+文件只保存大小和 quickXorHash，不保存内容。支持注入延迟、限流(429 + Retry-After)、随机失败(500)和令牌撤销（revoked_tokens 中的令牌返回 401），
+用于在不访问真实租户的情况下测试和压测 SharePoint 接口。
+
+用法:
+    python test/mock_graph_server.py [--port 8001] [--latency 0.05] [--throttle-rate 0.05] [--failure-rate 0.01]
+
+Graph 地址为 http://127.0.0.1:{port}/v1.0；msal 只接受 https 的登录地址，
+令牌请求需要通过 msal 的 http_client 改写到本服务（见 bench_sharepoint.py 中的 RedirectSession）。
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import sys
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.quickxorhash import QuickXorHash  # noqa: E402
+
+GRAPH_PREFIX = "/v1.0"
+
+# (方法, 路径正则, 处理函数名)，路径为去掉 /v1.0 前缀、未解码的原始路径
+GRAPH_ROUTES = [
+    ("GET", r"/sites/([^/]+):/sites/([^/]+)", "get_site"),
+    ("GET", r"/sites/([^/]+)/drives", "list_drives"),
+    ("GET", r"/drives/([^/]+)", "get_drive"),
+    ("GET", r"/drives/([^/]+)/root", "get_root"),
+    ("GET", r"/drives/([^/]+)/root:/(.+)", "get_by_path"),
+    ("POST", r"/drives/([^/]+)/items/([^/:]+)/children", "create_folder"),
+    ("GET", r"/drives/([^/]+)/items/([^/:]+):/([^:]+)", "get_child"),
+    ("PUT", r"/drives/([^/]+)/items/([^/:]+):/([^:]+):/content", "put_content"),
+    ("POST", r"/drives/([^/]+)/items/([^/:]+):/([^:]+):/createUploadSession", "create_upload_session"),
+    ("PATCH", r"/drives/([^/]+)/items/([^/:]+)", "move_item"),
+]
+
+
+def _error(status: int, code: str, message: str) -> tuple:
+    return status, {}, {"error": {"code": code, "message": message}}
+
+
+class MockGraphServer:
+    """
+    内存中的 Graph 模拟服务
+
+    :param latency: 每个请求的固定延迟(秒)
+    :param jitter: 在固定延迟上叠加的随机延迟上限(秒)
+    :param throttle_rate: 返回 429 的概率
+    :param retry_after: 限流响应的 Retry-After(秒)
+    :param failure_rate: 返回 500 的概率
+    :param token_latency: 令牌接口的延迟(秒)
+    :param seed: 随机数种子，便于复现
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: int = 1, failure_rate: float = 0.0, token_latency: float = 0.0,
+                 seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.failure_rate = failure_rate
+        self.token_latency = token_latency
+        self._random = random.Random(seed)
+
+        self.base_url = None
+        self._runner = None
+        self._sites = {}
+        self._drives = {}
+        self._items = {}
+        self._children = {}
+        self._sessions = {}
+        self.revoked_tokens = set()
+        self.counters = Counter()
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_route("*", "/{tail:.*}", self._dispatch)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务，返回根地址（例如 http://127.0.0.1:8001）"""
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def graph_base(self) -> str:
+        return f"{self.base_url}{GRAPH_PREFIX}"
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+    # ------------------------------------------------------------------
+    # 请求分发和故障注入
+    # ------------------------------------------------------------------
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        raw_path = request.raw_path.split("?", 1)[0]
+        body = await request.read()
+
+        if not raw_path.startswith(GRAPH_PREFIX) and not raw_path.startswith("/upload/"):
+            return await self._login(request, raw_path)
+
+        await self._delay()
+        if request.headers.get("Authorization", "")[len("Bearer "):] in self.revoked_tokens:
+            self.counters["unauthorized"] += 1
+            return self._respond(*_error(401, "InvalidAuthenticationToken", "访问令牌已被撤销"))
+        injected = self._roll()
+        if injected:
+            return self._respond(*injected)
+
+        if raw_path == f"{GRAPH_PREFIX}/$batch":
+            self.counters["batch"] += 1
+            return self._respond(*await self._batch(json.loads(body)))
+
+        query = {key: values[0] for key, values in parse_qs(request.query_string).items()}
+        return self._respond(*self.handle(request.method, raw_path, query, dict(request.headers), body))
+
+    async def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _roll(self):
+        """按配置的限流和失败概率处理请求，返回注入的响应或 None"""
+        self.counters["requests"] += 1
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            self.counters["throttled"] += 1
+            status, headers, body = _error(429, "TooManyRequests", "请求过多")
+            return status, {"Retry-After": str(self.retry_after)}, body
+        if roll < self.throttle_rate + self.failure_rate:
+            self.counters["failed"] += 1
+            return _error(500, "generalException", "注入的随机失败")
+        return None
+
+    @staticmethod
+    def _respond(status: int, headers: dict, body) -> web.Response:
+        if body is None:
+            return web.Response(status=status, headers=headers)
+        return web.json_response(body, status=status, headers=headers)
+
+    def handle(self, method: str, raw_path: str, query: dict, headers: dict, body: bytes) -> tuple:
+        """处理单个 Graph 请求（也用于 $batch 中的子请求），返回 (状态码, 响应头, JSON)"""
+        if raw_path.startswith("/upload/"):
+            session_id = raw_path[len("/upload/"):]
+            self.counters[f"upload_chunk_{method.lower()}"] += 1
+            if method == "GET":
+                return self._session_status(session_id)
+            return self._upload_chunk(session_id, headers, body)
+
+        path = raw_path[len(GRAPH_PREFIX):] if raw_path.startswith(GRAPH_PREFIX) else raw_path
+        for route_method, pattern, name in GRAPH_ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                self.counters[name] += 1
+                args = [unquote(group) for group in match.groups()]
+                return getattr(self, f"_{name}")(*args, query=query, body=body)
+        return _error(400, "invalidRequest", f"模拟服务不支持: {method} {raw_path}")
+
+    async def _batch(self, payload: dict) -> tuple:
+        requests = payload.get("requests", [])
+        if len(requests) > 20:
+            return _error(400, "invalidRequest", "批处理请求最多包含20个子请求")
+        responses = []
+        for item in requests:
+            # 子请求同样可能被限流或失败（延迟只在整个批处理请求上计算一次）
+            injected = self._roll()
+            if injected is None:
+                split = urlsplit(item["url"])
+                query = {key: values[0] for key, values in parse_qs(split.query).items()}
+                body = json.dumps(item.get("body")).encode() if item.get("body") is not None else b""
+                injected = self.handle(item["method"], split.path, query, item.get("headers", {}), body)
+            status, headers, body = injected
+            responses.append({"id": item["id"], "status": status, "headers": headers, "body": body})
+        return 200, {}, {"responses": responses}
+
+    # ------------------------------------------------------------------
+    # 登录服务（OIDC 发现 + 客户端凭证令牌）
+    # ------------------------------------------------------------------
+
+    async def _login(self, request: web.Request, raw_path: str) -> web.Response:
+        parts = [part for part in raw_path.split("/") if part]
+        if raw_path.endswith("/common/discovery/instance"):
+            return web.json_response({"tenant_discovery_endpoint": "", "metadata": []})
+        if raw_path.endswith("/v2.0/.well-known/openid-configuration"):
+            tenant = parts[0]
+            root = f"https://{request.host}/{tenant}"
+            return web.json_response({
+                "authorization_endpoint": f"{root}/oauth2/v2.0/authorize",
+                "token_endpoint": f"{root}/oauth2/v2.0/token",
+                "issuer": f"{root}/v2.0",
+            })
+        if raw_path.endswith("/oauth2/v2.0/token"):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            return self._token(parts[0])
+        return web.json_response({"error": "not_found"}, status=404)
+
+    def _token(self, tenant: str) -> web.Response:
+        self.counters["token"] += 1
+        claims = base64.urlsafe_b64encode(json.dumps({"tid": tenant}).encode()).decode().rstrip("=")
+        return web.json_response({
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "access_token": f"header.{claims}.{uuid.uuid4().hex}",
+        })
+
+    # ------------------------------------------------------------------
+    # 文档库内容
+    # ------------------------------------------------------------------
+
+    def _new_item(self, drive_id: str, parent_id, name: str, folder: bool, size: int = 0,
+                  quick_xor_hash: str = None) -> dict:
+        item = {"id": uuid.uuid4().hex, "name": name, "drive_id": drive_id, "parent_id": parent_id,
+                "folder": folder, "size": size, "hash": quick_xor_hash}
+        self._items[item["id"]] = item
+        if parent_id is not None:
+            self._children[(parent_id, name.casefold())] = item["id"]
+        return item
+
+    def _path_of(self, item: dict) -> str:
+        names = []
+        while item["parent_id"] is not None:
+            names.append(item["name"])
+            item = self._items[item["parent_id"]]
+        return "/".join(reversed(names))
+
+    def _item_json(self, item: dict) -> dict:
+        data = {
+            "id": item["id"],
+            "name": item["name"],
+            "size": item["size"],
+            "webUrl": f"https://mock.sharepoint.com/Shared%20Documents/{self._path_of(item)}",
+            "parentReference": {"driveId": item["drive_id"], "id": item["parent_id"]},
+        }
+        if item["folder"]:
+            data["folder"] = {"childCount": sum(1 for key in self._children if key[0] == item["id"])}
+        else:
+            data["file"] = {"hashes": {"quickXorHash": item["hash"]}}
+        return data
+
+    def _folder(self, drive_id: str, folder_id: str):
+        item = self._items.get(folder_id)
+        if item is None or item["drive_id"] != drive_id or not item["folder"]:
+            return None
+        return item
+
+    def _get_site(self, hostname: str, site_name: str, **_) -> tuple:
+        if site_name not in self._sites:
+            site_id = f"{hostname},{uuid.uuid4()}"
+            drive_id = f"b!{uuid.uuid4().hex}"
+            root = self._new_item(drive_id, None, "root", folder=True)
+            self._sites[site_name] = site_id
+            self._drives[site_id] = {"id": drive_id, "name": "Documents", "root": root["id"]}
+        return 200, {}, {"id": self._sites[site_name], "name": site_name}
+
+    def _list_drives(self, site_id: str, **_) -> tuple:
+        drive = self._drives.get(site_id)
+        if drive is None:
+            return _error(404, "itemNotFound", "站点不存在")
+        return 200, {}, {"value": [{"id": drive["id"], "name": drive["name"]}]}
+
+    def _root_id(self, drive_id: str):
+        return next((drive["root"] for drive in self._drives.values() if drive["id"] == drive_id), None)
+
+    def _get_drive(self, drive_id: str, **_) -> tuple:
+        if self._root_id(drive_id) is None:
+            return _error(404, "itemNotFound", "文档库不存在")
+        return 200, {}, {"id": drive_id}
+
+    def _get_root(self, drive_id: str, **_) -> tuple:
+        root_id = self._root_id(drive_id)
+        if root_id is None:
+            return _error(404, "itemNotFound", "文档库不存在")
+        return 200, {}, self._item_json(self._items[root_id])
+
+    def _get_by_path(self, drive_id: str, path: str, **_) -> tuple:
+        item_id = self._root_id(drive_id)
+        for segment in [segment for segment in path.split("/") if segment]:
+            item_id = self._children.get((item_id, segment.casefold()))
+            if item_id is None:
+                return _error(404, "itemNotFound", f"路径不存在: {path}")
+        if item_id is None:
+            return _error(404, "itemNotFound", "文档库不存在")
+        return 200, {}, self._item_json(self._items[item_id])
+
+    def _create_folder(self, drive_id: str, parent_id: str, body: bytes, **_) -> tuple:
+        if self._folder(drive_id, parent_id) is None:
+            return _error(404, "itemNotFound", "父文件夹不存在")
+        payload = json.loads(body)
+        if (parent_id, payload["name"].casefold()) in self._children:
+            return _error(409, "nameAlreadyExists", f"名称已存在: {payload['name']}")
+        item = self._new_item(drive_id, parent_id, payload["name"], folder=True)
+        return 201, {}, self._item_json(item)
+
+    def _get_child(self, drive_id: str, parent_id: str, name: str, **_) -> tuple:
+        if self._folder(drive_id, parent_id) is None:
+            return _error(404, "itemNotFound", "父文件夹不存在")
+        item_id = self._children.get((parent_id, name.casefold()))
+        if item_id is None:
+            return _error(404, "itemNotFound", f"文件不存在: {name}")
+        return 200, {}, self._item_json(self._items[item_id])
+
+    def _store_file(self, drive_id: str, parent_id: str, name: str, conflict_behavior: str,
+                    size: int, quick_xor_hash: str) -> tuple:
+        if self._folder(drive_id, parent_id) is None:
+            return _error(404, "itemNotFound", "父文件夹不存在")
+        existing_id = self._children.get((parent_id, name.casefold()))
+        if existing_id is not None:
+            if conflict_behavior == "fail":
+                return _error(409, "nameAlreadyExists", f"名称已存在: {name}")
+            if conflict_behavior == "rename":
+                stem, ext = os.path.splitext(name)
+                counter = 1
+                while (parent_id, f"{stem} {counter}{ext}".casefold()) in self._children:
+                    counter += 1
+                name = f"{stem} {counter}{ext}"
+            else:
+                existing = self._items[existing_id]
+                existing.update(size=size, hash=quick_xor_hash)
+                return 200, {}, self._item_json(existing)
+        item = self._new_item(drive_id, parent_id, name, folder=False, size=size, quick_xor_hash=quick_xor_hash)
+        return 201, {}, self._item_json(item)
+
+    def _put_content(self, drive_id: str, parent_id: str, name: str, query: dict, body: bytes) -> tuple:
+        hasher = QuickXorHash()
+        hasher.update(body)
+        conflict_behavior = query.get("@microsoft.graph.conflictBehavior", "replace")
+        return self._store_file(drive_id, parent_id, name, conflict_behavior, len(body), hasher.base64digest())
+
+    def _create_upload_session(self, drive_id: str, parent_id: str, name: str, body: bytes, **_) -> tuple:
+        if self._folder(drive_id, parent_id) is None:
+            return _error(404, "itemNotFound", "父文件夹不存在")
+        conflict_behavior = (json.loads(body or b"{}").get("item") or {}).get(
+            "@microsoft.graph.conflictBehavior", "replace")
+        if conflict_behavior == "fail" and (parent_id, name.casefold()) in self._children:
+            return _error(409, "nameAlreadyExists", f"名称已存在: {name}")
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = {"drive_id": drive_id, "parent_id": parent_id, "name": name,
+                                      "conflict_behavior": conflict_behavior, "received": 0,
+                                      "hasher": QuickXorHash()}
+        return 200, {}, {"uploadUrl": f"{self.base_url}/upload/{session_id}",
+                         "expirationDateTime": "2099-01-01T00:00:00Z"}
+
+    def _session_status(self, session_id: str) -> tuple:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return _error(404, "itemNotFound", "上传会话不存在或已过期")
+        return 200, {}, {"nextExpectedRanges": [f"{session['received']}-"]}
+
+    def _upload_chunk(self, session_id: str, headers: dict, body: bytes) -> tuple:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return _error(404, "itemNotFound", "上传会话不存在或已过期")
+        start, rest = headers["Content-Range"].split(" ", 1)[1].split("-", 1)
+        end, total = (int(value) for value in rest.split("/"))
+        if int(start) != session["received"] or end - int(start) + 1 != len(body):
+            return _error(416, "invalidRange", f"期望从 {session['received']} 开始")
+
+        session["hasher"].update(body)
+        session["received"] += len(body)
+        if session["received"] < total:
+            return 202, {}, {"nextExpectedRanges": [f"{session['received']}-"]}
+
+        self._sessions.pop(session_id)
+        return self._store_file(session["drive_id"], session["parent_id"], session["name"],
+                                session["conflict_behavior"], total, session["hasher"].base64digest())
+
+    def _move_item(self, drive_id: str, item_id: str, body: bytes, **_) -> tuple:
+        item = self._items.get(item_id)
+        if item is None or item["drive_id"] != drive_id:
+            return _error(404, "itemNotFound", "文件不存在")
+        payload = json.loads(body)
+        parent_id = (payload.get("parentReference") or {}).get("id", item["parent_id"])
+        name = payload.get("name", item["name"])
+        if self._folder(drive_id, parent_id) is None:
+            return _error(404, "itemNotFound", "目标文件夹不存在")
+        existing_id = self._children.get((parent_id, name.casefold()))
+        if existing_id is not None and existing_id != item_id:
+            return _error(409, "nameAlreadyExists", f"名称已存在: {name}")
+
+        self._children.pop((item["parent_id"], item["name"].casefold()), None)
+        item.update(parent_id=parent_id, name=name)
+        self._children[(parent_id, name.casefold())] = item_id
+        return 200, {}, self._item_json(item)
+
+
+async def _serve(args):
+    server = MockGraphServer(latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+                             retry_after=args.retry_after, failure_rate=args.failure_rate,
+                             token_latency=args.token_latency, seed=args.seed)
+    await server.start(args.host, args.port)
+    print(f"模拟 Graph 服务已启动: {server.graph_base}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microsoft Graph 本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限(秒)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="限流响应的 Retry-After(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="令牌接口的延迟(秒)")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,38 @@
+import asyncio
+import random
+
+from app.api.endpoints.giin_search import GIINService
+from app.utils.aho_corasick import AhoCorasick
+
+
+def test_search_finds_every_occurring_pattern():
+    rng = random.Random(3)
+    patterns = ["he", "she", "his", "hers", "a", "ab", "bab", "北京", "京银"] + \
+               ["".join(rng.choice("abc") for _ in range(rng.randint(1, 5))) for _ in range(50)]
+    automaton = AhoCorasick(patterns)
+    texts = ["ushers", "北京银行", ""] + ["".join(rng.choice("abcd") for _ in range(30)) for _ in range(200)]
+    for text in texts:
+        expected = {pattern_id for pattern_id, pattern in enumerate(patterns) if pattern in text}
+        assert automaton.search(text) == expected
+
+
+def test_batch_lookup_matches_per_entity_lookup(tmp_path):
+    rng = random.Random(5)
+    words = ["alpha", "beta", "gamma", "bank", "trust", "fund", "ltd", "co.", "(hk)", "AG"]
+    names = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) for _ in range(2000)]
+    csv_path = tmp_path / "FFIListFull.csv"
+    lines = ["GIIN,FINm,CountryNm"] + [f"G{row:05d}.00000.SL.344,\"{name}\",HK" for row, name in enumerate(names)]
+    csv_path.write_text("\n".join(lines), encoding="utf-8")
+
+    service = GIINService()
+    service.csv_path = csv_path
+    service.snapshot_path = csv_path.with_suffix(".arrow")
+    service.index_path = csv_path.with_suffix(".trigram.arrow")
+    assert asyncio.run(service.load_csv_data())
+
+    queries = ["ALPHA BANK", "trust fund", "ag", "gamma gamma", "bank (hk)", "co. ltd", "missing", ""]
+    for snapshot in (service._snapshot, {**service._snapshot, "index": None}):
+        batch = service.find_giin_batch(queries, snapshot)
+        assert set(batch) == {"ALPHA BANK", "trust fund", "ag", "gamma gamma", "missing"}
+        for query, giin in batch.items():
+            assert giin == service.find_giin_by_entity_name(query, snapshot)
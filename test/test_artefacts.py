@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+import pytest
+
+from app.utils.artefacts import ArtefactRegistry
+
+
+def test_allocate_lookup_and_release(tmp_path):
+    registry = ArtefactRegistry(tmp_path / "dataroom", ["hsbc_daily_cash_"], max_age_seconds=3600, retention_days=7)
+
+    with pytest.raises(ValueError):
+        registry.allocate("unknown_", "request-1")
+    path = registry.allocate("hsbc_daily_cash_", "request-1")
+    with pytest.raises(ValueError):
+        registry.allocate("hsbc_daily_cash_", "request-1")
+    assert path.parent == tmp_path / "dataroom" and path.name.startswith("hsbc_daily_cash_")
+    assert path.suffix == ".feather"
+    assert registry.lookup("request-1")["path"] == path
+    assert registry.lookup("request-2") is None
+
+    path.write_bytes(b"feather")
+    registry.release("request-1")
+    registry.release("request-1")
+    assert not path.exists()
+    assert registry.lookup("request-1") is None
+    assert registry.stats() == {"registered": 0, "allocated": 1, "released": 1, "swept": 0}
+
+
+def test_sweep_removes_expired_registrations_and_stale_files(tmp_path):
+    registry = ArtefactRegistry(tmp_path, ["hsbc_daily_cash_"], max_age_seconds=3600, retention_days=7)
+    expired = registry.allocate("hsbc_daily_cash_", "expired")
+    current = registry.allocate("hsbc_daily_cash_", "current")
+    registry.lookup("expired")["created_at"] -= 7200
+    for path in (expired, current):
+        path.write_bytes(b"feather")
+
+    # 进程中断遗留、未登记的文件：超过保留天数的删除，其它前缀的文件不处理
+    stale = tmp_path / "hsbc_daily_cash_20200101_000000_abcdef01.feather"
+    recent = tmp_path / "hsbc_daily_cash_20260101_000000_abcdef02.feather"
+    other = tmp_path / "other_20200101.feather"
+    for path in (stale, recent, other):
+        path.write_bytes(b"feather")
+    os.utime(stale, (0, 0))
+    os.utime(other, (0, 0))
+
+    deleted = asyncio.run(registry.sweep())
+
+    assert deleted == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([current.name, recent.name, other.name])
+    assert registry.lookup("expired") is None and registry.lookup("current") is not None
+    assert registry.stats()["swept"] == 2
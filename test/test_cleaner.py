@@ -0,0 +1,27 @@
+import asyncio
+import os
+
+from app.utils.cleaner import TempDirJanitor
+
+
+def test_janitor_backfills_and_deletes_only_expired(tmp_path):
+    (tmp_path / "old_task").mkdir()
+    os.utime(tmp_path / "old_task", (0, 0))
+    (tmp_path / "new_task").mkdir()
+    (tmp_path / "giin").mkdir()
+
+    async def run():
+        janitor = TempDirJanitor(tmp_path, ttl_seconds=3600, interval_seconds=60,
+                                 delete_pause_seconds=0, batch_size=10)
+        assert janitor.backfill() == 2
+        result = await janitor.run_once()
+        await janitor.register(tmp_path / "new_task", ttl_seconds=0)
+        result_after_expiry = await janitor.run_once()
+        await janitor.stop()
+        return result, result_after_expiry
+
+    result, result_after_expiry = asyncio.run(run())
+    assert result["deleted"] >= 1
+    assert result["task_dirs"] == 1
+    assert result_after_expiry["deleted"] >= 1
+    assert sorted(os.listdir(tmp_path)) == [".janitor.sqlite3", "giin"]
@@ -0,0 +1,280 @@
+import asyncio
+import gzip
+import hashlib
+import os
+from aiohttp import web
+from app.core.config import settings
+from app.utils import downloader
+from app.utils.downloader import download_file
+from app.utils.download_governor import DownloadGovernor, DownloadPriority
+from app.utils.http_client import http_client
+
+
+def _make_app(data: bytes, calls: list, etags: list, interrupt_call: int):
+    """
+    构造本地文件服务：支持 Range/If-Range，第 interrupt_call 个请求在传输一半时断开连接
+    """
+    async def handler(request):
+        range_header = request.headers.get("Range")
+        etag = etags[min(len(calls), len(etags) - 1)]
+        calls.append({"range": range_header, "if_range": request.headers.get("If-Range")})
+
+        start, end = 0, len(data) - 1
+        if range_header and request.headers.get("If-Range", etag) == etag:
+            first, last = range_header.split("=")[1].split("-")
+            start, end = int(first), int(last) if last else end
+
+        headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+        status = 200
+        if range_header and (start, end) != (0, len(data) - 1):
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        body = data[start:end + 1]
+        if len(calls) == interrupt_call + 1:
+            await response.write(body[:len(body) // 2])
+            request.transport.close()
+            return response
+        await response.write(body)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/file.zip", handler)
+    return app
+
+
+def _run_download(tmp_path, data: bytes, etags: list, interrupt_call: int = 0):
+    calls = []
+
+    async def main():
+        runner = web.AppRunner(_make_app(data, calls, etags, interrupt_call))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await download_file(f"http://127.0.0.1:{port}/file.zip", str(tmp_path / "file.zip"))
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    return asyncio.run(main()), calls
+
+
+def test_download_resumes_with_range_after_interruption(tmp_path, monkeypatch):
+    """
+    测试连接中断后通过 Range 从已下载位置续传
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_RETRY_BACKOFF", 0.01)
+    data = os.urandom(512 * 1024)
+
+    result, calls = _run_download(tmp_path, data, ['"v1"'])
+
+    assert result["success"], result
+    assert (tmp_path / "file.zip").read_bytes() == data
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    # 小文件直接使用第一次完整请求的响应，不发送额外的探测请求
+    assert len(calls) == 2
+    assert calls[0]["range"] is None
+    assert calls[1]["range"] is not None and calls[1]["if_range"] == '"v1"'
+
+
+def test_download_restarts_when_file_changed(tmp_path, monkeypatch):
+    """
+    测试续传时文件 ETag 已变化，服务端返回完整内容，客户端从头重新下载
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_RETRY_BACKOFF", 0.01)
+    data = os.urandom(512 * 1024)
+
+    result, calls = _run_download(tmp_path, data, ['"v1"', '"v2"'])
+
+    assert result["success"], result
+    assert (tmp_path / "file.zip").read_bytes() == data
+    assert result["size"] == len(data)
+
+
+def test_download_large_file_in_parallel_segments(tmp_path, monkeypatch):
+    """
+    测试超过阈值的文件分段并发下载，中断的分段单独续传
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_THRESHOLD", 256 * 1024)
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_MIN_SIZE", 64 * 1024)
+    data = os.urandom(1024 * 1024 + 17)
+
+    result, calls = _run_download(tmp_path, data, ['"v1"'], interrupt_call=1)
+
+    assert result["success"], result
+    assert result["mode"] == "segmented"
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "file.zip").read_bytes() == data
+    # 第一次完整请求只读取响应头，之后每个分段一个请求，中断的分段再续传一次
+    assert calls[0]["range"] is None
+    assert len(calls) == settings.DOWNLOAD_SEGMENTS + 2
+
+
+def test_segments_share_host_limit_and_yield_slot_while_backing_off(tmp_path, monkeypatch):
+    """
+    测试分段下载的每个分段占一个主机名额（分段数不超过主机并发上限），某个分段退避等待期间让出名额给高优先级下载
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_THRESHOLD", 64 * 1024)
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_MIN_SIZE", 16 * 1024)
+    governor = DownloadGovernor(global_limit=8, per_host_limit=2)
+    monkeypatch.setattr(downloader, "download_governor", governor)
+    data = os.urandom(256 * 1024)
+    calls, active, peak = [], [0], [0]
+
+    async def handler(request):
+        range_header = request.headers.get("Range")
+        calls.append(range_header)
+        if len(calls) == 2:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        start, end = 0, len(data) - 1
+        if range_header:
+            first, last = range_header.split("=")[1].split("-")
+            start, end = int(first), int(last)
+        headers = {"ETag": '"v1"', "Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+        if range_header:
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        response = web.StreamResponse(status=206 if range_header else 200, headers=headers)
+        await response.prepare(request)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        try:
+            for position in range(start, end + 1, 16 * 1024):
+                await response.write(data[position:min(position + 16 * 1024, end + 1)])
+                await asyncio.sleep(0.15)
+        finally:
+            active[0] -= 1
+        await response.write_eof()
+        return response
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file.zip", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/file.zip"
+
+        async def urgent():
+            async with governor.slot(url, DownloadPriority.HIGH):
+                return True
+
+        try:
+            task = asyncio.create_task(download_file(url, str(tmp_path / "file.zip")))
+            await asyncio.sleep(0.3)
+            # 一个分段在退避等待，另一个分段仍在下载：高优先级下载应能拿到退避分段让出的名额
+            got_slot = await asyncio.wait_for(urgent(), 0.5)
+            return got_slot, await task
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    got_slot, result = asyncio.run(asyncio.wait_for(main(), 20))
+
+    assert got_slot
+    assert result["success"] and result["mode"] == "segmented", result
+    assert (tmp_path / "file.zip").read_bytes() == data
+    # 第一次完整请求 + 2 个分段 + 被 503 的分段重试一次
+    assert len(calls) == 4 and peak[0] <= 2
+
+
+def test_gzip_encoded_download_is_saved_decompressed(tmp_path, monkeypatch):
+    """
+    测试 gzip 编码的响应：保存解压后的内容，不按压缩后的 Content-Length 判定为下载不完整，也不分段下载
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_THRESHOLD", 1024)
+    data = b"account,balance\n" * 50000
+    body = gzip.compress(data)
+    calls = []
+
+    async def handler(request):
+        calls.append(request.headers.get("Range"))
+        return web.Response(body=body, headers={"Content-Encoding": "gzip", "Accept-Ranges": "bytes",
+                                                "ETag": '"v1"', "Content-Length": str(len(body))})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file.csv", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/file.csv"
+        try:
+            return await download_file(url, str(tmp_path / "file.csv"))
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    result = asyncio.run(main())
+
+    assert result["success"], result
+    assert (result["mode"], result["attempts"], result["size"]) == ("single", 1, len(data))
+    assert (tmp_path / "file.csv").read_bytes() == data
+    assert calls == [None]
+
+
+def test_failed_download_removes_partial_file_and_yields_slot(tmp_path, monkeypatch):
+    """
+    测试服务端不支持续传且连接反复中断时，失败后不留下未完成的文件，退避等待期间让出下载名额
+    """
+    monkeypatch.setattr(settings, "DOWNLOAD_RETRY_BACKOFF", 0.6)
+    monkeypatch.setattr(settings, "DOWNLOAD_MAX_RETRIES", 1)
+    governor = DownloadGovernor(global_limit=1, per_host_limit=1)
+    monkeypatch.setattr(downloader, "download_governor", governor)
+    data = os.urandom(256 * 1024)
+
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Length": str(len(data))})
+        await response.prepare(request)
+        await response.write(data[:len(data) // 2])
+        request.transport.close()
+        return response
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file.zip", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/file.zip"
+        try:
+            task = asyncio.create_task(download_file(url, str(tmp_path / "file.zip")))
+            await asyncio.sleep(0.1)
+            # 第一次失败后的退避期间，同一主机的其它下载可以拿到名额
+            async with governor.slot(url):
+                assert not task.done()
+            return await task
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    result = asyncio.run(asyncio.wait_for(main(), 10))
+
+    assert not result["success"]
+    assert not (tmp_path / "file.zip").exists()
+
+
+def test_governor_drops_idle_hosts():
+    """
+    测试主机的下载全部结束后，其信号量从并发控制器中移除
+    """
+    governor = DownloadGovernor(global_limit=2, per_host_limit=1)
+
+    async def fetch(index):
+        async with governor.slot(f"http://host{index % 5}.example/file.zip"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[fetch(index) for index in range(20)])
+
+    asyncio.run(main())
+    assert governor.stats()["hosts"] == {}
+    assert governor.stats()["acquired"] == 20
@@ -0,0 +1,47 @@
+import asyncio
+import random
+
+import pyarrow as pa
+
+from app.api.endpoints.giin_search import GIINService
+from app.utils.trigram_index import TrigramIndex
+
+
+def _random_names(count):
+    rng = random.Random(7)
+    words = ["bank", "trust", "fund", "capital", "holdings", "ltd", "s.a.", "(hk)", "co.,", "Zürich", "北京", "AG"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def test_candidates_contain_every_substring_match(tmp_path):
+    names = [name.lower() for name in _random_names(2000)]
+    index = TrigramIndex.build(pa.chunked_array([names[:700], names[700:]]))
+    index.save(tmp_path / "index.arrow", {"source_digest": "x"})
+    index, metadata = TrigramIndex.open(tmp_path / "index.arrow")
+    assert metadata == {"source_digest": "x"}
+
+    for query in ["bank", "trust fund", "zürich", "北京 ag", "ltd bank (hk)", "capital capital capital"]:
+        expected = [row for row, name in enumerate(names) if query in name]
+        candidates = set(index.candidates([query]).tolist())
+        assert set(expected) <= candidates
+    assert index.candidates(["ab"]) is None
+
+
+def test_indexed_lookup_matches_full_scan(tmp_path):
+    names = _random_names(3000)
+    csv_path = tmp_path / "FFIListFull.csv"
+    lines = ["GIIN,FINm,CountryNm"] + [f"G{row:05d}.00000.SL.344,\"{name}\",HK" for row, name in enumerate(names)]
+    csv_path.write_text("\n".join(lines), encoding="utf-8")
+
+    service = GIINService()
+    service.csv_path = csv_path
+    service.snapshot_path = csv_path.with_suffix(".arrow")
+    service.index_path = csv_path.with_suffix(".trigram.arrow")
+    assert asyncio.run(service.load_csv_data())
+    snapshot = service._snapshot
+    assert snapshot["index"] is not None
+    full_scan = {**snapshot, "index": None}
+
+    for query in ["BANK TRUST", "s.a. fund", "Zürich AG", "(hk)", "co., ltd", "北京", "nothing here", "ab"]:
+        assert service.find_giin_by_entity_name(query, snapshot) == \
+            service.find_giin_by_entity_name(query, full_scan)
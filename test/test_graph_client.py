@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import json
+from aiohttp import web
+from app.utils.graph_client import AdaptiveLimiter, GraphClient
+from app.utils.http_client import HttpClientPool
+
+
+def _token(tenant: str) -> str:
+    claims = base64.urlsafe_b64encode(json.dumps({"tid": tenant}).encode()).decode().rstrip("=")
+    return f"header.{claims}.signature"
+
+
+async def _serve(handler) -> tuple:
+    """启动只有 /v1.0/drives/d/root 一个接口的本地服务，返回 (runner, Graph 根地址)"""
+    app = web.Application()
+    app.router.add_get("/v1.0/drives/d/root", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1.0"
+
+
+def test_rejected_token_is_renewed_once():
+    """
+    测试令牌被拒绝(401)时换取新令牌重试一次，新令牌写回 headers；新令牌仍被拒绝时不再重试
+    """
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers["Authorization"])
+        if request.headers["Authorization"] != "Bearer new":
+            return web.json_response({"error": {"code": "InvalidAuthenticationToken"}}, status=401)
+        return web.json_response({"id": "root"})
+
+    renewals = []
+
+    async def renew(token):
+        renewals.append(token)
+        return "new" if token == "old" else "stale"
+
+    async def main():
+        runner, base_url = await _serve(handler)
+        pool = HttpClientPool("test", 4, 4, 10, 5, 5, 5)
+        client = GraphClient(pool, base_url, max_concurrency=4, request_timeout=5, upload_timeout=5,
+                             token_renewer=renew)
+        try:
+            headers = {"Authorization": "Bearer old"}
+            renewed = await client.request("GET", "/drives/d/root", headers)
+            rejected = await client.request("GET", "/drives/d/root", {"Authorization": "Bearer revoked"})
+        finally:
+            await pool.close()
+            await runner.cleanup()
+        return headers, renewed, rejected, client.stats()
+
+    headers, renewed, rejected, stats = asyncio.run(main())
+    assert renewed.status_code == 200 and headers["Authorization"] == "Bearer new"
+    assert rejected.status_code == 401
+    assert renewals == ["old", "revoked"]
+    assert seen == ["Bearer old", "Bearer new", "Bearer revoked", "Bearer stale"]
+    assert stats["token_renewals"] == 2
+
+
+def test_throttled_requests_wait_retry_after_and_halve_tenant_limit():
+    """
+    测试 429/503 按 Retry-After 等待后重试，被限流的租户并发上限减半、成功后增加，其它租户不受影响；
+    重试次数用完时返回最后一次限流响应
+    """
+    responses = {"contoso": [(429, "1"), (503, "0"), (200, None)], "fabrikam": [(200, None)],
+                 "northwind": [(429, "0"), (429, "0")]}
+
+    async def handler(request):
+        tenant = json.loads(base64.urlsafe_b64decode(
+            request.headers["Authorization"].split(".")[1] + "=="))["tid"]
+        status, retry_after = responses[tenant].pop(0)
+        return web.json_response({}, status=status, headers={"Retry-After": retry_after} if retry_after else {})
+
+    async def main():
+        runner, base_url = await _serve(handler)
+        pool = HttpClientPool("test", 4, 4, 10, 5, 5, 5)
+        client = GraphClient(pool, base_url, max_concurrency=16, request_timeout=5, upload_timeout=5,
+                             max_retries=2, tenant_concurrency=8)
+        exhausted = GraphClient(pool, base_url, max_concurrency=16, request_timeout=5, upload_timeout=5,
+                                max_retries=1, tenant_concurrency=8)
+        try:
+            statuses = [
+                (await client.get("/drives/d/root", headers={"Authorization": f"Bearer {_token(tenant)}"})).status_code
+                for tenant in ("contoso", "fabrikam")]
+            statuses.append((await exhausted.get(
+                "/drives/d/root", headers={"Authorization": f"Bearer {_token('northwind')}"})).status_code)
+        finally:
+            await pool.close()
+            await runner.cleanup()
+        return statuses, client.stats(), exhausted.stats()
+
+    statuses, stats, exhausted_stats = asyncio.run(main())
+    assert statuses == [200, 200, 429]
+    assert (stats["requests"], stats["throttled"], stats["retries"], stats["retry_wait_seconds"]) == (4, 2, 2, 1.0)
+    # 两次限流间隔不少于 1 秒，各减半一次：8 -> 4 -> 2，之后成功一次增加 1/2
+    assert stats["tenants"]["contoso"]["limit"] == 2.5
+    assert stats["tenants"]["fabrikam"]["limit"] == 8.12
+    assert (exhausted_stats["requests"], exhausted_stats["retries"]) == (2, 1)
+    assert exhausted_stats["tenants"]["northwind"]["throttled"] == 2
+
+
+def test_adaptive_limiter_bounds_concurrency():
+    """
+    测试自适应并发限制：同时进行的请求不超过当前上限，同一秒内多次限流只减半一次，成功后增加但不超过 max_limit
+    """
+    async def main():
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=6)
+        peak = 0
+
+        async def work():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[work() for _ in range(20)])
+        first_peak = peak
+        limiter.on_throttle()
+        limiter.on_throttle()
+        throttled_limit = limiter.limit
+        peak = 0
+        await asyncio.gather(*[work() for _ in range(20)])
+        return first_peak, throttled_limit, peak, limiter
+
+    first_peak, throttled_limit, throttled_peak, limiter = asyncio.run(main())
+    assert (first_peak, throttled_limit, throttled_peak) == (4, 2.0, 2)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.stats() == {"limit": 6, "in_flight": 0, "throttled": 2}
@@ -0,0 +1,47 @@
+import asyncio
+from aiohttp import web
+from app.utils.http_cache import HttpCache, cache_key
+from app.utils.http_client import http_client
+
+
+def test_cache_key_ignores_presigned_signature():
+    """
+    测试同一对象的不同预签名URL得到相同的缓存键，其它查询参数保留
+    """
+    first = "https://bucket.s3.amazonaws.com/report.txt?versionId=3&X-Amz-Date=1&X-Amz-Signature=aaa"
+    second = "https://bucket.s3.amazonaws.com/report.txt?versionId=3&X-Amz-Date=2&X-Amz-Signature=bbb"
+    assert cache_key(first) == cache_key(second) == "https://bucket.s3.amazonaws.com/report.txt?versionId=3"
+    assert cache_key("https://a.blob.core.windows.net/c/f?sv=1&se=2&sig=x") == "https://a.blob.core.windows.net/c/f"
+
+
+def test_presigned_urls_revalidate_one_entry(tmp_path):
+    """
+    测试签名不同的URL命中同一个缓存条目（304），请求结束后不保留锁
+    """
+    async def handler(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b"balance", headers={"ETag": '"v1"'})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/report.txt", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/report.txt"
+        cache = HttpCache(tmp_path)
+        try:
+            first = await cache.fetch(f"{base}?X-Amz-Signature=aaa")
+            second = await cache.fetch(f"{base}?X-Amz-Signature=bbb")
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+        return cache, first, second
+
+    cache, first, second = asyncio.run(main())
+    assert (first["status"], second["status"]) == ("downloaded", "not_modified")
+    assert first["path"] == second["path"] and second["path"].read_bytes() == b"balance"
+    assert cache._locks == {}
+    assert sorted(path.name.endswith(".meta.json") for path in tmp_path.iterdir()) == [False, True]
@@ -0,0 +1,47 @@
+import base64
+import os
+
+import pytest
+
+from app.utils.quickxorhash import QuickXorHash, quickxorhash_file
+
+
+def _reference_quickxorhash(data: bytes) -> str:
+    """按微软参考实现（3 个 64 位单元，逐字节移位）逐字节计算，作为对照"""
+    cells = [0, 0, 0]
+    cell_bits = [64, 64, 32]
+    index, offset = 0, 0
+    for byte in data:
+        if offset <= cell_bits[index] - 8:
+            cells[index] ^= byte << offset
+        else:
+            next_index = 0 if index == 2 else index + 1
+            cells[index] ^= (byte << offset) & ((1 << cell_bits[index]) - 1)
+            cells[next_index] ^= byte >> (cell_bits[index] - offset)
+        offset += 11
+        while offset >= cell_bits[index]:
+            offset -= cell_bits[index]
+            index = 0 if index == 2 else index + 1
+
+    digest = bytearray(cells[0].to_bytes(8, "little") + cells[1].to_bytes(8, "little")
+                       + cells[2].to_bytes(4, "little"))
+    for i, value in enumerate(len(data).to_bytes(8, "little")):
+        digest[12 + i] ^= value
+    return base64.b64encode(bytes(digest)).decode("ascii")
+
+
+def test_empty_input():
+    assert QuickXorHash().base64digest() == "AAAAAAAAAAAAAAAAAAAAAAAAAAA="
+
+
+@pytest.mark.parametrize("size, chunk_size", [(1, 1), (159, 7), (160, 160), (1000, 33), (5000, 4096)])
+def test_matches_reference_across_chunk_boundaries(tmp_path, size, chunk_size):
+    data = os.urandom(size)
+    hasher = QuickXorHash()
+    for offset in range(0, size, chunk_size):
+        hasher.update(data[offset:offset + chunk_size])
+    assert hasher.base64digest() == _reference_quickxorhash(data)
+
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    assert quickxorhash_file(str(path), chunk_size=chunk_size) == _reference_quickxorhash(data)
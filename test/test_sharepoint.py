@@ -0,0 +1,228 @@
+import asyncio
+import os
+from app.core.config import settings
+from app.api.endpoints import sharepoint
+from app.utils.graph_client import graph_http
+from app.utils.msal_token_cache import msal_token_cache
+from app.utils.sharepoint_cache import folder_id_cache, site_drive_cache
+from bench_sharepoint import CLIENT_INFO, TENANT_INFO, RedirectSession
+from mock_graph_server import MockGraphServer
+
+
+def _run_against_mock(scenario):
+    """启动模拟 Graph 服务，把 sharepoint 接口指向它后执行 scenario(server)"""
+    async def main():
+        server = MockGraphServer()
+        base_url = await server.start()
+        graph_api_base, http_client = settings.GRAPH_API_BASE, msal_token_cache.http_client
+        settings.GRAPH_API_BASE = server.graph_base
+        msal_token_cache.http_client = RedirectSession(base_url)
+        try:
+            return await scenario(server)
+        finally:
+            settings.GRAPH_API_BASE, msal_token_cache.http_client = graph_api_base, http_client
+            # 缓存的 msal 应用绑定了本次的模拟服务地址
+            msal_token_cache.invalidate(TENANT_INFO["tenant_id"], CLIENT_INFO["client_id"])
+            await graph_http.close()
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def test_move_404_invalidates_site_only_when_drive_is_gone():
+    """
+    测试单个移动返回 404 时，只有文档库本身不存在才使站点缓存失效，文件不存在时保留缓存
+    """
+    site_name = "move-404"
+
+    def move(file_id):
+        return sharepoint.move_file_sharepoint(sharepoint.MoveSharepointFileRequest(
+            client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+            move_info={"file_id": file_id, "site_name": site_name, "target_folder_path": "archive"}))
+
+    async def scenario(server):
+        missing_file = await move("missing")
+        after_missing_file = site_drive_cache.get(TENANT_INFO["tenant_name"], site_name)
+        server._drives.clear()
+        missing_drive = await move("missing")
+        after_missing_drive = site_drive_cache.get(TENANT_INFO["tenant_name"], site_name)
+        return missing_file, after_missing_file, missing_drive, after_missing_drive
+
+    missing_file, after_missing_file, missing_drive, after_missing_drive = _run_against_mock(scenario)
+    assert not missing_file.success and after_missing_file is not None
+    assert not missing_drive.success and after_missing_drive is None
+
+
+def test_bulk_move_reports_failed_folder_lookup_per_item(tmp_path, monkeypatch):
+    """
+    测试批量移动中某个目标文件夹解析抛出异常时，只有移动到该文件夹的文件失败，其它文件正常移动
+    """
+    site_name = "bulk-folder-error"
+    ensure_path_exists = sharepoint.ensure_path_exists
+
+    async def failing_ensure_path_exists(drive_id, access_token, folder_path):
+        if folder_path == "broken":
+            raise RuntimeError("连接被重置")
+        return await ensure_path_exists(drive_id, access_token, folder_path)
+
+    async def scenario(server):
+        file_ids = []
+        for index in range(3):
+            path = tmp_path / f"statement_{index}.pdf"
+            path.write_bytes(b"statement %d" % index)
+            uploaded = await sharepoint.upload_file_to_sharepoint(sharepoint.UploadSharepointFileRequest(
+                client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+                upload_info={"site_name": site_name, "folder_path": "staging", "local_path": str(path)}))
+            file_ids.append(uploaded.file_id)
+
+        monkeypatch.setattr(sharepoint, "ensure_path_exists", failing_ensure_path_exists)
+        return await sharepoint.move_files_sharepoint_bulk(sharepoint.BulkMoveSharepointFileRequest(
+            client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+            move_items=[{"file_id": file_id, "site_name": site_name, "target_folder_path": folder}
+                        for file_id, folder in zip(file_ids, ["archive", "broken", "archive"])]))
+
+    response = _run_against_mock(scenario)
+    assert (response.total, response.succeeded, response.failed) == (3, 2, 1)
+    assert [result.success for result in response.results] == [True, False, True]
+    assert "连接被重置" in response.results[1].message
+
+
+def test_upload_session_without_upload_url_fails(tmp_path, monkeypatch):
+    """
+    测试创建上传会话的响应中没有 uploadUrl 时返回上传失败，而不是抛出异常
+    """
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(b"statement" * 100)
+    monkeypatch.setattr(settings, "SHAREPOINT_UPLOAD_SESSION_THRESHOLD", 100)
+
+    async def scenario(server):
+        server._create_upload_session = lambda *args, **kwargs: (200, {}, {})
+        return await sharepoint.upload_file_to_sharepoint(sharepoint.UploadSharepointFileRequest(
+            client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+            upload_info={"site_name": "session-without-url", "folder_path": "staging", "local_path": str(path)}))
+
+    response = _run_against_mock(scenario)
+    assert not response.success and "uploadUrl" in response.message
+    assert response.upload_mode == "session" and response.uploaded_bytes == 0
+
+
+def test_revoked_token_is_renewed_for_every_header_set(tmp_path):
+    """
+    测试令牌在过期前被撤销时，上传流程中各自构造的请求头（查找文件夹、上传内容）都换成新令牌，只重新获取一次
+    """
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(b"statement")
+
+    async def scenario(server):
+        revoked = await msal_token_cache.get_token(
+            TENANT_INFO["tenant_id"], CLIENT_INFO["client_id"], CLIENT_INFO["client_secret"])
+        server.revoked_tokens.add(revoked)
+        renewals = msal_token_cache.stats()["renewals"]
+        response = await sharepoint.upload_file_to_sharepoint(sharepoint.UploadSharepointFileRequest(
+            client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+            upload_info={"site_name": "revoked-token", "folder_path": "staging/2026", "local_path": str(path)}))
+        return response, msal_token_cache.stats()["renewals"] - renewals, server.stats()
+
+    response, renewals, stats = _run_against_mock(scenario)
+    assert response.success, response.message
+    assert renewals == 1
+    assert stats["put_content"] == 1 and stats["unauthorized"] >= 2
+
+
+def test_folder_cache_resolves_prefixes_and_recovers_from_deleted_folders():
+    """
+    测试文件夹ID缓存：已知路径不访问 Graph，只创建缺失的后缀，缓存的文件夹被删除(404)时清空缓存后重新解析
+    """
+    async def scenario(server):
+        access_token = await msal_token_cache.get_token(
+            TENANT_INFO["tenant_id"], CLIENT_INFO["client_id"], CLIENT_INFO["client_secret"])
+        success, (_, drive_id) = await sharepoint.resolve_site_drive(
+            TENANT_INFO["tenant_name"], "folder-cache", {"Authorization": f"Bearer {access_token}"})
+        assert success
+        calls = []
+
+        async def ensure(path):
+            before = server.stats()
+            success, folder_id = await sharepoint.ensure_path_exists(drive_id, access_token, path)
+            after = server.stats()
+            calls.append({name: after.get(name, 0) - before.get(name, 0)
+                          for name in ("get_by_path", "get_root", "create_folder")})
+            return success, folder_id
+
+        first = await ensure("reports/2026")
+        again = await ensure("/Reports/2026/")
+        await ensure("reports/2026/q3/hk")
+        # 删除 reports/2026/q3 及其子文件夹，缓存中仍保留它们的ID
+        deleted = {item_id for item_id, item in server._items.items()
+                   if server._path_of(item).startswith("reports/2026/q3")}
+        for item_id in deleted:
+            server._items.pop(item_id)
+        server._children = {key: value for key, value in server._children.items() if value not in deleted}
+        invalidations = folder_id_cache.stats()["invalidations"]
+        recreated = await ensure("reports/2026/q3/hk/daily")
+        paths = {server._path_of(item) for item in server._items.values() if item["folder"]}
+        return first, again, recreated, calls, folder_id_cache.stats()["invalidations"] - invalidations, paths
+
+    first, again, recreated, calls, invalidations, paths = _run_against_mock(scenario)
+    assert first[0] and again == first and recreated[0]
+    assert calls == [
+        # 完整路径 404 -> 根目录 -> reports 404 -> 创建 reports、2026
+        {"get_by_path": 2, "get_root": 1, "create_folder": 2},
+        # 已知路径（大小写和首尾斜杠不同）不访问 Graph
+        {"get_by_path": 0, "get_root": 0, "create_folder": 0},
+        # 缓存前缀 reports/2026 之后：完整路径 404 -> q3 404 -> 只创建 q3、hk
+        {"get_by_path": 2, "get_root": 0, "create_folder": 2},
+        # 在已删除的 hk 下创建返回 404，清空缓存后从根目录重新解析，只重建 q3、hk、daily
+        {"get_by_path": 5, "get_root": 1, "create_folder": 4},
+    ]
+    assert invalidations == 1
+    assert {"reports/2026/q3/hk/daily"} <= paths
+
+
+def test_interrupted_session_upload_resumes_and_rejected_session_is_dropped(tmp_path, monkeypatch):
+    """
+    测试分块上传中断（重试次数用完）后保留会话，下次上传同一文件从中断处继续；
+    分块被拒绝（不可重试的状态码）时丢弃会话
+    """
+    monkeypatch.setattr(settings, "SHAREPOINT_UPLOAD_SESSION_THRESHOLD", 100)
+    monkeypatch.setattr(settings, "SHAREPOINT_UPLOAD_CHUNK_SIZE", sharepoint.UPLOAD_CHUNK_UNIT)
+    monkeypatch.setattr(settings, "SHAREPOINT_UPLOAD_CHUNK_RETRIES", 0)
+    resumable, rejected = tmp_path / "resumable.pdf", tmp_path / "rejected.pdf"
+    data = os.urandom(sharepoint.UPLOAD_CHUNK_UNIT * 3 + 100)
+    resumable.write_bytes(data)
+    rejected.write_bytes(data)
+
+    def upload(path):
+        return sharepoint.upload_file_to_sharepoint(sharepoint.UploadSharepointFileRequest(
+            client_info=CLIENT_INFO, tenant_info=TENANT_INFO,
+            upload_info={"site_name": "session-resume", "folder_path": "staging", "local_path": str(path)}))
+
+    async def scenario(server):
+        upload_chunk = server._upload_chunk
+        failures = {"status": 500}
+
+        def flaky_upload_chunk(session_id, headers, body):
+            # 每个会话接收两个分块后开始失败
+            if server._sessions[session_id]["received"] >= 2 * sharepoint.UPLOAD_CHUNK_UNIT and failures["status"]:
+                return failures["status"], {}, {"error": {"code": "generalException", "message": "注入的失败"}}
+            return upload_chunk(session_id, headers, body)
+
+        server._upload_chunk = flaky_upload_chunk
+        interrupted = await upload(resumable)
+        sessions_after_interruption = len(sharepoint._upload_sessions)
+        failures["status"] = None
+        resumed = await upload(resumable)
+
+        failures["status"] = 400
+        dropped = await upload(rejected)
+        return interrupted, sessions_after_interruption, resumed, dropped, dict(sharepoint._upload_sessions), \
+            server.stats()
+
+    interrupted, sessions_after_interruption, resumed, dropped, sessions, stats = _run_against_mock(scenario)
+    assert not interrupted.success and interrupted.uploaded_bytes == 2 * sharepoint.UPLOAD_CHUNK_UNIT
+    assert sessions_after_interruption == 1
+    assert resumed.success and resumed.resumed
+    assert resumed.uploaded_bytes == resumed.total_bytes == len(data) and resumed.chunk_count == 2
+    assert not dropped.success and sessions == {}
+    # 续传没有创建新会话：两个文件各创建一次
+    assert stats["create_upload_session"] == 2
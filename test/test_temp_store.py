@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.utils.temp_store import TempQuotaExceeded, TempStore
+
+
+def _make_task(root, name, size):
+    task_dir = root / name
+    task_dir.mkdir()
+    (task_dir / "file.bin").write_bytes(b"x" * size)
+    return task_dir
+
+
+def test_evicts_least_recently_accessed_completed_task(tmp_path):
+    store = TempStore(tmp_path, quota_bytes=250, retry_after=5)
+
+    async def run():
+        for name in ("a", "b"):
+            async with store.track(tmp_path / name):
+                _make_task(tmp_path, name, 100)
+        store.touch(tmp_path / "a" / "file.bin")
+        async with store.track(tmp_path / "c"):
+            _make_task(tmp_path, "c", 100)
+
+    asyncio.run(run())
+    assert (tmp_path / "a").exists() and (tmp_path / "c").exists()
+    assert not (tmp_path / "b").exists()
+    assert store.stats()["evicted"] == 1
+
+
+def test_rejects_when_in_flight_work_fills_quota(tmp_path):
+    store = TempStore(tmp_path, quota_bytes=100, retry_after=5)
+    store.begin(tmp_path / "a")
+    store.record(tmp_path / "a", 150)
+    with pytest.raises(TempQuotaExceeded) as exc_info:
+        store.begin(tmp_path / "b")
+    assert exc_info.value.retry_after == 5
+
+
+def test_overlapping_requests_keep_task_in_flight(tmp_path):
+    store = TempStore(tmp_path, quota_bytes=150, retry_after=5)
+    states = []
+
+    async def run():
+        second_started = asyncio.Event()
+        first_done = asyncio.Event()
+
+        async def first():
+            async with store.track(tmp_path / "shared"):
+                _make_task(tmp_path, "shared", 100)
+                await second_started.wait()
+            first_done.set()
+
+        async def second():
+            async with store.track(tmp_path / "shared"):
+                second_started.set()
+                await first_done.wait()
+                states.append(store.stats()["in_flight_tasks"])
+                # 其它已完成任务超出配额时，也不能淘汰仍在处理中的共享目录
+                async with store.track(tmp_path / "other"):
+                    _make_task(tmp_path, "other", 100)
+                assert (tmp_path / "shared").exists()
+            states.append(store.stats()["in_flight_tasks"])
+
+        await asyncio.gather(first(), second())
+
+    asyncio.run(run())
+    assert states == [1, 0]
+    assert (tmp_path / "other").exists()
+
+
+def test_promotes_final_files_from_hot_tier(tmp_path):
+    store = TempStore(tmp_path / "temp", quota_bytes=10 ** 6, retry_after=5,
+                      hot_dir=tmp_path / "hot", hot_max_bytes=100)
+    task_dir = tmp_path / "temp" / "task"
+
+    async def run():
+        async with store.track(task_dir) as request_key:
+            split_dir = store.stage_dir(task_dir, request_key, "split", expected_bytes=50)
+            spilled_dir = store.stage_dir(task_dir, request_key, "unlocked", expected_bytes=80)
+            (split_dir / "final.pdf").write_bytes(b"final")
+            (split_dir / "scratch.pdf").write_bytes(b"scratch")
+            promoted = await store.promote(task_dir, request_key, [str(split_dir / "final.pdf")])
+        return request_key, split_dir, spilled_dir, promoted
+
+    request_key, split_dir, spilled_dir, promoted = asyncio.run(run())
+    assert split_dir == tmp_path / "hot" / "task" / request_key / "split"
+    assert spilled_dir == task_dir / "unlocked"
+    assert promoted == {str(split_dir / "final.pdf"): str(task_dir / "split" / "final.pdf")}
+    assert (task_dir / "split" / "final.pdf").read_bytes() == b"final"
+    assert not (tmp_path / "hot" / "task").exists()
+
+
+def test_concurrent_requests_use_separate_hot_dirs(tmp_path):
+    store = TempStore(tmp_path / "temp", quota_bytes=10 ** 6, retry_after=5,
+                      hot_dir=tmp_path / "hot", hot_max_bytes=100)
+    task_dir = tmp_path / "temp" / "task"
+
+    async def run():
+        first_done = asyncio.Event()
+        staged = []
+
+        async def first():
+            async with store.track(task_dir) as request_key:
+                (store.stage_dir(task_dir, request_key, "split", 10) / "a.pdf").write_bytes(b"a")
+            first_done.set()
+
+        async def second():
+            async with store.track(task_dir) as request_key:
+                path = store.stage_dir(task_dir, request_key, "split", 10) / "b.pdf"
+                path.write_bytes(b"b")
+                await first_done.wait()
+                # 另一个请求结束时不能删除本请求仍在使用的中间文件
+                staged.append(path.exists())
+
+        await asyncio.gather(second(), first())
+        return staged
+
+    assert asyncio.run(run()) == [True]
+    assert not (tmp_path / "hot" / "task").exists()
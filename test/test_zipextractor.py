@@ -0,0 +1,61 @@
+import io
+import zipfile
+from app.core.config import settings
+from app.utils.zipextractor import extract_zip
+
+
+def _zip_bytes(files: dict, compression=zipfile.ZIP_STORED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_extract_zip_expands_nested_archives(tmp_path):
+    """
+    测试zip-in-zip会在一次解压中逐层展开，并返回来源链
+    """
+    inner = _zip_bytes({"statement_a.pdf": b"%PDF-a"})
+    outer_path = tmp_path / "outer.zip"
+    outer_path.write_bytes(_zip_bytes({"entity_a.zip": inner, "summary.xlsx": b"xlsx"}))
+
+    result = extract_zip(str(outer_path), str(tmp_path / "extracted"), max_depth=2)
+
+    assert result["success"]
+    files = {f["unzip_filename"]: f for f in result["extracted_files"]}
+    # xlsx 虽然是zip格式，但不应被当作嵌套压缩包展开
+    assert set(files) == {"statement_a.pdf", "summary.xlsx"}
+    assert files["statement_a.pdf"]["unzip_lineage"] == ["outer.zip", "entity_a.zip"]
+    assert files["summary.xlsx"]["unzip_lineage"] == ["outer.zip"]
+
+
+def test_extract_zip_respects_max_depth(tmp_path):
+    """
+    测试 max_depth=0 时保持原有行为，内层压缩包作为普通文件返回
+    """
+    inner = _zip_bytes({"statement_a.pdf": b"%PDF-a"})
+    outer_path = tmp_path / "outer.zip"
+    outer_path.write_bytes(_zip_bytes({"entity_a.zip": inner}))
+
+    result = extract_zip(str(outer_path), str(tmp_path / "extracted"), max_depth=0)
+
+    assert result["success"]
+    assert [f["unzip_filename"] for f in result["extracted_files"]] == ["entity_a.zip"]
+
+
+def test_extract_zip_stops_expanding_past_total_size(tmp_path, monkeypatch):
+    """
+    测试展开嵌套压缩包会超过总大小上限时保留内层压缩包，不再逐层放大
+    """
+    monkeypatch.setattr(settings, "UNZIP_MAX_TOTAL_BYTES", 50000)
+    outer_path = tmp_path / "outer.zip"
+    outer_path.write_bytes(_zip_bytes({"bomb.zip": _zip_bytes({"zeros.bin": b"\0" * 100000}, zipfile.ZIP_DEFLATED),
+                                       "small.zip": _zip_bytes({"a.txt": b"a"})}))
+
+    result = extract_zip(str(outer_path), str(tmp_path / "extracted"), max_depth=3)
+
+    assert result["success"]
+    files = {f["unzip_filename"]: f for f in result["extracted_files"]}
+    assert set(files) == {"bomb.zip", "a.txt"}
+    assert files["a.txt"]["unzip_lineage"] == ["outer.zip", "small.zip"]